@@ -50,10 +50,21 @@ class Command(BaseCommand):
                     call_command('gerar_tarefas_dia')
                     call_command('gerar_checklists', '--atualizar-atrasados')
 
-                    from financeiro.services import gerar_contas_pagar_todas_empresas
+                    from financeiro.services import (
+                        atualizar_status_receber,
+                        gerar_contas_pagar_todas_empresas,
+                        gerar_contas_receber_todas_empresas,
+                    )
                     criados = gerar_contas_pagar_todas_empresas()
                     if criados:
                         self.stdout.write(f'  [{tenant.nome}] {criados} conta(s) a pagar gerada(s).')
+                    criados = gerar_contas_receber_todas_empresas()
+                    if criados:
+                        self.stdout.write(f'  [{tenant.nome}] {criados} conta(s) a receber gerada(s).')
+
+                    atrasados = atualizar_status_receber()
+                    if atrasados:
+                        self.stdout.write(f'  [{tenant.nome}] {atrasados} item(ns) a receber marcado(s) como atrasado(s).')
 
                 self._ultimo_dia_gerado[tenant.schema_name] = hoje
                 self.stdout.write(self.style.SUCCESS(f'  [{tenant.nome}] Tarefas do dia {hoje} geradas.'))
@@ -102,3 +113,19 @@ class Command(BaseCommand):
         elif tipo == 'cobranca_externos':
             resultado = processar_cobrancas_externas()
             self.stdout.write(f'  Cobranças externas: {resultado["enviados"]} enviados, {resultado["erros"]} erros')
+
+        elif tipo == 'alertas_financeiros':
+            from financeiro.alertas import avaliar_alertas
+            resultado = avaliar_alertas()
+            self.stdout.write(
+                f'  Alertas financeiros: {resultado["ocorrencias"]} novos, '
+                f'{resultado["enviados"]} enviados, {resultado["erros"]} erros'
+            )
+
+        elif tipo == 'lembrete_receber':
+            from financeiro.lembretes import enviar_lembretes_receber
+            resultado = enviar_lembretes_receber()
+            self.stdout.write(
+                f'  Lembretes contas a receber: {resultado["itens"]} itens, '
+                f'{resultado["enviados"]} enviados, {resultado["erros"]} erros'
+            )
@@ -129,6 +129,14 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache compartilhado entre processos (web, scheduler e comandos)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', str(BASE_DIR / '.cache')),
+    }
+}
+
 # Auth
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
@@ -144,6 +152,12 @@ WAPI_URL = os.getenv('WAPI_URL', '')
 WAPI_TOKEN = os.getenv('WAPI_TOKEN', '')
 WAPI_INSTANCE = os.getenv('WAPI_INSTANCE', '')
 
+# Financeiro: meses à frente gerados para contas a pagar/receber recorrentes
+FINANCEIRO_HORIZONTE_MESES = int(os.getenv('FINANCEIRO_HORIZONTE_MESES', '12'))
+
+# Mercado Pago: base da API (trocar por um servidor local para testes)
+MERCADOPAGO_API_BASE = os.getenv('MERCADOPAGO_API_BASE', 'https://api.mercadopago.com')
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
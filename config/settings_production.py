@@ -100,6 +100,20 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # Default primary key
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache compartilhado entre processos (web, scheduler e comandos)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', str(BASE_DIR / '.cache')),
+    }
+}
+
+# Financeiro: meses à frente gerados para contas a pagar/receber recorrentes
+FINANCEIRO_HORIZONTE_MESES = int(os.getenv('FINANCEIRO_HORIZONTE_MESES', '12'))
+
+# Mercado Pago: base da API (trocar por um servidor local para testes)
+MERCADOPAGO_API_BASE = os.getenv('MERCADOPAGO_API_BASE', 'https://api.mercadopago.com')
+
 # DRF
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import MetaEmpresa, CategoriaLancamento, Lancamento, ConfigMercadoPago, ContaBancaria, PrestacaoConta, ContaPagar, ContaPagarItem
+from .models import MetaEmpresa, CategoriaLancamento, Lancamento, ConfigMercadoPago, ContaBancaria, PrestacaoConta, ContaPagar, ContaPagarItem, FechamentoMes, LayoutExtrato, ExecucaoSyncMP, NotificacaoMP
 
 
 @admin.register(MetaEmpresa)
@@ -32,9 +32,9 @@ class MetaEmpresaAdmin(admin.ModelAdmin):
 
 @admin.register(CategoriaLancamento)
 class CategoriaLancamentoAdmin(admin.ModelAdmin):
-    list_display = ['nome', 'tipo', 'empresa', 'cor_badge', 'ativo', 'ordem']
-    list_filter = ['tipo', 'empresa', 'ativo']
-    list_editable = ['ordem', 'ativo']
+    list_display = ['nome', 'tipo', 'empresa', 'linha_dre', 'cor_badge', 'ativo', 'ordem']
+    list_filter = ['tipo', 'empresa', 'linha_dre', 'ativo']
+    list_editable = ['linha_dre', 'ordem', 'ativo']
 
     def cor_badge(self, obj):
         return format_html(
@@ -74,13 +74,26 @@ class LancamentoAdmin(admin.ModelAdmin):
         )
     valor_fmt.short_description = 'Valor'
 
+    def _periodo_fechado(self, obj):
+        return obj is not None and obj.data and FechamentoMes.esta_fechado(obj.empresa_id, obj.data)
+
+    def has_change_permission(self, request, obj=None):
+        if self._periodo_fechado(obj):
+            return False
+        return super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        if self._periodo_fechado(obj):
+            return False
+        return super().has_delete_permission(request, obj)
+
 
 @admin.register(ConfigMercadoPago)
 class ConfigMercadoPagoAdmin(admin.ModelAdmin):
     list_display = ['empresa', 'ativo_badge', 'token_mascarado', 'ultima_sync_fmt']
     list_filter = ['ativo']
     list_editable = []
-    readonly_fields = ['ultima_sync', 'criado_em', 'atualizado_em']
+    readonly_fields = ['ultima_sync', 'webhook_token', 'criado_em', 'atualizado_em']
     fieldsets = (
         ('Empresa', {
             'fields': ('empresa',),
@@ -90,7 +103,7 @@ class ConfigMercadoPagoAdmin(admin.ModelAdmin):
             'description': 'Obtenha o Access Token em: Mercado Pago > Seu negócio > Configurações > Gestão e Administração > Credenciais',
         }),
         ('Status', {
-            'fields': ('ativo', 'ultima_sync', 'criado_em', 'atualizado_em'),
+            'fields': ('ativo', 'ultima_sync', 'webhook_token', 'criado_em', 'atualizado_em'),
         }),
     )
 
@@ -177,3 +190,49 @@ class ContaPagarItemAdmin(admin.ModelAdmin):
             return format_html('<span style="color:#28a745; font-weight:bold;">Pago</span>')
         return format_html('<span style="color:#dc3545;">Pendente</span>')
     pago_badge.short_description = 'Status'
+
+
+@admin.register(FechamentoMes)
+class FechamentoMesAdmin(admin.ModelAdmin):
+    list_display = ['empresa', 'mes_ano', 'fechado_em', 'fechado_por']
+    list_filter = ['empresa', 'ano']
+    readonly_fields = ['empresa', 'mes', 'ano', 'snapshot', 'fechado_em', 'fechado_por']
+
+    def mes_ano(self, obj):
+        return f'{obj.mes:02d}/{obj.ano}'
+    mes_ano.short_description = 'Período'
+
+    def has_add_permission(self, request):
+        # Fechamento é feito pelo relatório financeiro (calcula o snapshot)
+        return False
+
+
+@admin.register(LayoutExtrato)
+class LayoutExtratoAdmin(admin.ModelAdmin):
+    list_display = ['conta', 'header_resumo', 'corrigido', 'usos', 'atualizado_em']
+    list_filter = ['conta', 'corrigido']
+    readonly_fields = ['assinatura', 'header', 'usos', 'criado_em', 'atualizado_em']
+
+    def header_resumo(self, obj):
+        return ' | '.join(obj.header[:5])
+    header_resumo.short_description = 'Header'
+
+
+@admin.register(ExecucaoSyncMP)
+class ExecucaoSyncMPAdmin(admin.ModelAdmin):
+    list_display = ['config', 'iniciado_em', 'duracao_fmt', 'paginas', 'criados', 'taxas', 'estornos', 'status']
+    list_filter = ['status', 'incremental', 'config']
+    search_fields = ['lote']
+    readonly_fields = [f.name for f in ExecucaoSyncMP._meta.fields]
+
+    def duracao_fmt(self, obj):
+        return f'{obj.duracao:.1f}s'
+    duracao_fmt.short_description = 'Duração'
+
+
+@admin.register(NotificacaoMP)
+class NotificacaoMPAdmin(admin.ModelAdmin):
+    list_display = ['payment_id', 'config', 'acao', 'status', 'tentativas', 'recebido_em', 'processado_em']
+    list_filter = ['status', 'config']
+    search_fields = ['payment_id']
+    readonly_fields = [f.name for f in NotificacaoMP._meta.fields]
@@ -0,0 +1,291 @@
+"""
+Avaliação automática dos alertas financeiros (`AlertaFinanceiro`).
+
+Todos os alertas ativos do tenant são avaliados de uma vez, com uma consulta
+por tipo de regra para todas as empresas: itens a pagar/receber numa janela
+de datas (a maior antecedência entre os alertas, refinada por alerta em
+memória), saldo das contas agregado por conta e realizado do mês agregado
+por empresa.
+
+O que já foi avisado não se repete: itens de contas uma vez por alerta e
+saldo/meta uma vez por dia, conferidos contra `HistoricoAlerta` numa
+consulta. Só conta como avisado o registro com alguma entrega: sem envio
+(`enviar=False`, WhatsApp desativado, sem telefone) o histórico fica como
+erro e a ocorrência volta na próxima avaliação. Cada destinatário recebe uma única mensagem com todos os seus
+alertas, e as mensagens saem em lote (`enviar_mensagens_em_lote`).
+"""
+import calendar
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .formatacao import formatar_brl
+from .models import (
+    AlertaFinanceiro,
+    ContaBancaria,
+    ContaPagarItem,
+    ContaReceberItem,
+    HistoricoAlerta,
+    Lancamento,
+    MetaEmpresa,
+)
+from .projecao import anotar_saldo
+
+# Itens listados por alerta numa mensagem (o resto vira "e mais N")
+LIMITE_ITENS_MENSAGEM = 10
+
+# tipo -> (modelo, campo da conta, filtro de item em aberto, vencendo?)
+REGRAS_ITENS = {
+    'conta_pagar_vencendo': (ContaPagarItem, 'conta_pagar', Q(pago=False), True),
+    'conta_pagar_atrasada': (ContaPagarItem, 'conta_pagar', Q(pago=False), False),
+    'conta_receber_vencendo': (ContaReceberItem, 'conta_receber', Q(recebido=False) & ~Q(status='cancelado'), True),
+    'conta_receber_atrasada': (ContaReceberItem, 'conta_receber', Q(recebido=False) & ~Q(status='cancelado'), False),
+}
+
+
+@dataclass
+class Ocorrencia:
+    alerta: AlertaFinanceiro
+    texto: str
+    conta_pagar_item_id: int | None = None
+    conta_receber_item_id: int | None = None
+
+
+# =====================================================
+# REGRAS
+# =====================================================
+
+def _ocorrencias_itens(tipo, alertas, hoje):
+    """Itens em aberto de todas as empresas dos alertas do tipo, numa consulta."""
+    modelo, campo_conta, em_aberto, vencendo = REGRAS_ITENS[tipo]
+    if vencendo:
+        janela = Q(data_vencimento__range=(hoje, hoje + timedelta(days=max(a.dias_antecedencia for a in alertas))))
+    else:
+        janela = Q(data_vencimento__lt=hoje)
+    itens = modelo.objects.filter(
+        em_aberto, janela, **{f'{campo_conta}__empresa_id__in': {a.empresa_id for a in alertas}},
+    ).values(
+        'id', 'valor', 'data_vencimento',
+        empresa_id=F(f'{campo_conta}__empresa_id'), descricao=F(f'{campo_conta}__descricao'),
+    ).order_by('data_vencimento')
+
+    por_empresa = defaultdict(list)
+    for item in itens:
+        por_empresa[item['empresa_id']].append(item)
+
+    campo_item = 'conta_pagar_item_id' if modelo is ContaPagarItem else 'conta_receber_item_id'
+    ocorrencias = []
+    for alerta in alertas:
+        limite = hoje + timedelta(days=alerta.dias_antecedencia)
+        for item in por_empresa[alerta.empresa_id]:
+            if vencendo and item['data_vencimento'] > limite:
+                continue
+            if vencendo:
+                quando = f'vence {item["data_vencimento"].strftime("%d/%m")}'
+            else:
+                quando = f'{(hoje - item["data_vencimento"]).days} dias de atraso'
+            ocorrencias.append(Ocorrencia(
+                alerta, f'{item["descricao"]} - {formatar_brl(item["valor"])} ({quando})', **{campo_item: item['id']},
+            ))
+    return ocorrencias
+
+
+def _ocorrencias_saldo(alertas):
+    """Contas com saldo abaixo do limite do alerta (0 sem limite), saldo agregado numa consulta."""
+    contas = anotar_saldo(ContaBancaria.objects.filter(
+        empresa_id__in={a.empresa_id for a in alertas}, ativo=True,
+    )).values('empresa_id', 'nome', 'saldo_atual')
+    por_empresa = defaultdict(list)
+    for conta in contas:
+        por_empresa[conta['empresa_id']].append(conta)
+
+    ocorrencias = []
+    for alerta in alertas:
+        limite = alerta.valor_limite if alerta.valor_limite is not None else Decimal('0')
+        for conta in por_empresa[alerta.empresa_id]:
+            if conta['saldo_atual'] < limite:
+                ocorrencias.append(Ocorrencia(
+                    alerta,
+                    f'{conta["nome"]}: saldo {formatar_brl(conta["saldo_atual"])} (limite {formatar_brl(limite)})',
+                ))
+    return ocorrencias
+
+
+def _dias_uteis_ate(dia):
+    """Dias de segunda a sexta do mês de `dia` até ele (inclusive)."""
+    primeiro = calendar.monthrange(dia.year, dia.month)[0]
+    return sum(1 for d in range(dia.day) if (primeiro + d) % 7 < 5)
+
+
+def _ocorrencias_meta(alertas, hoje):
+    """
+    Meta mensal abaixo do ritmo: realizado do mês até ontem (entradas -
+    saídas, agregado por empresa numa consulta) menor que a meta diária
+    vezes os dias úteis decorridos.
+    """
+    ontem = hoje - timedelta(days=1)
+    empresas = {a.empresa_id for a in alertas}
+    metas = {
+        m.empresa_id: m
+        for m in MetaEmpresa.objects.filter(empresa_id__in=empresas, mes=ontem.month, ano=ontem.year)
+    }
+    realizados = {
+        r['empresa_id']: (r['entradas'] or 0) - (r['saidas'] or 0)
+        for r in Lancamento.objects.filter(
+            empresa_id__in=metas.keys(), data__range=(ontem.replace(day=1), ontem),
+        ).values('empresa_id').annotate(
+            entradas=Sum('valor', filter=Q(tipo='entrada')),
+            saidas=Sum('valor', filter=Q(tipo='saida')),
+        )
+    }
+
+    ocorrencias = []
+    for alerta in alertas:
+        meta = metas.get(alerta.empresa_id)
+        if not meta or meta.valor_meta <= 0:
+            continue
+        esperado = meta.meta_diaria * min(_dias_uteis_ate(ontem), meta.dias_uteis)
+        realizado = realizados.get(alerta.empresa_id, Decimal('0'))
+        if esperado > 0 and realizado < esperado:
+            ocorrencias.append(Ocorrencia(
+                alerta,
+                f'Meta {meta.mes:02d}/{meta.ano}: realizado {formatar_brl(realizado)} de {formatar_brl(esperado)} '
+                f'esperados até {ontem.strftime("%d/%m")} ({int(realizado / esperado * 100)}%)',
+            ))
+    return ocorrencias
+
+
+# =====================================================
+# AVALIAÇÃO E ENVIO
+# =====================================================
+
+def _ja_avisadas(ocorrencias, hoje):
+    """Remove ocorrências já avisadas com sucesso (uma consulta ao histórico)."""
+    if not ocorrencias:
+        return []
+    alertas_ids = {o.alerta.id for o in ocorrencias}
+    pagar_ids = {o.conta_pagar_item_id for o in ocorrencias if o.conta_pagar_item_id}
+    receber_ids = {o.conta_receber_item_id for o in ocorrencias if o.conta_receber_item_id}
+    avisados = set()
+    for alerta_id, pagar_id, receber_id in HistoricoAlerta.objects.filter(
+        Q(conta_pagar_item_id__in=pagar_ids) | Q(conta_receber_item_id__in=receber_ids)
+        | Q(conta_pagar_item__isnull=True, conta_receber_item__isnull=True, enviado_em__date=hoje)
+        & ~Q(mensagem__startswith='[TESTE]'),
+        alerta_id__in=alertas_ids, sucesso=True,
+    ).values_list('alerta_id', 'conta_pagar_item_id', 'conta_receber_item_id'):
+        avisados.add((alerta_id, pagar_id, receber_id))
+    return [
+        o for o in ocorrencias
+        if (o.alerta.id, o.conta_pagar_item_id, o.conta_receber_item_id) not in avisados
+    ]
+
+
+def _bloco(alerta, ocorrencias):
+    linhas = [f'*{alerta.get_tipo_display()} - {alerta.empresa.nome}*']
+    linhas += [f'• {o.texto}' for o in ocorrencias[:LIMITE_ITENS_MENSAGEM]]
+    if len(ocorrencias) > LIMITE_ITENS_MENSAGEM:
+        linhas.append(f'... e mais {len(ocorrencias) - LIMITE_ITENS_MENSAGEM}')
+    return '\n'.join(linhas)
+
+
+def _motivo_sem_envio(alerta, enviar):
+    """Erro do histórico quando o alerta não teve nenhuma tentativa de envio."""
+    if not enviar:
+        return 'Avaliado sem envio'
+    if not alerta.notificar_whatsapp:
+        return 'Notificação por WhatsApp desativada'
+    return 'Nenhum destinatário com telefone'
+
+
+def avaliar_alertas(hoje=None, enviar=True):
+    """
+    Avalia todos os alertas ativos do tenant atual, envia os novos por
+    WhatsApp (uma mensagem por destinatário) e registra o histórico.
+    Retorna dict com alertas, ocorrencias, mensagens, enviados e erros.
+    """
+    from notifications.wapi import enviar_mensagens_em_lote
+
+    hoje = hoje or timezone.localdate()
+    alertas = list(
+        AlertaFinanceiro.objects.filter(ativo=True).select_related('empresa').prefetch_related('destinatarios')
+    )
+    resultado = {'alertas': len(alertas), 'ocorrencias': 0, 'mensagens': 0, 'enviados': 0, 'erros': 0}
+
+    por_tipo = defaultdict(list)
+    for alerta in alertas:
+        por_tipo[alerta.tipo].append(alerta)
+    ocorrencias = []
+    for tipo, do_tipo in por_tipo.items():
+        if tipo in REGRAS_ITENS:
+            ocorrencias += _ocorrencias_itens(tipo, do_tipo, hoje)
+        elif tipo == 'saldo_baixo':
+            ocorrencias += _ocorrencias_saldo(do_tipo)
+        elif tipo == 'meta_diaria':
+            ocorrencias += _ocorrencias_meta(do_tipo, hoje)
+    ocorrencias = _ja_avisadas(ocorrencias, hoje)
+    resultado['ocorrencias'] = len(ocorrencias)
+    if not ocorrencias:
+        return resultado
+
+    por_alerta = defaultdict(list)
+    for o in ocorrencias:
+        por_alerta[o.alerta].append(o)
+
+    # Uma mensagem por telefone, com os blocos de todos os alertas dele
+    blocos = defaultdict(list)
+    destinatarios = {}
+    for alerta, do_alerta in por_alerta.items():
+        if not (enviar and alerta.notificar_whatsapp):
+            continue
+        for pessoa in alerta.destinatarios.all():
+            if pessoa.telefone:
+                telefone = pessoa.telefone_formatado()
+                blocos[telefone].append((alerta, _bloco(alerta, do_alerta)))
+                destinatarios[telefone] = pessoa
+    envios = [
+        (telefone, '🔔 *Alertas Financeiros*\n\n' + '\n\n'.join(b for _, b in lista)
+         + '\n\n*Neuraxo - Mensagem Automática*')
+        for telefone, lista in blocos.items()
+    ]
+    resultados = enviar_mensagens_em_lote(envios)
+    resultado['mensagens'] = len(envios)
+
+    entregues = defaultdict(list)
+    falhas = defaultdict(list)
+    for (telefone, _), envio in zip(envios, resultados):
+        for alerta, _ in blocos[telefone]:
+            if envio['success']:
+                entregues[alerta].append(destinatarios[telefone])
+            else:
+                falhas[alerta].append(f'{destinatarios[telefone].nome}: {envio.get("error", "Erro desconhecido")}')
+        resultado['enviados' if envio['success'] else 'erros'] += 1
+
+    # Histórico: um registro por item (base da deduplicação) ou por alerta
+    historicos = []
+    for alerta, do_alerta in por_alerta.items():
+        # Só conta como avisado se alguém recebeu; sem entrega (ou sem tentativa) repete na próxima
+        sucesso = bool(entregues[alerta])
+        erro = '\n'.join(falhas[alerta])[:2000] or _motivo_sem_envio(alerta, enviar)
+        itens = [o for o in do_alerta if o.conta_pagar_item_id or o.conta_receber_item_id]
+        if itens:
+            historicos += [
+                (alerta, HistoricoAlerta(
+                    alerta=alerta, mensagem=o.texto, sucesso=sucesso, erro=erro,
+                    conta_pagar_item_id=o.conta_pagar_item_id, conta_receber_item_id=o.conta_receber_item_id,
+                )) for o in itens
+            ]
+        else:
+            historicos.append((alerta, HistoricoAlerta(
+                alerta=alerta, mensagem='\n'.join(o.texto for o in do_alerta), sucesso=sucesso, erro=erro,
+            )))
+    HistoricoAlerta.objects.bulk_create([h for _, h in historicos], batch_size=500)
+    Destinatario = HistoricoAlerta.enviado_para.through
+    Destinatario.objects.bulk_create([
+        Destinatario(historicoalerta_id=h.id, pessoa_id=pessoa.id)
+        for alerta, h in historicos for pessoa in entregues[alerta]
+    ], batch_size=1000, ignore_conflicts=True)
+    return resultado
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class FinanceiroConfig(AppConfig):
     name = 'financeiro'
+
+    def ready(self):
+        import financeiro.signals  # noqa: F401
@@ -0,0 +1,288 @@
+"""
+Arquivos de retorno CNAB (240 e 400) e baixa automática de contas a receber.
+
+O parser lê o arquivo linha a linha e fatia cada registro por posições
+fixas, pré-calculadas como `slice`. As liquidações são casadas com os
+`ContaReceberItem` em aberto por nosso número (conferindo vencimento e
+valor) e, sem nosso número cadastrado, por (valor, vencimento) quando há um
+único candidato. A baixa cria os lançamentos e atualiza os itens em lote,
+numa única transação.
+"""
+import io
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .dre import criar_lancamentos
+from .models import ContaReceberItem, FechamentoMes, Lancamento, TipoLancamento
+
+
+def _campos(posicoes):
+    """{'campo': (inicio, fim)} em posições 1-based do manual -> {'campo': slice}."""
+    return {campo: slice(inicio - 1, fim) for campo, (inicio, fim) in posicoes.items()}
+
+
+# CNAB 240 (FEBRABAN): título em dois segmentos do registro de detalhe (3).
+# T traz identificação e vencimento; U traz valores pagos e datas.
+CNAB240_REGISTRO = slice(7, 8)
+CNAB240_SEGMENTO = slice(13, 14)
+CNAB240_T = _campos({
+    'ocorrencia': (16, 17),
+    'nosso_numero': (38, 57),
+    'vencimento': (74, 81),
+    'valor_titulo': (82, 96),
+})
+CNAB240_U = _campos({
+    'ocorrencia': (16, 17),
+    'juros': (18, 32),
+    'desconto': (33, 47),
+    'valor_pago': (78, 92),
+    'data_ocorrencia': (138, 145),
+    'data_credito': (146, 153),
+})
+CNAB240_LIQUIDACAO = {'06', '17'}
+
+# CNAB 400: detalhe (tipo 1) no layout Bradesco, base da maioria dos bancos.
+# O nosso número muda de posição conforme o banco (código no header, 77-79).
+CNAB400_BANCO = slice(76, 79)
+CNAB400_DETALHE = _campos({
+    'ocorrencia': (109, 110),
+    'data_ocorrencia': (111, 116),
+    'vencimento': (147, 152),
+    'valor_titulo': (153, 165),
+    'valor_pago': (254, 266),
+    'juros': (267, 279),
+    'data_credito': (296, 301),
+})
+CNAB400_NOSSO_NUMERO = {
+    'padrao': slice(70, 82),
+    '341': slice(62, 70),  # Itaú
+    '001': slice(63, 80),  # Banco do Brasil (convênio de 7 dígitos)
+}
+CNAB400_LIQUIDACAO = {'06', '15', '17'}
+
+
+@dataclass
+class Liquidacao:
+    nosso_numero: str
+    valor_titulo: Decimal
+    valor_pago: Decimal
+    vencimento: date | None
+    data_ocorrencia: date | None
+    data_credito: date | None
+    ocorrencia: str
+    liquidado: bool
+
+
+def normalizar_nosso_numero(valor):
+    """Só dígitos, sem zeros à esquerda (bancos completam com zeros)."""
+    digitos = ''.join(c for c in str(valor or '') if c.isdigit())
+    return digitos.lstrip('0')
+
+
+def _valor(campo):
+    """Valor com 2 decimais implícitos."""
+    campo = campo.strip()
+    return Decimal(campo).scaleb(-2) if campo.isdigit() else Decimal('0.00')
+
+
+def _data(campo):
+    """DDMMAAAA ou DDMMAA; zeros/brancos = sem data."""
+    campo = campo.strip()
+    if not campo.isdigit() or not int(campo):
+        return None
+    dia, mes, ano = int(campo[:2]), int(campo[2:4]), int(campo[4:])
+    if len(campo) == 6:
+        ano += 2000
+    try:
+        return date(ano, mes, dia)
+    except ValueError:
+        return None
+
+
+def _iter_240(linhas):
+    titulo = None
+    for linha in linhas:
+        if linha[CNAB240_REGISTRO] != '3':
+            continue
+        segmento = linha[CNAB240_SEGMENTO]
+        if segmento == 'T':
+            titulo = {campo: linha[s] for campo, s in CNAB240_T.items()}
+        elif segmento == 'U' and titulo is not None:
+            u = {campo: linha[s] for campo, s in CNAB240_U.items()}
+            valor_pago = _valor(u['valor_pago'])
+            yield Liquidacao(
+                nosso_numero=normalizar_nosso_numero(titulo['nosso_numero']),
+                valor_titulo=_valor(titulo['valor_titulo']),
+                valor_pago=valor_pago,
+                vencimento=_data(titulo['vencimento']),
+                data_ocorrencia=_data(u['data_ocorrencia']),
+                data_credito=_data(u['data_credito']),
+                ocorrencia=u['ocorrencia'],
+                liquidado=u['ocorrencia'] in CNAB240_LIQUIDACAO and valor_pago > 0,
+            )
+            titulo = None
+
+
+def _iter_400(linhas, banco):
+    nosso_numero = CNAB400_NOSSO_NUMERO.get(banco, CNAB400_NOSSO_NUMERO['padrao'])
+    for linha in linhas:
+        if linha[:1] != '1':
+            continue
+        d = {campo: linha[s] for campo, s in CNAB400_DETALHE.items()}
+        valor_pago = _valor(d['valor_pago'])
+        yield Liquidacao(
+            nosso_numero=normalizar_nosso_numero(linha[nosso_numero]),
+            valor_titulo=_valor(d['valor_titulo']),
+            valor_pago=valor_pago,
+            vencimento=_data(d['vencimento']),
+            data_ocorrencia=_data(d['data_ocorrencia']),
+            data_credito=_data(d['data_credito']),
+            ocorrencia=d['ocorrencia'],
+            liquidado=d['ocorrencia'] in CNAB400_LIQUIDACAO and valor_pago > 0,
+        )
+
+
+def iter_retorno(file_obj):
+    """
+    Gera as `Liquidacao` de um arquivo de retorno CNAB 240 ou 400 (o layout
+    sai do tamanho do header). Inclui todas as ocorrências (entradas,
+    baixas, ...); `liquidado` marca as pagas. Levanta ValueError se não for CNAB.
+    """
+    texto = io.TextIOWrapper(file_obj, 'latin-1', newline=None) if not isinstance(file_obj, io.TextIOBase) else file_obj
+    try:
+        linhas = (linha.rstrip('\r\n') for linha in texto)
+        header = next(linhas, '')
+        if len(header) >= 400 and header[:1] == '0':
+            yield from _iter_400(linhas, header[CNAB400_BANCO])
+        elif len(header) >= 240 and header[7:8] == '0':
+            yield from _iter_240(linhas)
+        else:
+            raise ValueError('Arquivo não reconhecido como retorno CNAB 240 ou 400.')
+    finally:
+        if texto is not file_obj:
+            texto.detach()
+
+
+# =====================================================
+# BAIXA DOS TÍTULOS
+# =====================================================
+
+def _indexar_itens(empresa, liquidacoes):
+    """
+    Uma consulta pelos itens em aberto que podem casar com o arquivo.
+    Retorna (por nosso número, por (valor, vencimento) dos itens sem nosso número).
+    """
+    numeros = {l.nosso_numero for l in liquidacoes if l.nosso_numero}
+    vencimentos = [l.vencimento for l in liquidacoes if l.vencimento]
+    filtro = Q(nosso_numero__in=numeros)
+    if vencimentos:
+        filtro |= Q(nosso_numero='', data_vencimento__range=(min(vencimentos), max(vencimentos)))
+
+    por_numero = defaultdict(list)
+    por_valor_vencimento = defaultdict(list)
+    itens = ContaReceberItem.objects.filter(
+        filtro, conta_receber__empresa=empresa, recebido=False,
+    ).exclude(status='cancelado').select_related('conta_receber')
+    for item in itens:
+        if item.nosso_numero:
+            por_numero[item.nosso_numero].append(item)
+        else:
+            por_valor_vencimento[(item.valor, item.data_vencimento)].append(item)
+    return por_numero, por_valor_vencimento
+
+
+def _casar(liquidacao, por_numero, por_valor_vencimento):
+    candidatos = por_numero.get(liquidacao.nosso_numero)
+    if candidatos:
+        if len(candidatos) == 1:
+            return candidatos[0]
+        # Mesmo nosso número em mais de um item: desempata por vencimento e valor
+        for criterio in (
+            lambda i: i.data_vencimento == liquidacao.vencimento and i.valor == liquidacao.valor_titulo,
+            lambda i: i.data_vencimento == liquidacao.vencimento,
+            lambda i: i.valor == liquidacao.valor_titulo,
+        ):
+            escolhidos = [i for i in candidatos if criterio(i)]
+            if len(escolhidos) == 1:
+                return escolhidos[0]
+        return None
+    candidatos = por_valor_vencimento.get((liquidacao.valor_titulo, liquidacao.vencimento))
+    if candidatos and len(candidatos) == 1:
+        return candidatos[0]
+    return None
+
+
+def baixar_retorno(empresa, liquidacoes, pessoa=None, conta=None, arquivo_nome=''):
+    """
+    Dá baixa nos itens a receber liquidados no arquivo de retorno.
+
+    Cada item casado vira recebido, com um lançamento de entrada na data de
+    crédito (ou da ocorrência) pelo valor pago; tudo em lote numa transação.
+    `conta` é a conta bancária do crédito (padrão: a da conta a receber).
+    Retorna dict com liquidados, valor_total, nao_encontrados (nosso
+    números), ignorados (ocorrências que não são liquidação) e rejeitados
+    (crédito em mês fechado).
+    """
+    stats = {'liquidados': 0, 'valor_total': Decimal('0'), 'nao_encontrados': [], 'ignorados': 0, 'rejeitados': 0}
+    liquidacoes = list(liquidacoes)
+    validas = [l for l in liquidacoes if l.liquidado]
+    stats['ignorados'] = len(liquidacoes) - len(validas)
+    if not validas:
+        return stats
+
+    por_numero, por_valor_vencimento = _indexar_itens(empresa, validas)
+    meses_fechados = set(FechamentoMes.objects.filter(empresa=empresa).values_list('ano', 'mes'))
+    agora = timezone.now()
+    hoje = timezone.localdate()
+    observacao = f'Retorno CNAB {arquivo_nome}'.strip()
+
+    baixados = []
+    lancamentos = []
+    vistos = set()
+    for liquidacao in validas:
+        item = _casar(liquidacao, por_numero, por_valor_vencimento)
+        if item is None or item.id in vistos:
+            stats['nao_encontrados'].append(liquidacao.nosso_numero or f'{liquidacao.valor_titulo} venc. {liquidacao.vencimento}')
+            continue
+        data_credito = liquidacao.data_credito or liquidacao.data_ocorrencia or hoje
+        if (data_credito.year, data_credito.month) in meses_fechados:
+            stats['rejeitados'] += 1
+            continue
+        vistos.add(item.id)
+
+        cr = item.conta_receber
+        lancamentos.append(Lancamento(
+            empresa=empresa,
+            conta=conta or cr.conta,
+            tipo=TipoLancamento.ENTRADA,
+            categoria=cr.categoria,
+            projeto=cr.projeto,
+            pessoa=cr.cliente,
+            descricao=f'{cr.descricao} - {item.mes:02d}/{item.ano}',
+            valor=liquidacao.valor_pago,
+            data=data_credito,
+            observacao=f'{observacao} (venc. {item.data_vencimento.strftime("%d/%m/%Y")})',
+            criado_por=pessoa,
+        ))
+        item.recebido = True
+        item.recebido_em = agora
+        item.valor_recebido = liquidacao.valor_pago
+        item.status = 'recebido'
+        baixados.append(item)
+        stats['valor_total'] += liquidacao.valor_pago
+
+    with transaction.atomic():
+        criar_lancamentos(lancamentos, batch_size=500)
+        for item, lancamento in zip(baixados, lancamentos):
+            item.lancamento = lancamento
+        ContaReceberItem.objects.bulk_update(
+            baixados, ['recebido', 'recebido_em', 'valor_recebido', 'status', 'lancamento'], batch_size=500,
+        )
+    stats['liquidados'] = len(baixados)
+    return stats
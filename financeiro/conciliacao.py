@@ -0,0 +1,235 @@
+"""
+Conciliação bancária: liga lançamentos do extrato aos itens de contas a
+pagar/receber em aberto.
+
+Por conta bancária, os itens em aberto ficam num índice ordenado por
+(valor em centavos, data de vencimento). Para cada lançamento sem vínculo,
+a busca binária delimita só os itens dentro da tolerância de valor e de
+dias, sem comparar todos contra todos. Cada par candidato recebe uma
+confiança (0-100); a atribuição é gulosa pela maior confiança, um item por
+lançamento. Os pares aceitos são aplicados em lote.
+"""
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ContaPagarItem, ContaReceberItem, Lancamento, TipoLancamento
+
+TOLERANCIA_DIAS = 5
+TOLERANCIA_VALOR = Decimal('0.05')
+CONFIANCA_AUTOMATICA = 80
+
+
+@dataclass
+class Sugestao:
+    tipo: str  # 'pagar' | 'receber'
+    item_id: int
+    lancamento_id: int
+    descricao_item: str
+    descricao_lancamento: str
+    valor_item: Decimal
+    valor_lancamento: Decimal
+    vencimento: date
+    data_lancamento: date
+    confianca: int
+
+    @property
+    def chave(self):
+        return f'{self.tipo}:{self.item_id}:{self.lancamento_id}'
+
+
+def _palavras(texto):
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return {p for p in re.findall(r'[a-z0-9]{3,}', texto)}
+
+
+def _centavos(valor):
+    return int((valor * 100).to_integral_value())
+
+
+def _confianca(dif_centavos, dif_dias, tol_centavos, tol_dias, mesma_conta, palavras_item, palavras_lanc):
+    """100 = mesmo valor, mesmo dia, na conta do item e com descrição em comum."""
+    pontos = 100.0
+    if tol_centavos:
+        pontos -= 25 * dif_centavos / tol_centavos
+    if tol_dias:
+        pontos -= 25 * dif_dias / tol_dias
+    if not mesma_conta:
+        pontos -= 10
+    if palavras_item and not palavras_item & palavras_lanc:
+        pontos -= 15
+    return max(0, min(100, round(pontos)))
+
+
+class _Indice:
+    """Itens ordenados por (valor em centavos, vencimento) para busca por intervalo."""
+
+    def __init__(self, itens):
+        self.itens = sorted(itens, key=lambda i: (i['centavos'], i['ordinal']))
+        self.chaves = [(i['centavos'], i['ordinal']) for i in self.itens]
+
+    def candidatos(self, centavos, ordinal, tol_centavos, tol_dias):
+        # Cada valor na tolerância é uma faixa contígua ordenada por data
+        for valor in range(centavos - tol_centavos, centavos + tol_centavos + 1):
+            inicio = bisect_left(self.chaves, (valor, ordinal - tol_dias))
+            fim = bisect_right(self.chaves, (valor, ordinal + tol_dias))
+            yield from self.itens[inicio:fim]
+
+
+def _lancamentos_sem_vinculo(conta, inicio, fim):
+    return Lancamento.objects.filter(
+        conta=conta, data__range=(inicio, fim),
+        conta_pagar_item__isnull=True, conta_receber_item__isnull=True,
+    ).values('id', 'tipo', 'valor', 'data', 'descricao')
+
+
+def _itens_em_aberto(conta, inicio, fim, tol_dias):
+    """Itens a pagar/receber em aberto da empresa, da conta ou sem conta definida."""
+    janela = (inicio - timedelta(days=tol_dias), fim + timedelta(days=tol_dias))
+    pagar = ContaPagarItem.objects.filter(
+        Q(conta_pagar__conta=conta) | Q(conta_pagar__conta__isnull=True),
+        conta_pagar__empresa_id=conta.empresa_id, pago=False, data_vencimento__range=janela,
+    ).values('id', 'valor', 'data_vencimento', 'conta_pagar__descricao', 'conta_pagar__conta_id')
+    receber = ContaReceberItem.objects.filter(
+        Q(conta_receber__conta=conta) | Q(conta_receber__conta__isnull=True),
+        conta_receber__empresa_id=conta.empresa_id, recebido=False, data_vencimento__range=janela,
+    ).exclude(status='cancelado').values(
+        'id', 'valor', 'data_vencimento', 'conta_receber__descricao', 'conta_receber__conta_id',
+    )
+
+    def _preparar(linhas, campo_desc, campo_conta):
+        return [{
+            'id': l['id'],
+            'valor': l['valor'],
+            'vencimento': l['data_vencimento'],
+            'descricao': l[campo_desc],
+            'centavos': _centavos(l['valor']),
+            'ordinal': l['data_vencimento'].toordinal(),
+            'mesma_conta': l[campo_conta] == conta.id,
+            'palavras': _palavras(l[campo_desc]),
+        } for l in linhas]
+
+    return (
+        _preparar(pagar, 'conta_pagar__descricao', 'conta_pagar__conta_id'),
+        _preparar(receber, 'conta_receber__descricao', 'conta_receber__conta_id'),
+    )
+
+
+def sugerir_conciliacao(conta, inicio, fim, tolerancia_dias=TOLERANCIA_DIAS, tolerancia_valor=TOLERANCIA_VALOR):
+    """
+    Sugestões de vínculo entre lançamentos sem vínculo da conta (data entre
+    inicio e fim) e itens em aberto, da maior para a menor confiança.
+    Cada lançamento e cada item aparecem em no máximo uma sugestão.
+    """
+    tol_centavos = _centavos(tolerancia_valor)
+    pagar, receber = _itens_em_aberto(conta, inicio, fim, tolerancia_dias)
+    indices = {'pagar': _Indice(pagar), 'receber': _Indice(receber)}
+
+    candidatos = []
+    for lanc in _lancamentos_sem_vinculo(conta, inicio, fim):
+        tipo = 'receber' if lanc['tipo'] == TipoLancamento.ENTRADA else 'pagar'
+        centavos = _centavos(lanc['valor'])
+        ordinal = lanc['data'].toordinal()
+        palavras = _palavras(lanc['descricao'])
+        for item in indices[tipo].candidatos(centavos, ordinal, tol_centavos, tolerancia_dias):
+            confianca = _confianca(
+                abs(item['centavos'] - centavos), abs(item['ordinal'] - ordinal),
+                tol_centavos, tolerancia_dias, item['mesma_conta'], item['palavras'], palavras,
+            )
+            candidatos.append((confianca, -abs(item['ordinal'] - ordinal), tipo, item, lanc))
+
+    candidatos.sort(key=lambda c: (c[0], c[1]), reverse=True)
+    usados_lanc, usados_item = set(), set()
+    sugestoes = []
+    for confianca, _, tipo, item, lanc in candidatos:
+        if lanc['id'] in usados_lanc or (tipo, item['id']) in usados_item:
+            continue
+        usados_lanc.add(lanc['id'])
+        usados_item.add((tipo, item['id']))
+        sugestoes.append(Sugestao(
+            tipo=tipo,
+            item_id=item['id'],
+            lancamento_id=lanc['id'],
+            descricao_item=item['descricao'],
+            descricao_lancamento=lanc['descricao'],
+            valor_item=item['valor'],
+            valor_lancamento=lanc['valor'],
+            vencimento=item['vencimento'],
+            data_lancamento=lanc['data'],
+            confianca=confianca,
+        ))
+    return sugestoes
+
+
+def aplicar_conciliacao(conta, pares):
+    """
+    Vincula os pares aceitos [(tipo, item_id, lancamento_id), ...] e marca os
+    itens como pagos/recebidos pelo valor do lançamento, em lote. Pares cujo
+    item já foi baixado ou cujo lançamento já tem vínculo são ignorados.
+    Retorna a quantidade aplicada.
+    """
+    # Pares vêm do POST: descarta tipos e ids malformados
+    pares = [
+        (t, int(i), int(l)) for t, i, l in pares
+        if t in ('pagar', 'receber') and str(i).isdigit() and str(l).isdigit()
+    ]
+    if not pares:
+        return 0
+    agora = timezone.now()
+
+    with transaction.atomic():
+        # Trava os lançamentos antes de checar o vínculo: uma conciliação
+        # simultânea espera aqui e, depois, já enxerga o vínculo gravado
+        lancamento_ids = sorted({l for _, _, l in pares})
+        list(Lancamento.objects.select_for_update(of=('self',)).filter(
+            conta=conta, id__in=lancamento_ids,
+        ).order_by('id').values_list('id', flat=True))
+        # Só lançamentos da conta ainda sem vínculo e itens da mesma empresa
+        livres = Lancamento.objects.filter(
+            conta=conta, conta_pagar_item__isnull=True, conta_receber_item__isnull=True,
+        ).in_bulk(lancamento_ids)
+        pagar = ContaPagarItem.objects.select_for_update(of=('self',)).filter(
+            conta_pagar__empresa_id=conta.empresa_id,
+        ).in_bulk([i for t, i, _ in pares if t == 'pagar'])
+        receber = ContaReceberItem.objects.select_for_update(of=('self',)).filter(
+            conta_receber__empresa_id=conta.empresa_id,
+        ).in_bulk([i for t, i, _ in pares if t == 'receber'])
+
+        pagos, recebidos = [], []
+        for tipo, item_id, lanc_id in pares:
+            lancamento = livres.get(lanc_id)
+            if lancamento is None:
+                continue
+            if tipo == 'pagar':
+                item = pagar.get(item_id)
+                if not item or item.pago:
+                    continue
+                item.pago = True
+                item.pago_em = agora
+                item.lancamento = lancamento
+                pagos.append(item)
+            else:
+                item = receber.get(item_id)
+                if not item or item.recebido or item.status == 'cancelado':
+                    continue
+                item.recebido = True
+                item.recebido_em = agora
+                item.valor_recebido = lancamento.valor
+                item.status = 'recebido'
+                item.lancamento = lancamento
+                recebidos.append(item)
+            del livres[lanc_id]
+
+        ContaPagarItem.objects.bulk_update(pagos, ['pago', 'pago_em', 'lancamento'], batch_size=500)
+        ContaReceberItem.objects.bulk_update(
+            recebidos, ['recebido', 'recebido_em', 'valor_recebido', 'status', 'lancamento'], batch_size=500,
+        )
+    return len(pagos) + len(recebidos)
@@ -0,0 +1,251 @@
+"""
+Motor do DRE (Demonstrativo de Resultado do Exercício).
+
+Calcula a matriz linhas do DRE × meses (× empresas) com uma única consulta
+agrupada. Cada lançamento é classificado em uma linha do DRE pela
+`CategoriaLancamento.linha_dre`; categorias sem linha configurada caem na
+regra automática (entrada = receita, nomes de taxas = dedução, nomes de
+retirada = não operacional, demais saídas = custo operacional).
+
+Meses fechados (FechamentoMes) são lidos do snapshot do fechamento. Os demais
+meses já encerrados são guardados no cache sem expiração; qualquer alteração
+que possa mexer em um mês encerrado chama `invalidar_cache_dre()`.
+"""
+from datetime import date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, CharField, DecimalField, F, Sum, Value, When
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import FechamentoMes, Lancamento, LinhaDRE, TipoLancamento
+
+# Regra automática (categorias sem linha_dre configurada)
+CATEGORIAS_DEDUCAO = ['Taxa MP', 'Impostos', 'Taxa', 'Taxas']
+CATEGORIAS_RETIRADA = ['Retirada Renan', 'Retirada Yuri', 'Retirada', 'Pro-Labore']
+
+# Linhas exibidas no demonstrativo, na ordem do relatório
+LINHAS_DEMONSTRATIVO = [
+    ('receita_bruta', 'RECEITA BRUTA'),
+    ('deducoes', '(-) Deduções (Taxas, Impostos)'),
+    ('receita_liquida', '= RECEITA LÍQUIDA'),
+    ('custos_operacionais', '(-) Custos Operacionais'),
+    ('lucro_operacional', '= LUCRO OPERACIONAL'),
+    ('despesas_nao_operacionais', '(-) Despesas Não Operacionais (Retiradas)'),
+    ('lucro_liquido', '= LUCRO LÍQUIDO'),
+]
+
+_CHAVE_VERSAO = 'financeiro:dre:versao:{schema}'
+
+
+def _schema():
+    return getattr(connection, 'schema_name', 'public')
+
+
+def _versao_cache():
+    chave = _CHAVE_VERSAO.format(schema=_schema())
+    versao = cache.get(chave)
+    if versao is None:
+        versao = 1
+        cache.set(chave, versao, None)
+    return versao
+
+
+def _chave_celula(versao, empresa_id, mes_ref):
+    return f'financeiro:dre:{_schema()}:v{versao}:{empresa_id}:{mes_ref:%Y-%m}'
+
+
+def invalidar_cache_dre():
+    """Descarta todos os meses em cache do tenant atual (troca a versão das chaves)."""
+    chave = _CHAVE_VERSAO.format(schema=_schema())
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.set(chave, 2, None)
+
+
+def criar_lancamentos(lancamentos, **kwargs):
+    """
+    `Lancamento.objects.bulk_create(lancamentos, **kwargs)` que invalida o
+    cache do DRE (após o commit) quando algum lançamento cai em mês
+    encerrado: o bulk_create não dispara os signals do `save()`.
+    """
+    criados = Lancamento.objects.bulk_create(lancamentos, **kwargs)
+    if any(mes_encerrado(l.data) for l in criados):
+        transaction.on_commit(invalidar_cache_dre)
+    return criados
+
+
+def mes_encerrado(data, hoje=None):
+    """Um mês está encerrado quando é anterior ao mês corrente."""
+    hoje = hoje or timezone.localdate()
+    return (data.year, data.month) < (hoje.year, hoje.month)
+
+
+def meses_entre(inicio, fim):
+    """Lista de datas (dia 1) de cada mês entre inicio e fim, inclusive."""
+    atual = date(inicio.year, inicio.month, 1)
+    fim = date(fim.year, fim.month, 1)
+    meses = []
+    while atual <= fim:
+        meses.append(atual)
+        atual += relativedelta(months=1)
+    return meses
+
+
+def _expressao_linha():
+    return Case(
+        When(categoria__linha_dre__gt='', then=F('categoria__linha_dre')),
+        When(tipo=TipoLancamento.ENTRADA, then=Value(LinhaDRE.RECEITA)),
+        When(categoria__nome__in=CATEGORIAS_DEDUCAO, then=Value(LinhaDRE.DEDUCAO)),
+        When(categoria__nome__in=CATEGORIAS_RETIRADA, then=Value(LinhaDRE.NAO_OPERACIONAL)),
+        default=Value(LinhaDRE.CUSTO_OPERACIONAL),
+        output_field=CharField(),
+    )
+
+
+def _valor_com_sinal():
+    return Case(
+        When(tipo=TipoLancamento.ENTRADA, then=F('valor')),
+        default=-F('valor'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def _celula_vazia():
+    return {linha: Decimal('0') for linha in LinhaDRE.values}
+
+
+def consultar_celulas(empresa_ids, inicio, fim):
+    """Uma consulta: soma com sinal agrupada por empresa × mês × linha do DRE."""
+    celulas = {}
+    linhas = (
+        Lancamento.objects
+        .filter(empresa_id__in=empresa_ids, data__gte=inicio, data__lt=fim + relativedelta(months=1))
+        .annotate(mes_ref=TruncMonth('data'), linha=_expressao_linha())
+        .values('empresa_id', 'mes_ref', 'linha')
+        .annotate(total=Sum(_valor_com_sinal()))
+        .order_by()
+    )
+    for row in linhas:
+        celula = celulas.setdefault((row['empresa_id'], row['mes_ref']), _celula_vazia())
+        celula[row['linha']] += row['total'] or Decimal('0')
+    return celulas
+
+
+def demonstrativo(celula):
+    """Monta as linhas do DRE a partir dos totais com sinal de uma célula."""
+    receita_bruta = celula[LinhaDRE.RECEITA]
+    deducoes = -celula[LinhaDRE.DEDUCAO]
+    receita_liquida = receita_bruta - deducoes
+    custos_operacionais = -celula[LinhaDRE.CUSTO_OPERACIONAL]
+    lucro_operacional = receita_liquida - custos_operacionais
+    despesas_nao_operacionais = -celula[LinhaDRE.NAO_OPERACIONAL]
+    lucro_liquido = lucro_operacional - despesas_nao_operacionais
+    return {
+        'receita_bruta': receita_bruta,
+        'deducoes': deducoes,
+        'receita_liquida': receita_liquida,
+        'custos_operacionais': custos_operacionais,
+        'lucro_operacional': lucro_operacional,
+        'despesas_nao_operacionais': despesas_nao_operacionais,
+        'lucro_liquido': lucro_liquido,
+        'margem_bruta': (receita_liquida / receita_bruta * 100) if receita_bruta > 0 else 0,
+        'margem_liquida': (lucro_liquido / receita_bruta * 100) if receita_bruta > 0 else 0,
+    }
+
+
+class MatrizDRE:
+    """Resultado do DRE: células (empresa, mês) com os totais por linha."""
+
+    def __init__(self, empresas, meses, celulas):
+        self.empresas = list(empresas)
+        self.meses = meses
+        self.celulas = celulas
+
+    def celula(self, empresa_id=None, mes_ref=None, meses=None):
+        """Totais com sinal de uma empresa (ou de todas, se empresa_id=None) em um mês (ou nos meses)."""
+        empresa_ids = [empresa_id] if empresa_id is not None else [e.id for e in self.empresas]
+        if mes_ref is not None:
+            meses = [mes_ref]
+        meses = meses or self.meses
+        soma = _celula_vazia()
+        for eid in empresa_ids:
+            for m in meses:
+                for linha, valor in self.celulas.get((eid, m), {}).items():
+                    soma[linha] += valor
+        return soma
+
+    def demonstrativo(self, empresa_id=None, mes_ref=None, meses=None):
+        return demonstrativo(self.celula(empresa_id, mes_ref, meses))
+
+    def tabela(self, empresa_id=None, meses=None):
+        """Linhas do DRE × meses para o template (com coluna de total do período)."""
+        meses = meses or self.meses
+        por_mes = [self.demonstrativo(empresa_id, m) for m in meses]
+        total = self.demonstrativo(empresa_id, meses=meses)
+        return [
+            {
+                'chave': chave,
+                'rotulo': rotulo,
+                'valores': [d[chave] for d in por_mes],
+                'total': total[chave],
+            }
+            for chave, rotulo in LINHAS_DEMONSTRATIVO
+        ]
+
+
+def calcular_dre(empresas, inicio, fim, usar_cache=True):
+    """
+    Calcula o DRE das empresas para os meses de inicio a fim (inclusive).
+
+    Meses fechados vêm do snapshot e meses encerrados do cache quando possível;
+    o restante é calculado em uma única consulta agrupada, independente da
+    quantidade de meses/empresas.
+    """
+    empresas = list(empresas)
+    meses = meses_entre(inicio, fim)
+    hoje = timezone.localdate()
+    celulas = {}
+
+    # Meses fechados: linhas do DRE congeladas no snapshot
+    fechados = FechamentoMes.objects.filter(
+        empresa_id__in=[e.id for e in empresas], ano__gte=meses[0].year, ano__lte=meses[-1].year,
+    ).values_list('empresa_id', 'ano', 'mes', 'snapshot')
+    for empresa_id, ano, mes, snapshot in fechados:
+        if 'dre' in snapshot:
+            celula = _celula_vazia()
+            celula.update({linha: Decimal(valor) for linha, valor in snapshot['dre'].items()})
+            celulas[(empresa_id, date(ano, mes, 1))] = celula
+
+    pendentes = [(e.id, m) for e in empresas for m in meses if (e.id, m) not in celulas]
+    chaves = {}
+    if usar_cache:
+        versao = _versao_cache()
+        chaves = {
+            (eid, m): _chave_celula(versao, eid, m)
+            for eid, m in pendentes if mes_encerrado(m, hoje)
+        }
+        em_cache = cache.get_many(chaves.values())
+        for par, chave in chaves.items():
+            if chave in em_cache:
+                celulas[par] = em_cache[chave]
+        pendentes = [par for par in pendentes if par not in celulas]
+
+    if pendentes:
+        empresa_ids = sorted({eid for eid, _ in pendentes})
+        meses_pendentes = [m for _, m in pendentes]
+        calculadas = consultar_celulas(empresa_ids, min(meses_pendentes), max(meses_pendentes))
+        novos = {}
+        for par in pendentes:
+            celula = calculadas.get(par, _celula_vazia())
+            celulas[par] = celula
+            if par in chaves:
+                novos[chaves[par]] = celula
+        if novos:
+            cache.set_many(novos, None)
+
+    return MatrizDRE(empresas, meses, celulas)
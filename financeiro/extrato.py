@@ -1,11 +1,25 @@
 """
-Parser de extratos bancários em CSV, XLSX e PDF.
+Parser de extratos bancários em CSV, XLSX, OFX e PDF.
 Retorna lista de dicts: [{'data': date, 'descricao': str, 'valor': Decimal}, ...]
 Valor positivo = entrada, negativo = saída.
+
+As funções iter_* geram os mesmos dicts sem carregar o arquivo inteiro em
+memória (CSV/XLSX/OFX); parse_* são as versões que devolvem lista. No OFX os
+dicts trazem também 'fitid'.
 """
+import codecs
 import csv
+import hashlib
+import html
 import io
+import itertools
+import multiprocessing
+import os
 import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import date, datetime
 from decimal import Decimal, InvalidOperation
 
@@ -52,6 +66,125 @@ def parse_data_br(data_str):
     return None
 
 
+# =====================================================
+# PERFIL DE COLUNAS
+# =====================================================
+# parse_data_br/parse_valor_br testam todos os formatos em cada célula. O
+# perfil olha as primeiras linhas, fixa um formato de data e um padrão
+# numérico por coluna e devolve conversores diretos; a célula que não bate
+# com o perfil cai no parser genérico.
+
+AMOSTRA_PERFIL = 50
+FORMATOS_DATA = ('%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d', '%d/%m/%y', '%d-%m-%y')
+_LIMPA_VALOR = str.maketrans('', '', 'R$ \t\xa0')
+
+
+def _textos(amostra):
+    return [v.strip() for v in amostra if isinstance(v, str) and v.strip()]
+
+
+def _strptime_ok(texto, formato):
+    try:
+        datetime.strptime(texto, formato)
+        return True
+    except ValueError:
+        return False
+
+
+def perfil_data(amostra):
+    """Formato de FORMATOS_DATA que parseia todas as datas em texto da amostra, ou None."""
+    textos = _textos(amostra)
+    if not textos:
+        return None
+    for formato in FORMATOS_DATA:
+        if all(_strptime_ok(t, formato) for t in textos):
+            return formato
+    return None
+
+
+def perfil_valor(amostra):
+    """
+    'br' (1.234,56), 'us' (1,234.56 ou 1234.56) ou None (misturado/sem texto).
+    Valores só com ponto seguem parse_valor_br: ponto decimal.
+    """
+    padroes = set()
+    for t in _textos(amostra):
+        t = t.translate(_LIMPA_VALOR)
+        virgula, ponto = t.rfind(','), t.rfind('.')
+        if virgula > ponto:
+            padroes.add('br')
+        elif ponto > virgula and virgula >= 0:
+            padroes.add('us')
+        elif ponto >= 0:
+            padroes.add('ponto')
+    if padroes <= {'br'} and padroes:
+        return 'br'
+    if padroes and padroes <= {'us', 'ponto'}:
+        return 'us'
+    return None
+
+
+def conversor_data(formato):
+    """Função célula -> date para o formato fixo (fallback: parse_data_br)."""
+    if formato is None:
+        return parse_data_br
+    sep = formato[2] if formato in ('%d/%m/%Y', '%d-%m-%Y') else None
+    iso = formato == '%Y-%m-%d'
+
+    def converter(valor):
+        if isinstance(valor, str):
+            s = valor.strip()
+            try:
+                if sep and len(s) == 10 and s[2] == sep and s[5] == sep:
+                    return date(int(s[6:10]), int(s[3:5]), int(s[0:2]))
+                if iso and len(s) == 10 and s[4] == '-' and s[7] == '-':
+                    return date(int(s[0:4]), int(s[5:7]), int(s[8:10]))
+                return datetime.strptime(s, formato).date()
+            except ValueError:
+                pass
+        return parse_data_br(valor)
+    return converter
+
+
+def conversor_valor(locale):
+    """
+    Função célula -> Decimal para o padrão numérico fixo. Células fora do
+    padrão da amostra (ponto depois da última vírgula em 'br', vírgula
+    depois do último ponto em 'us') vão para parse_valor_br.
+    """
+    if locale is None:
+        return parse_valor_br
+    br = locale == 'br'
+
+    def converter(valor):
+        if isinstance(valor, str):
+            s = valor.translate(_LIMPA_VALOR)
+            if not s:
+                return None
+            virgula, ponto = s.rfind(','), s.rfind('.')
+            if (ponto < virgula or ponto < 0) if br else (virgula < ponto or virgula < 0):
+                s = s.replace('.', '').replace(',', '.') if br else s.replace(',', '')
+                try:
+                    return Decimal(s)
+                except InvalidOperation:
+                    pass
+        return parse_valor_br(valor)
+    return converter
+
+
+def perfilar_colunas(amostra, col):
+    """Conversores {'data', 'valor', 'valor_saida'} para as colunas detectadas."""
+    def coluna(nome):
+        i = col[nome]
+        return [row[i] for row in amostra if row and i is not None and i < len(row)]
+
+    return {
+        'data': conversor_data(perfil_data(coluna('data'))),
+        'valor': conversor_valor(perfil_valor(coluna('valor'))),
+        'valor_saida': conversor_valor(perfil_valor(coluna('valor_saida'))),
+    }
+
+
 PALAVRAS_DATA = ['data', 'date', 'dt', 'data mov', 'data movimento', 'data lançamento',
                  'release_date', 'release date']
 PALAVRAS_DESC = ['descricao', 'descrição', 'historico', 'histórico', 'description',
@@ -91,6 +224,17 @@ def _detectar_colunas(headers):
     return col
 
 
+def assinatura_header(row):
+    """
+    Impressão digital do header (células normalizadas, sem as vazias do fim).
+    Identifica o layout de um banco entre arquivos de meses diferentes.
+    """
+    celulas = [str(c).strip().lower() if c is not None else '' for c in row or ()]
+    while celulas and not celulas[-1]:
+        celulas.pop()
+    return hashlib.sha256('\x1f'.join(celulas).encode('utf-8')).hexdigest()
+
+
 def _is_header_row(row):
     """Verifica se uma linha parece ser um header de dados (tem palavras-chave de colunas)."""
     if not row:
@@ -101,138 +245,408 @@ def _is_header_row(row):
     return matches >= 2
 
 
-def _encontrar_header(rows):
+# Linhas lidas procurando o header antes de assumir a primeira linha
+LIMITE_BUSCA_HEADER = 200
+TAMANHO_AMOSTRA = 64 * 1024
+
+
+_CONVERSORES_GENERICOS = {'data': parse_data_br, 'valor': parse_valor_br, 'valor_saida': parse_valor_br}
+
+
+def _row_para_lancamento(row, col, conv=_CONVERSORES_GENERICOS):
+    """Converte uma linha em lançamento, ou None se a linha não é um lançamento válido."""
+    if not row or all(c is None or not str(c).strip() for c in row):
+        return None
+
+    try:
+        data = conv['data'](row[col['data']]) if col['data'] is not None and col['data'] < len(row) else None
+        descricao = str(row[col['descricao']]).strip() if col['descricao'] is not None and col['descricao'] < len(row) else ''
+        valor = conv['valor'](row[col['valor']]) if col['valor'] is not None and col['valor'] < len(row) else None
+
+        # Coluna separada de débito
+        if col['valor_saida'] is not None and col['valor_saida'] < len(row):
+            val_saida = conv['valor_saida'](row[col['valor_saida']])
+            if val_saida and val_saida > 0:
+                valor = -val_saida
+            elif valor is None:
+                return None
+    except (IndexError, TypeError):
+        return None
+
+    if data and valor and descricao:
+        return {
+            'data': data,
+            'descricao': descricao[:300],
+            'valor': valor,
+        }
+    return None
+
+
+def _iter_lancamentos(rows, layouts=None, layout=None):
     """
-    Encontra a linha de header real nos dados.
-    Extratos como Mercado Pago têm linhas de resumo antes do header real.
-    Retorna (indice_header, header_row).
+    Gera lançamentos a partir de um iterável de linhas, sem materializá-lo.
+
+    Só as primeiras linhas (até achar o header, no máximo LIMITE_BUSCA_HEADER)
+    ficam em memória; se nenhuma parece header, a primeira linha é o header.
+    As AMOSTRA_PERFIL linhas seguintes definem os conversores de cada coluna.
+
+    `layouts` é {assinatura_header: colunas} de layouts já conhecidos: uma
+    linha com assinatura conhecida é o header e usa as colunas salvas, sem
+    detecção por palavras-chave. Se `layout` (dict) for passado, recebe
+    'assinatura', 'header', 'colunas' e 'conhecido' do layout usado.
     """
-    for i, row in enumerate(rows):
+    layouts = layouts or {}
+    rows = iter(rows)
+    buffer = []
+    header = None
+    col = None
+    for row in rows:
+        if row and layouts:
+            col = layouts.get(assinatura_header(row))
+            if col is not None:
+                header = row
+                break
         if row and _is_header_row(row):
-            return i, row
-    return 0, rows[0] if rows else []
+            header = row
+            buffer = []
+            break
+        buffer.append(row)
+        if len(buffer) >= LIMITE_BUSCA_HEADER:
+            break
+
+    if header is None:
+        # Sem header reconhecível: primeira linha não vazia é o header
+        buffer = [r for r in buffer if r]
+        if not buffer:
+            return
+        header, buffer = buffer[0], buffer[1:]
+    elif col is not None:
+        buffer = []
+
+    conhecido = col is not None
+    if not conhecido:
+        col = _detectar_colunas(header)
+    if layout is not None:
+        layout.update({
+            'assinatura': assinatura_header(header),
+            'header': ['' if c is None else str(c).strip() for c in header],
+            'colunas': dict(col),
+            'conhecido': conhecido,
+        })
+
+    rows = itertools.chain(buffer, rows)
+    amostra = list(itertools.islice(rows, AMOSTRA_PERFIL))
+    conv = perfilar_colunas(amostra, col)
+    for row in itertools.chain(amostra, rows):
+        lancamento = _row_para_lancamento(row, col, conv)
+        if lancamento:
+            yield lancamento
 
 
 def _rows_para_lancamentos(rows):
     """Converte linhas (list de lists) em lista de lançamentos."""
     if not rows or len(rows) < 2:
         return []
+    return list(_iter_lancamentos(rows))
 
-    # Encontra a linha de header real (pode não ser a primeira)
-    header_idx, headers = _encontrar_header(rows)
-    col = _detectar_colunas(headers)
-    lancamentos = []
 
-    for row in rows[header_idx + 1:]:
-        if not row or all(c is None or not str(c).strip() for c in row):
+def _detectar_encoding(amostra):
+    """Primeira codificação que decodifica a amostra (o fim pode cortar um caractere)."""
+    for encoding in ('utf-8-sig', 'cp1252'):
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(amostra, final=False)
+            return encoding
+        except UnicodeDecodeError:
             continue
+    return 'latin-1'
 
-        try:
-            data = parse_data_br(row[col['data']]) if col['data'] is not None and col['data'] < len(row) else None
-            descricao = str(row[col['descricao']]).strip() if col['descricao'] is not None and col['descricao'] < len(row) else ''
-            valor = parse_valor_br(row[col['valor']]) if col['valor'] is not None and col['valor'] < len(row) else None
-
-            # Coluna separada de débito
-            if col['valor_saida'] is not None and col['valor_saida'] < len(row):
-                val_saida = parse_valor_br(row[col['valor_saida']])
-                if val_saida and val_saida > 0:
-                    valor = -val_saida
-                elif valor is None:
-                    continue
 
-            if data and valor and descricao:
-                lancamentos.append({
-                    'data': data,
-                    'descricao': descricao[:300],
-                    'valor': valor,
-                })
-        except (IndexError, TypeError):
-            continue
+def iter_csv(file_obj, layouts=None, layout=None):
+    """
+    Gera lançamentos de um extrato CSV lendo o arquivo em streaming.
+    Codificação e delimitador (; , ou tab) são detectados numa amostra do início.
+    `layouts`/`layout` como em `_iter_lancamentos`.
+    """
+    amostra = file_obj.read(TAMANHO_AMOSTRA)
+    if isinstance(amostra, str):
+        texto_amostra, stream = amostra, None
+    else:
+        encoding = _detectar_encoding(amostra)
+        texto_amostra = amostra.decode(encoding, errors='replace')
+        stream = encoding
+    file_obj.seek(0)
 
-    return lancamentos
+    # Detecta delimitador (só com linhas completas da amostra)
+    corte = texto_amostra.rfind('\n')
+    amostra_linhas = texto_amostra[:corte] if corte > 0 else texto_amostra
+    dialect = csv.Sniffer().sniff(amostra_linhas[:2000], delimiters=',;\t')
+
+    linhas = io.TextIOWrapper(file_obj, stream, errors='replace', newline='') if stream else file_obj
+    try:
+        reader = csv.reader(linhas, dialect)
+        yield from _iter_lancamentos((row for row in reader if row), layouts, layout)
+    finally:
+        # Devolve o arquivo original sem fechá-lo
+        if linhas is not file_obj:
+            linhas.detach()
 
 
 def parse_csv(file_obj):
     """Parseia extrato CSV. Aceita ; ou , como delimitador."""
-    content = file_obj.read()
-    if isinstance(content, bytes):
-        for encoding in ('utf-8', 'latin-1', 'cp1252'):
-            try:
-                content = content.decode(encoding)
-                break
-            except UnicodeDecodeError:
-                continue
+    return list(iter_csv(file_obj))
 
-    # Detecta delimitador
-    dialect = csv.Sniffer().sniff(content[:2000], delimiters=',;\t')
-    reader = csv.reader(io.StringIO(content), dialect)
-    rows = [row for row in reader if row]
-    return _rows_para_lancamentos(rows)
+
+def iter_xlsx(file_obj, layouts=None, layout=None):
+    """
+    Gera lançamentos de um extrato XLSX linha a linha (openpyxl em modo read_only).
+    `layouts`/`layout` como em `_iter_lancamentos`.
+    """
+    wb = openpyxl.load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        yield from _iter_lancamentos((list(row) for row in wb.active.iter_rows(values_only=True)), layouts, layout)
+    finally:
+        wb.close()
 
 
 def parse_xlsx(file_obj):
     """Parseia extrato XLSX."""
-    wb = openpyxl.load_workbook(file_obj, read_only=True, data_only=True)
-    ws = wb.active
-    rows = []
-    for row in ws.iter_rows(values_only=True):
-        rows.append(list(row))
-    wb.close()
-    return _rows_para_lancamentos(rows)
+    return list(iter_xlsx(file_obj))
 
 
-def parse_pdf(file_obj):
-    """Parseia extrato PDF extraindo tabelas."""
-    lancamentos = []
-    with pdfplumber.open(file_obj) as pdf:
-        for page in pdf.pages:
-            tables = page.extract_tables()
-            for table in tables:
-                if table:
-                    lancamentos.extend(_rows_para_lancamentos(table))
-
-    # Se não encontrou tabelas, tenta extrair texto linha por linha
-    if not lancamentos:
-        lancamentos = _parse_pdf_texto(file_obj)
+# =====================================================
+# OFX
+# =====================================================
+# OFX 1.x é SGML (tags de valor sem fechamento, header "OFXHEADER:100") e
+# OFX 2.x é XML. O leitor abaixo trata os dois: percorre as tags em
+# streaming e emite um lançamento a cada <STMTTRN> completo, com o FITID
+# (identificador da transação no banco) como chave de deduplicação.
+
+TAMANHO_BLOCO_OFX = 64 * 1024
+_TAG_OFX = re.compile(r'<(/?)([A-Za-z0-9.]+)[^>]*>([^<]*)')
+_CHARSET_OFX = re.compile(rb'(?:CHARSET:\s*(\w+)|ENCODING:\s*(UTF-8)|encoding=["\']([\w-]+)["\'])', re.IGNORECASE)
+
+
+def _encoding_ofx(amostra):
+    """Codificação declarada no header OFX (SGML ou XML), ou detectada."""
+    m = _CHARSET_OFX.search(amostra)
+    if m:
+        charset, utf8, xml = (g.decode('ascii') if g else None for g in m.groups())
+        if utf8 or (xml and xml.lower().replace('_', '-') == 'utf-8'):
+            return 'utf-8-sig'
+        if xml:
+            return xml
+        if charset and charset.isdigit():
+            return f'cp{charset}'
+    return _detectar_encoding(amostra)
+
+
+def _tags_ofx(texto):
+    """
+    Gera (fechamento, TAG, valor) de um iterável de blocos de texto, com as
+    entidades do valor (&amp;, &lt;, ...) já decodificadas.
+    """
+    resto = ''
+    for bloco in texto:
+        bloco = resto + bloco
+        # A última tag pode estar cortada no fim do bloco
+        corte = bloco.rfind('<')
+        resto = bloco[corte:] if corte >= 0 else ''
+        for m in _TAG_OFX.finditer(bloco, 0, corte if corte >= 0 else len(bloco)):
+            yield m.group(1) == '/', m.group(2).upper(), html.unescape(m.group(3).strip())
+    for m in _TAG_OFX.finditer(resto):
+        yield m.group(1) == '/', m.group(2).upper(), html.unescape(m.group(3).strip())
+
+
+def _stmttrn_para_lancamento(campos):
+    # DTPOSTED: AAAAMMDD[HHMMSS[.XXX]][[-3:BRT]]
+    dt = campos.get('DTPOSTED', '')
+    try:
+        data = date(int(dt[:4]), int(dt[4:6]), int(dt[6:8]))
+    except ValueError:
+        data = None
+    valor = parse_valor_br(campos.get('TRNAMT'))
+    descricao = campos.get('MEMO') or campos.get('NAME') or campos.get('TRNTYPE', '')
+    if campos.get('NAME') and campos.get('MEMO') and campos['NAME'] not in campos['MEMO']:
+        descricao = f"{campos['NAME']} - {campos['MEMO']}"
+    if not (data and valor and descricao):
+        return None
+    lancamento = {'data': data, 'descricao': descricao[:300], 'valor': valor}
+    if campos.get('FITID'):
+        lancamento['fitid'] = campos['FITID'][:255]
+    return lancamento
+
+
+def iter_ofx(file_obj):
+    """
+    Gera lançamentos de um extrato OFX (SGML ou XML) em streaming.
+    Além de data/descrição/valor, cada lançamento traz 'fitid' quando o banco
+    o informa.
+    """
+    amostra = file_obj.read(TAMANHO_AMOSTRA)
+    file_obj.seek(0)
+    if isinstance(amostra, str):
+        texto, stream = file_obj, None
+    else:
+        texto = stream = io.TextIOWrapper(file_obj, _encoding_ofx(amostra), errors='replace')
 
+    try:
+        blocos = iter(lambda: texto.read(TAMANHO_BLOCO_OFX), '')
+        campos = None
+        for fechamento, tag, valor in _tags_ofx(blocos):
+            if tag == 'STMTTRN':
+                # No SGML o próximo <STMTTRN> também encerra o anterior
+                if campos:
+                    lancamento = _stmttrn_para_lancamento(campos)
+                    if lancamento:
+                        yield lancamento
+                campos = None if fechamento else {}
+            elif campos is not None:
+                if tag == 'BANKTRANLIST' and fechamento:
+                    lancamento = _stmttrn_para_lancamento(campos)
+                    if lancamento:
+                        yield lancamento
+                    campos = None
+                elif not fechamento and valor:
+                    campos[tag] = valor
+        if campos:
+            lancamento = _stmttrn_para_lancamento(campos)
+            if lancamento:
+                yield lancamento
+    finally:
+        if stream is not None:
+            stream.detach()
+
+
+def parse_ofx(file_obj):
+    """Parseia extrato OFX."""
+    return list(iter_ofx(file_obj))
+
+
+# Páginas processadas por tarefa do pool (o PDF é aberto uma vez por tarefa)
+PAGINAS_POR_TAREFA = 10
+
+# Padrão típico de linha em texto: DD/MM/YYYY  DESCRIÇÃO  VALOR
+_PADRAO_LINHA_PDF = re.compile(
+    r'(\d{2}/\d{2}/\d{4})\s+'  # data
+    r'(.+?)\s+'                  # descrição
+    r'(-?\s*[\d.,]+)\s*$'        # valor
+)
+
+
+def _lancamentos_do_texto(texto):
+    """Extrai lançamentos do texto de uma página por regex."""
+    lancamentos = []
+    for line in texto.split('\n'):
+        m = _PADRAO_LINHA_PDF.search(line.strip())
+        if m:
+            data = parse_data_br(m.group(1))
+            descricao = m.group(2).strip()
+            valor = parse_valor_br(m.group(3))
+            if data and valor and descricao:
+                lancamentos.append({
+                    'data': data,
+                    'descricao': descricao[:300],
+                    'valor': valor,
+                })
     return lancamentos
 
 
-def _parse_pdf_texto(file_obj):
-    """Fallback: extrai lançamentos do texto do PDF por regex."""
+def _lancamentos_da_pagina(page):
+    """Uma passada na página: tabelas e, se não renderem nada, o texto dela."""
     lancamentos = []
-    # Padrão típico: DD/MM/YYYY  DESCRIÇÃO  VALOR
-    padrao = re.compile(
-        r'(\d{2}/\d{2}/\d{4})\s+'  # data
-        r'(.+?)\s+'                  # descrição
-        r'(-?\s*[\d.,]+)\s*$'        # valor
-    )
-    with pdfplumber.open(file_obj) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text() or ''
-            for line in text.split('\n'):
-                m = padrao.search(line.strip())
-                if m:
-                    data = parse_data_br(m.group(1))
-                    descricao = m.group(2).strip()
-                    valor = parse_valor_br(m.group(3))
-                    if data and valor and descricao:
-                        lancamentos.append({
-                            'data': data,
-                            'descricao': descricao[:300],
-                            'valor': valor,
-                        })
+    for table in page.extract_tables():
+        if table:
+            lancamentos.extend(_rows_para_lancamentos(table))
+    if not lancamentos:
+        lancamentos = _lancamentos_do_texto(page.extract_text() or '')
     return lancamentos
 
 
-def parse_extrato(file_obj, filename):
-    """Parseia extrato baseado na extensão do arquivo."""
+def _extrair_paginas(caminho, inicio, fim):
+    """Processa as páginas [inicio, fim) do PDF. Roda nos processos do pool."""
+    with pdfplumber.open(caminho) as pdf:
+        return inicio, [_lancamentos_da_pagina(pdf.pages[i]) for i in range(inicio, min(fim, len(pdf.pages)))]
+
+
+@contextmanager
+def _caminho_arquivo(file_obj):
+    """Caminho em disco do upload (os processos do pool abrem o PDF pelo caminho)."""
+    if isinstance(file_obj, (str, os.PathLike)):
+        yield file_obj
+        return
+    if hasattr(file_obj, 'temporary_file_path'):
+        yield file_obj.temporary_file_path()
+        return
+    file_obj.seek(0)
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as tmp:
+        shutil.copyfileobj(file_obj, tmp)
+        tmp.flush()
+        yield tmp.name
+
+
+def parse_pdf(file_obj, progresso=None, processos=None):
+    """
+    Parseia extrato PDF. As páginas são divididas em blocos processados em
+    paralelo (pool de processos); o resultado segue a ordem das páginas.
+
+    `progresso(paginas_processadas, total_paginas)` é chamado a cada bloco.
+    """
+    with _caminho_arquivo(file_obj) as caminho:
+        with pdfplumber.open(caminho) as pdf:
+            total = len(pdf.pages)
+        blocos = [(i, i + PAGINAS_POR_TAREFA) for i in range(0, total, PAGINAS_POR_TAREFA)]
+        processos = min(processos or os.cpu_count() or 1, len(blocos))
+
+        por_pagina = {}
+        if processos <= 1:
+            for inicio, fim in blocos:
+                _, paginas = _extrair_paginas(caminho, inicio, fim)
+                por_pagina[inicio] = paginas
+                if progresso:
+                    progresso(min(fim, total), total)
+        else:
+            # spawn: o processo pai pode ter threads (servidor web)
+            contexto = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as pool:
+                futuros = [pool.submit(_extrair_paginas, caminho, inicio, fim) for inicio, fim in blocos]
+                feitas = 0
+                for futuro in as_completed(futuros):
+                    inicio, paginas = futuro.result()
+                    por_pagina[inicio] = paginas
+                    feitas += len(paginas)
+                    if progresso:
+                        progresso(feitas, total)
+
+    return [
+        lancamento
+        for inicio in sorted(por_pagina)
+        for pagina in por_pagina[inicio]
+        for lancamento in pagina
+    ]
+
+
+def iter_extrato(file_obj, filename, layouts=None, layout=None):
+    """
+    Gera os lançamentos do extrato conforme a extensão do arquivo.
+    CSV, XLSX e OFX são lidos em streaming; PDF é parseado inteiro.
+    Formato não suportado levanta ValueError já na chamada.
+
+    `layouts` ({assinatura: colunas}) e `layout` (dict preenchido com o layout
+    usado) valem para CSV/XLSX; PDF tem uma tabela por página e sempre detecta.
+    """
     ext = filename.lower().rsplit('.', 1)[-1] if '.' in filename else ''
     if ext == 'csv':
-        return parse_csv(file_obj)
+        return iter_csv(file_obj, layouts, layout)
     elif ext in ('xlsx', 'xls'):
-        return parse_xlsx(file_obj)
+        return iter_xlsx(file_obj, layouts, layout)
+    elif ext == 'ofx':
+        return iter_ofx(file_obj)
     elif ext == 'pdf':
-        return parse_pdf(file_obj)
+        return iter(parse_pdf(file_obj))
     else:
-        raise ValueError(f'Formato não suportado: .{ext}. Use CSV, XLSX ou PDF.')
+        raise ValueError(f'Formato não suportado: .{ext}. Use CSV, XLSX, OFX ou PDF.')
+
+
+def parse_extrato(file_obj, filename):
+    """Parseia extrato baseado na extensão do arquivo."""
+    return list(iter_extrato(file_obj, filename))
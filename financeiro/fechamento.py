@@ -0,0 +1,183 @@
+"""
+Fechamento de mês.
+
+Ao fechar um mês, os lançamentos da empresa naquele período ficam bloqueados
+(ver `Lancamento._verificar_periodo_aberto`) e os relatórios do mês são
+calculados uma última vez e congelados em `FechamentoMes.snapshot`. Relatórios
+sobre meses fechados leem o snapshot; só meses abertos são calculados.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Exists, OuterRef, Sum, Value
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from .dre import consultar_celulas, mes_encerrado
+from .models import FechamentoMes, Lancamento, PrestacaoConta
+
+VERSAO_SNAPSHOT = 1
+
+
+def _congelar(valor):
+    """Converte Decimal/date em valores JSON que voltam ao tipo original em `_descongelar`."""
+    if isinstance(valor, Decimal):
+        return {'__decimal__': str(valor)}
+    if isinstance(valor, date):
+        return {'__date__': valor.isoformat()}
+    if isinstance(valor, dict):
+        return {k: _congelar(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_congelar(v) for v in valor]
+    return valor
+
+
+def _descongelar(valor):
+    if isinstance(valor, dict):
+        if '__decimal__' in valor:
+            return Decimal(valor['__decimal__'])
+        if '__date__' in valor:
+            return date.fromisoformat(valor['__date__'])
+        return {k: _descongelar(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_descongelar(v) for v in valor]
+    return valor
+
+
+def calcular_relatorio_mensal(empresa, mes, ano):
+    """Totais, categorias e retiradas dos sócios do mês (dados do relatório financeiro)."""
+    lancamentos = Lancamento.objects.filter(empresa=empresa, data__month=mes, data__year=ano)
+
+    # --- Totais gerais ---
+    total_entradas = lancamentos.filter(tipo='entrada').aggregate(t=Sum('valor'))['t'] or Decimal('0')
+    total_saidas = lancamentos.filter(tipo='saida').aggregate(t=Sum('valor'))['t'] or Decimal('0')
+    lucro_bruto = total_entradas - total_saidas
+
+    # --- Por categoria ---
+    cat_entradas = list(lancamentos.filter(tipo='entrada').values(
+        'categoria__nome', 'categoria__cor'
+    ).annotate(total=Sum('valor'), qtd=Sum(Value(1))).order_by('-total'))
+
+    cat_saidas = list(lancamentos.filter(tipo='saida').values(
+        'categoria__nome', 'categoria__cor'
+    ).annotate(total=Sum('valor'), qtd=Sum(Value(1))).order_by('-total'))
+
+    # --- Retiradas sócios ---
+    retirada_renan = lancamentos.filter(
+        tipo='saida', categoria__nome='Retirada Renan'
+    ).aggregate(t=Sum('valor'))['t'] or Decimal('0')
+
+    retirada_yuri = lancamentos.filter(
+        tipo='saida', categoria__nome='Retirada Yuri'
+    ).aggregate(t=Sum('valor'))['t'] or Decimal('0')
+
+    prestacoes_mes = PrestacaoConta.objects.filter(
+        lancamento__empresa=empresa,
+        lancamento__data__month=mes,
+        lancamento__data__year=ano,
+    )
+
+    # Prestações de conta (gastos empresa pagos pelo Renan)
+    prestacoes_renan = prestacoes_mes.filter(
+        lancamento__categoria__nome='Retirada Renan',
+    ).aggregate(t=Sum('valor'))['t'] or Decimal('0')
+
+    retirada_renan_liquida = retirada_renan - prestacoes_renan
+
+    # --- Custos operacionais (saídas que não são retirada) ---
+    custos_operacionais = lancamentos.filter(tipo='saida').exclude(
+        categoria__nome__in=['Retirada Renan', 'Retirada Yuri']
+    ).aggregate(t=Sum('valor'))['t'] or Decimal('0')
+
+    custos_operacionais_total = custos_operacionais + prestacoes_renan
+
+    # --- Lucro líquido e divisão 50/50 ---
+    lucro_liquido = total_entradas - custos_operacionais_total
+    direito_cada = lucro_liquido / 2 if lucro_liquido > 0 else Decimal('0')
+    saldo_yuri = direito_cada - retirada_yuri
+    saldo_renan = direito_cada - retirada_renan_liquida
+
+    # --- Detalhes ---
+    prestacoes_detalhe = [
+        {
+            'lancamento': {'data': p.lancamento.data},
+            'descricao': p.descricao,
+            'categoria': {'nome': p.categoria.nome, 'cor': p.categoria.cor} if p.categoria else None,
+            'valor': p.valor,
+        }
+        for p in prestacoes_mes.select_related('categoria', 'lancamento')
+    ]
+
+    retiradas_yuri_detalhe = list(lancamentos.filter(
+        tipo='saida', categoria__nome='Retirada Yuri'
+    ).order_by('data').values('data', 'descricao', 'valor'))
+
+    return {
+        'total_entradas': total_entradas,
+        'total_saidas': total_saidas,
+        'lucro_bruto': lucro_bruto,
+        'cat_entradas': cat_entradas,
+        'cat_saidas': cat_saidas,
+        'retirada_renan': retirada_renan,
+        'retirada_renan_liquida': retirada_renan_liquida,
+        'prestacoes_renan': prestacoes_renan,
+        'retirada_yuri': retirada_yuri,
+        'retiradas_yuri_detalhe': retiradas_yuri_detalhe,
+        'custos_operacionais': custos_operacionais,
+        'custos_operacionais_total': custos_operacionais_total,
+        'lucro_liquido': lucro_liquido,
+        'direito_cada': direito_cada,
+        'saldo_yuri': saldo_yuri,
+        'saldo_renan': saldo_renan,
+        'prestacoes_detalhe': prestacoes_detalhe,
+    }
+
+
+def relatorio_mensal(empresa, mes, ano):
+    """Retorna (dados, fechamento): do snapshot se o mês estiver fechado, senão calculado."""
+    fechamento = FechamentoMes.objects.filter(empresa=empresa, mes=mes, ano=ano).first()
+    if fechamento and 'relatorio' in fechamento.snapshot:
+        return _descongelar(fechamento.snapshot['relatorio']), fechamento
+    return calcular_relatorio_mensal(empresa, mes, ano), fechamento
+
+
+def relatorios_fechados(empresa):
+    """{(ano, mes): dados} dos relatórios congelados da empresa (uma consulta)."""
+    return {
+        (f.ano, f.mes): _descongelar(f.snapshot['relatorio'])
+        for f in FechamentoMes.objects.filter(empresa=empresa)
+        if 'relatorio' in f.snapshot
+    }
+
+
+def fechar_mes(empresa, mes, ano, pessoa=None):
+    """Congela os relatórios do mês e bloqueia novos lançamentos/edições no período."""
+    mes_ref = date(ano, mes, 1)
+    if not mes_encerrado(mes_ref):
+        raise ValueError('Só é possível fechar meses anteriores ao mês atual.')
+
+    celula = consultar_celulas([empresa.id], mes_ref, mes_ref).get((empresa.id, mes_ref), {})
+    snapshot = {
+        'versao': VERSAO_SNAPSHOT,
+        'relatorio': _congelar(calcular_relatorio_mensal(empresa, mes, ano)),
+        'dre': {linha: str(valor) for linha, valor in celula.items()},
+    }
+    fechamento, _ = FechamentoMes.objects.get_or_create(
+        empresa=empresa, mes=mes, ano=ano,
+        defaults={'snapshot': snapshot, 'fechado_por': pessoa},
+    )
+    return fechamento
+
+
+def reabrir_mes(fechamento):
+    """Remove o fechamento: o mês volta a aceitar alterações e a ser calculado."""
+    fechamento.delete()
+
+
+def filtrar_periodos_abertos(lancamentos):
+    """Remove do queryset os lançamentos que caem em meses fechados."""
+    fechado = FechamentoMes.objects.filter(
+        empresa_id=OuterRef('empresa_id'),
+        ano=ExtractYear(OuterRef('data')),
+        mes=ExtractMonth(OuterRef('data')),
+    )
+    return lancamentos.exclude(Exists(fechado))
@@ -0,0 +1,6 @@
+"""Formatação de valores para textos gerados fora dos templates (WhatsApp)."""
+
+
+def formatar_brl(valor):
+    """Valor em reais no padrão brasileiro: `R$ 1.234,56`."""
+    return f'R$ {valor:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')
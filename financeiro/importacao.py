@@ -0,0 +1,337 @@
+"""
+Importação de extratos bancários em lote.
+
+Cada linha do extrato recebe uma impressão digital (conta, data, valor,
+descrição normalizada e índice de ocorrência) gravada em
+`Lancamento.hash_importacao`, que é único. Linhas idênticas no mesmo arquivo
+(duas tarifas iguais no mesmo dia) ganham índices 0, 1, ... e continuam
+distintas; importar o mesmo arquivo de novo gera os mesmos hashes e nada é
+duplicado. Linhas de OFX trazem o FITID do banco, que já identifica a
+transação: o hash delas é só (conta, FITID).
+
+O preview parseia o arquivo uma vez e guarda as linhas numa
+`SessaoImportacao` (JSON compactado, com validade); a confirmação importa da
+sessão, aplicando as linhas removidas/editadas no preview.
+
+O mapa de colunas detectado para cada header fica salvo em `LayoutExtrato`
+da conta; no mês seguinte o mesmo header é parseado direto com ele, e o
+usuário pode corrigir um layout detectado errado uma única vez.
+
+Extratos PDF são processados em segundo plano (`processar_pdf_extrato`, via
+`tarefas.iniciar_tarefa`), com as páginas extraídas em paralelo.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import secrets
+import tempfile
+import time
+import unicodedata
+import zlib
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import Pessoa
+
+from .dre import criar_lancamentos
+from .models import ContaBancaria, FechamentoMes, LayoutExtrato, Lancamento, SessaoImportacao, TipoLancamento
+
+TAMANHO_LOTE = 1000
+VALIDADE_SESSAO = timedelta(hours=2)
+
+
+def normalizar_descricao(descricao):
+    """Minúsculas, sem acentos e com espaços colapsados."""
+    texto = unicodedata.normalize('NFKD', descricao or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', texto).strip().lower()
+
+
+def calcular_hash(conta_id, data, valor, descricao, ocorrencia):
+    chave = f'{conta_id}|{data.isoformat()}|{Decimal(valor):.2f}|{normalizar_descricao(descricao)}|{ocorrencia}'
+    return hashlib.sha256(chave.encode('utf-8')).hexdigest()
+
+
+def calcular_hash_fitid(conta_id, fitid):
+    return hashlib.sha256(f'{conta_id}|fitid|{fitid.strip()}'.encode('utf-8')).hexdigest()
+
+
+def _validar(item):
+    """Motivo da rejeição da linha, ou None se ela é importável."""
+    if not item.get('data'):
+        return 'sem data'
+    if item.get('valor') in (None, '') or Decimal(item['valor']) == 0:
+        return 'sem valor'
+    return None
+
+
+def importar_lancamentos(conta, itens, pessoa=None, observacao='', tamanho_lote=TAMANHO_LOTE):
+    """
+    Grava as linhas do extrato como lançamentos da conta, em lotes, numa
+    única transação.
+
+    `itens` são os dicts de `parse_extrato`/`iter_extrato` ({'data',
+    'descricao', 'valor'}, valor com sinal, e 'fitid' opcional),
+    consumidos em streaming. Retorna dict com contadores: criados,
+    duplicados, rejeitados (sem data/valor ou em mês fechado) e os motivos
+    das rejeições.
+    """
+    stats = {'criados': 0, 'duplicados': 0, 'rejeitados': 0, 'motivos': Counter()}
+    meses_fechados = set(FechamentoMes.objects.filter(empresa=conta.empresa).values_list('ano', 'mes'))
+    ocorrencias = Counter()
+
+    def _gravar(lote):
+        existentes = set(
+            Lancamento.objects.filter(hash_importacao__in=[l.hash_importacao for l in lote])
+            .values_list('hash_importacao', flat=True)
+        )
+        novos = [l for l in lote if l.hash_importacao not in existentes]
+        # ignore_conflicts cobre importações simultâneas do mesmo arquivo
+        criar_lancamentos(novos, ignore_conflicts=True)
+        stats['criados'] += len(novos)
+        stats['duplicados'] += len(lote) - len(novos)
+
+    with transaction.atomic():
+        lote = []
+        for item in itens:
+            motivo = _validar(item)
+            if not motivo and (item['data'].year, item['data'].month) in meses_fechados:
+                motivo = 'mês fechado'
+            if motivo:
+                stats['rejeitados'] += 1
+                stats['motivos'][motivo] += 1
+                continue
+
+            valor = Decimal(item['valor'])
+            descricao = (item.get('descricao') or '')[:300]
+            if item.get('fitid'):
+                hash_importacao = calcular_hash_fitid(conta.id, item['fitid'])
+            else:
+                base = (item['data'], valor, normalizar_descricao(descricao))
+                hash_importacao = calcular_hash(conta.id, item['data'], valor, descricao, ocorrencias[base])
+                ocorrencias[base] += 1
+
+            lote.append(Lancamento(
+                empresa=conta.empresa,
+                conta=conta,
+                tipo=TipoLancamento.ENTRADA if valor > 0 else TipoLancamento.SAIDA,
+                descricao=descricao,
+                valor=abs(valor),
+                data=item['data'],
+                observacao=observacao,
+                criado_por=pessoa,
+                hash_importacao=hash_importacao,
+            ))
+            if len(lote) >= tamanho_lote:
+                _gravar(lote)
+                lote = []
+        if lote:
+            _gravar(lote)
+
+    stats['motivos'] = dict(stats['motivos'])
+    return stats
+
+
+# =====================================================
+# SESSÕES DE IMPORTAÇÃO (preview -> confirmação)
+# =====================================================
+
+def _serializar_linhas(itens):
+    """
+    Linhas como [data ISO, valor, descrição(, fitid)], JSON compactado.
+    Consome `itens` em streaming; retorna (bytes, quantidade de linhas).
+    """
+    compressor = zlib.compressobj()
+    partes = [compressor.compress(b'[')]
+    total = 0
+    for i in itens:
+        linha = [i['data'].isoformat(), str(i['valor']), i['descricao']]
+        if i.get('fitid'):
+            linha.append(i['fitid'])
+        linha = json.dumps(linha, ensure_ascii=False, separators=(',', ':'))
+        partes.append(compressor.compress(((',' if total else '') + linha).encode('utf-8')))
+        total += 1
+    partes.append(compressor.compress(b']'))
+    partes.append(compressor.flush())
+    return b''.join(partes), total
+
+
+def _deserializar_linhas(dados):
+    compactas = json.loads(zlib.decompress(bytes(dados)).decode('utf-8'))
+    linhas = []
+    for d, v, desc, *fitid in compactas:
+        linha = {'data': date.fromisoformat(d), 'valor': Decimal(v), 'descricao': desc}
+        if fitid:
+            linha['fitid'] = fitid[0]
+        linhas.append(linha)
+    return linhas
+
+
+def criar_sessao(conta, itens, pessoa, arquivo_nome, layout=None):
+    """
+    Guarda as linhas parseadas e retorna a sessão (remove sessões vencidas).
+    `itens` pode ser um gerador (iter_extrato): é consumido uma única vez.
+    `layout` é o dict preenchido pelo iter_extrato; é registrado na conta.
+    """
+    linhas, total = _serializar_linhas(itens)
+    SessaoImportacao.objects.filter(expira_em__lt=timezone.now()).delete()
+    return SessaoImportacao.objects.create(
+        token=secrets.token_urlsafe(32),
+        conta=conta,
+        criado_por=pessoa,
+        arquivo_nome=arquivo_nome[:255],
+        linhas=linhas,
+        total_linhas=total,
+        layout=registrar_layout(conta, layout) if total else None,
+        expira_em=timezone.now() + VALIDADE_SESSAO,
+    )
+
+
+def obter_sessao(token, pessoa):
+    """Sessão válida do usuário, ou None se não existe/expirou."""
+    if not token:
+        return None
+    return SessaoImportacao.objects.select_related('conta', 'conta__empresa').filter(
+        token=token, criado_por=pessoa, expira_em__gte=timezone.now(),
+    ).first()
+
+
+def linhas_da_sessao(sessao, removidas=(), edicoes=None):
+    """
+    Linhas da sessão com as alterações do preview aplicadas.
+
+    `removidas` são índices de linhas desmarcadas; `edicoes` é
+    {indice: {'data': date, 'descricao': str, 'valor': Decimal}} (só os campos
+    alterados). Linhas editadas para valores inválidos caem na validação da
+    importação como rejeitadas.
+    """
+    removidas = set(removidas)
+    edicoes = edicoes or {}
+    linhas = []
+    for i, linha in enumerate(_deserializar_linhas(sessao.linhas)):
+        if i in removidas:
+            continue
+        linha.update(edicoes.get(i, {}))
+        linhas.append(linha)
+    return linhas
+
+
+# =====================================================
+# LAYOUTS DE EXTRATO
+# =====================================================
+
+CAMPOS_LAYOUT = ('data', 'descricao', 'valor', 'valor_saida')
+
+
+def layouts_da_conta(conta):
+    """{assinatura: colunas} dos layouts conhecidos da conta (para iter_extrato)."""
+    return dict(LayoutExtrato.objects.filter(conta=conta).values_list('assinatura', 'colunas'))
+
+
+def registrar_layout(conta, layout):
+    """
+    Salva o layout usado no parse (dict preenchido por iter_extrato) e conta
+    o uso. Retorna o LayoutExtrato, ou None se o parse não achou header.
+    """
+    if not layout or not layout.get('assinatura'):
+        return None
+    obj, _ = LayoutExtrato.objects.get_or_create(
+        conta=conta, assinatura=layout['assinatura'],
+        defaults={'header': layout['header'], 'colunas': layout['colunas']},
+    )
+    LayoutExtrato.objects.filter(id=obj.id).update(usos=F('usos') + 1)
+    return obj
+
+
+def corrigir_layout(layout, colunas):
+    """
+    Grava o mapa de colunas informado pelo usuário ({campo: índice|None}).
+    Data, descrição e valor são obrigatórios; levanta ValueError se faltar
+    algum ou se um índice não existe no header.
+    """
+    novo = {}
+    for campo in CAMPOS_LAYOUT:
+        indice = colunas.get(campo)
+        if indice is not None and not 0 <= indice < len(layout.header):
+            raise ValueError('Coluna inválida para o layout.')
+        novo[campo] = indice
+    if any(novo[c] is None for c in ('data', 'descricao', 'valor')):
+        raise ValueError('Informe as colunas de data, descrição e valor.')
+    layout.colunas = novo
+    layout.corrigido = True
+    layout.save(update_fields=['colunas', 'corrigido', 'atualizado_em'])
+    return layout
+
+
+# =====================================================
+# PDF EM SEGUNDO PLANO
+# =====================================================
+
+# Arquivo temporário do PDF enviado, removido pela tarefa ao final
+PREFIXO_PDF_TEMP = 'extrato_pdf_'
+# PDF temporário mais velho que isso sobrou de uma tarefa interrompida
+TEMPO_PDF_ORFAO = timedelta(hours=6)
+
+
+def salvar_pdf_temporario(arquivo):
+    """Grava o upload num arquivo temporário para a tarefa; retorna o caminho."""
+    with tempfile.NamedTemporaryFile(prefix=PREFIXO_PDF_TEMP, suffix='.pdf', delete=False) as tmp:
+        for chunk in arquivo.chunks():
+            tmp.write(chunk)
+    return tmp.name
+
+
+def remover_pdfs_orfaos():
+    """Remove PDFs temporários de tarefas que morreram sem apagá-los. Retorna quantos."""
+    limite = time.time() - TEMPO_PDF_ORFAO.total_seconds()
+    removidos = 0
+    for caminho in glob.glob(os.path.join(tempfile.gettempdir(), f'{PREFIXO_PDF_TEMP}*.pdf')):
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+                removidos += 1
+        except OSError:
+            pass
+    return removidos
+
+
+def processar_pdf_extrato(caminho, conta_id, pessoa_id, arquivo_nome, preview, progresso):
+    """
+    Tarefa de importação de extrato PDF (ver `tarefas.iniciar_tarefa`).
+
+    Parseia o arquivo temporário em `caminho` (removido ao final) e cria a
+    sessão de preview ou importa direto. Retorna {'sessao': token,
+    'total_linhas': n} ou {'conta': id, 'importacao': stats}.
+    """
+    from .extrato import parse_pdf
+
+    try:
+        conta = ContaBancaria.objects.select_related('empresa').get(id=conta_id)
+        pessoa = Pessoa.objects.filter(id=pessoa_id).first()
+
+        def _paginas(feitas, total):
+            # 90% para a extração; o restante para gravar
+            progresso(feitas * 90 // max(total, 1), f'Página {feitas} de {total}')
+
+        lancamentos = parse_pdf(caminho, progresso=_paginas)
+        progresso(95, 'Gravando lançamentos')
+        if preview:
+            sessao = criar_sessao(conta, lancamentos, pessoa, arquivo_nome)
+            if not sessao.total_linhas:
+                sessao.delete()
+            return {'sessao': sessao.token if sessao.total_linhas else None, 'total_linhas': sessao.total_linhas}
+        return {'conta': conta.id, 'importacao': importar_lancamentos(
+            conta, lancamentos, pessoa, observacao=f'Importado do extrato: {arquivo_nome}',
+        )}
+    finally:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
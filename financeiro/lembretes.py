@@ -0,0 +1,103 @@
+"""
+Lembretes de vencimento para clientes das contas a receber.
+
+Uma consulta seleciona os itens em aberto, ainda não notificados, que
+vencem entre hoje e hoje + `dias_antecedencia` da própria conta (com
+`notificar_cliente` ligado). Os itens de um mesmo cliente viram uma única
+mensagem; as mensagens saem pelo envio em lote do WhatsApp e os itens
+entregues são marcados como notificados num único UPDATE.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import DateField, ExpressionWrapper, F, Value
+from django.utils import timezone
+
+from .formatacao import formatar_brl
+from .models import ContaReceberItem
+
+
+def itens_para_lembrete(hoje=None):
+    """Itens a avisar hoje, já com conta, cliente e empresa (uma consulta)."""
+    hoje = hoje or timezone.localdate()
+    limite = ExpressionWrapper(
+        Value(hoje) + F('conta_receber__dias_antecedencia') * Value(timedelta(days=1)),
+        output_field=DateField(),
+    )
+    return ContaReceberItem.objects.filter(
+        conta_receber__notificar_cliente=True,
+        conta_receber__ativo=True,
+        conta_receber__cliente__isnull=False,
+        conta_receber__cliente__receber_lembretes=True,
+        recebido=False,
+        notificado=False,
+        data_vencimento__gte=hoje,
+        data_vencimento__lte=limite,
+    ).exclude(status='cancelado').select_related(
+        'conta_receber', 'conta_receber__cliente', 'conta_receber__empresa',
+    ).order_by('conta_receber__cliente_id', 'data_vencimento')
+
+
+def _linha(item):
+    conta = item.conta_receber
+    descricao = conta.descricao
+    if item.parcela_numero and conta.total_parcelas > 1:
+        descricao = f'{descricao} (parcela {item.parcela_numero}/{conta.total_parcelas})'
+    return f'• {descricao} - {formatar_brl(item.valor)} - vence {item.data_vencimento.strftime("%d/%m/%Y")}'
+
+
+def montar_mensagem_lembrete_receber(cliente, itens):
+    empresas = sorted({i.conta_receber.empresa.nome for i in itens})
+    linhas = [
+        f'Olá, {cliente.nome.split()[0]}!',
+        '',
+        'Lembrete de vencimento:' if len(itens) == 1 else 'Lembrete dos próximos vencimentos:',
+    ]
+    linhas += [_linha(i) for i in itens]
+    linhas += ['', 'Se já pagou, por favor desconsidere esta mensagem.', f'*{", ".join(empresas)}*']
+    return '\n'.join(linhas)
+
+
+def enviar_lembretes_receber(hoje=None):
+    """
+    Envia os lembretes do dia no tenant atual e marca os itens entregues.
+    Retorna dict com itens, enviados, erros e sem_telefone.
+    """
+    from notifications.models import NotificacaoWhatsApp, TipoNotificacao
+    from notifications.wapi import enviar_mensagens_em_lote
+
+    resultado = {'itens': 0, 'enviados': 0, 'erros': 0, 'sem_telefone': 0}
+    por_cliente = defaultdict(list)
+    for item in itens_para_lembrete(hoje):
+        por_cliente[item.conta_receber.cliente].append(item)
+        resultado['itens'] += 1
+
+    envios = []
+    for cliente, itens in por_cliente.items():
+        if not cliente.telefone:
+            resultado['sem_telefone'] += len(itens)
+            continue
+        envios.append((cliente, itens, cliente.telefone_formatado(), montar_mensagem_lembrete_receber(cliente, itens)))
+    if not envios:
+        return resultado
+
+    resultados = enviar_mensagens_em_lote([(telefone, mensagem) for _, _, telefone, mensagem in envios])
+
+    agora = timezone.now()
+    entregues = []
+    registros = []
+    for (cliente, itens, telefone, mensagem), envio in zip(envios, resultados):
+        registros.append(NotificacaoWhatsApp(
+            pessoa=cliente, tipo=TipoNotificacao.LEMBRETE, mensagem=mensagem, telefone=telefone,
+            enviado=envio['success'], enviado_em=agora if envio['success'] else None,
+            erro='' if envio['success'] else envio.get('error', 'Erro desconhecido'),
+        ))
+        if envio['success']:
+            entregues += [i.id for i in itens]
+            resultado['enviados'] += 1
+        else:
+            resultado['erros'] += 1
+
+    NotificacaoWhatsApp.objects.bulk_create(registros, batch_size=500)
+    ContaReceberItem.objects.filter(id__in=entregues).update(notificado=True, notificado_em=agora)
+    return resultado
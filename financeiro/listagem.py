@@ -0,0 +1,115 @@
+"""
+Listagem paginada de lançamentos.
+
+A lista usa paginação por cursor (keyset) sobre (data, criado_em, id), a
+mesma ordem da tela, em vez de OFFSET: cada página é uma busca no índice a
+partir da última linha vista, com custo constante em qualquer ponto do mês,
+e lançamentos criados enquanto o usuário navega não deslocam as páginas.
+O cursor é opaco na URL (`?apos=` avança, `?antes=` volta).
+
+Os filtros da tela viram WHERE e os totais saem de um único aggregate com
+somas condicionais sobre o mesmo queryset filtrado.
+"""
+import base64
+from datetime import date, datetime
+
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+LANCAMENTOS_POR_PAGINA = 100
+
+_ORDEM = ('-data', '-criado_em', '-id')
+_ORDEM_INVERSA = ('data', 'criado_em', 'id')
+
+
+def codificar_cursor(lancamento):
+    chave = f'{lancamento.data.isoformat()}|{lancamento.criado_em.isoformat()}|{lancamento.id}'
+    return base64.urlsafe_b64encode(chave.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """(data, criado_em, id) do cursor, ou None se inválido."""
+    try:
+        chave = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        data, criado_em, pk = chave.split('|')
+        return date.fromisoformat(data), datetime.fromisoformat(criado_em), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _apos(chave):
+    """Linhas depois da chave na ordem decrescente da lista."""
+    data, criado_em, pk = chave
+    return (
+        Q(data__lt=data)
+        | Q(data=data, criado_em__lt=criado_em)
+        | Q(data=data, criado_em=criado_em, id__lt=pk)
+    )
+
+
+def _antes(chave):
+    data, criado_em, pk = chave
+    return (
+        Q(data__gt=data)
+        | Q(data=data, criado_em__gt=criado_em)
+        | Q(data=data, criado_em=criado_em, id__gt=pk)
+    )
+
+
+def filtrar_lancamentos(queryset, params):
+    """
+    Aplica os filtros opcionais da tela (categoria, conta, projeto,
+    sem_categoria e busca `q` em descrição/observação). Ids inválidos são
+    ignorados.
+    """
+    for campo in ('categoria', 'conta', 'projeto'):
+        valor = params.get(campo, '')
+        if valor.isdigit():
+            queryset = queryset.filter(**{f'{campo}_id': int(valor)})
+    if params.get('sem_categoria'):
+        queryset = queryset.filter(categoria__isnull=True)
+    busca = params.get('q', '').strip()
+    if busca:
+        queryset = queryset.filter(Q(descricao__icontains=busca) | Q(observacao__icontains=busca))
+    return queryset
+
+
+def totais_lancamentos(queryset):
+    """Entradas, saídas, saldo e quantidade do queryset numa consulta."""
+    zero = Value(0, output_field=DecimalField(max_digits=14, decimal_places=2))
+    totais = queryset.order_by().aggregate(
+        entradas=Coalesce(Sum('valor', filter=Q(tipo='entrada')), zero),
+        saidas=Coalesce(Sum('valor', filter=Q(tipo='saida')), zero),
+        quantidade=Count('id'),
+    )
+    totais['saldo'] = totais['entradas'] - totais['saidas']
+    return totais
+
+
+def pagina_lancamentos(queryset, apos=None, antes=None, por_pagina=LANCAMENTOS_POR_PAGINA):
+    """
+    Uma página da lista a partir do cursor. Retorna dict com `itens`,
+    `proximo` e `anterior` (cursores das páginas vizinhas, ou None).
+    """
+    chave_apos = decodificar_cursor(apos) if apos else None
+    chave_antes = decodificar_cursor(antes) if antes and not chave_apos else None
+
+    if chave_antes:
+        # Volta: lê as linhas anteriores em ordem inversa e desvira
+        itens = list(queryset.filter(_antes(chave_antes)).order_by(*_ORDEM_INVERSA)[:por_pagina + 1])
+        tem_anterior = len(itens) > por_pagina
+        itens = itens[:por_pagina][::-1]
+        tem_proximo = True
+    else:
+        if chave_apos:
+            queryset = queryset.filter(_apos(chave_apos))
+        itens = list(queryset.order_by(*_ORDEM)[:por_pagina + 1])
+        tem_proximo = len(itens) > por_pagina
+        itens = itens[:por_pagina]
+        tem_anterior = chave_apos is not None
+
+    return {
+        'itens': itens,
+        'proximo': codificar_cursor(itens[-1]) if itens and tem_proximo else None,
+        'anterior': codificar_cursor(itens[0]) if itens and tem_anterior else None,
+    }
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from financeiro.services import atualizar_status_receber
+from financeiro.tarefas import no_schema, schemas_ativos
+
+
+class Command(BaseCommand):
+    help = "Marca como 'atrasado' os itens a receber pendentes já vencidos (todos os tenants)"
+
+    def handle(self, *args, **options):
+        for schema in schemas_ativos():
+            prefixo = f'[{schema}] ' if schema else ''
+            try:
+                with no_schema(schema):
+                    atrasados = atualizar_status_receber()
+                self.stdout.write(self.style.SUCCESS(f'{prefixo}{atrasados} item(ns) marcado(s) como atrasado(s).'))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'{prefixo}Erro: {e}'))
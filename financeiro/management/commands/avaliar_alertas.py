@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from financeiro.alertas import avaliar_alertas
+from financeiro.tarefas import no_schema, schemas_ativos
+
+
+class Command(BaseCommand):
+    help = 'Avalia os alertas financeiros ativos de todos os tenants e envia os novos por WhatsApp'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sem-envio', action='store_true',
+            help='Só avalia e registra o histórico, sem enviar WhatsApp',
+        )
+
+    def handle(self, *args, **options):
+        for schema in schemas_ativos():
+            prefixo = f'[{schema}] ' if schema else ''
+            try:
+                with no_schema(schema):
+                    resultado = avaliar_alertas(enviar=not options['sem_envio'])
+                self.stdout.write(self.style.SUCCESS(
+                    f'{prefixo}{resultado["alertas"]} alertas, {resultado["ocorrencias"]} novos, '
+                    f'{resultado["enviados"]} mensagens enviadas, {resultado["erros"]} erros.'
+                ))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'{prefixo}Erro: {e}'))
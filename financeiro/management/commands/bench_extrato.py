@@ -0,0 +1,74 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from financeiro.extrato import (
+    AMOSTRA_PERFIL, _CONVERSORES_GENERICOS, _detectar_colunas, _iter_lancamentos, _row_para_lancamento,
+)
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark do parse de extrato: conversão célula a célula x perfil de colunas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--linhas', type=int, default=100_000,
+            help='Quantidade de linhas do extrato sintético (padrão: 100000)',
+        )
+        parser.add_argument(
+            '--repeticoes', type=int, default=3,
+            help='Execuções de cada variante; vale o melhor tempo (padrão: 3)',
+        )
+
+    def handle(self, *args, **options):
+        header = ['Data', 'Descrição', 'Valor']
+        inicio = date(2025, 1, 1)
+        rows = [header] + [
+            [
+                (inicio + timedelta(days=i % 365)).strftime('%d/%m/%Y'),
+                f'PIX RECEBIDO CLIENTE {i}',
+                f'{"-" if i % 3 else ""}{(i * 37) % 9000 + 1:,}.{i % 100:02d}'.replace(',', 'X').replace('.', ',').replace('X', '.'),
+            ]
+            for i in range(options['linhas'])
+        ]
+        col = _detectar_colunas(header)
+
+        def generico():
+            return [l for l in (_row_para_lancamento(r, col, _CONVERSORES_GENERICOS) for r in rows[1:]) if l]
+
+        def perfilado():
+            return list(_iter_lancamentos(rows))
+
+        tempos = {}
+        resultados = {}
+        for nome, funcao in (('célula a célula', generico), ('perfil de colunas', perfilado)):
+            melhor = None
+            for _ in range(options['repeticoes']):
+                t0 = time.perf_counter()
+                resultados[nome] = funcao()
+                duracao = time.perf_counter() - t0
+                melhor = duracao if melhor is None else min(melhor, duracao)
+            tempos[nome] = melhor
+            self.stdout.write(f'{nome:>20}: {melhor:.3f}s ({len(resultados[nome])} lançamentos)')
+
+        if resultados['célula a célula'] != resultados['perfil de colunas']:
+            self.stdout.write(self.style.ERROR('Resultados diferentes entre as variantes!'))
+            return
+
+        # Arquivos com valores no outro padrão depois da amostra do perfil
+        for nome, amostra, resto in (
+            ('misto br', '1.234,56', ['1234.56', '-45.90', '12,5', '1.234']),
+            ('misto us', '1234.56', ['-45,90', '1.234,56', '12.5', '1,234']),
+        ):
+            misto = [header] + [
+                [inicio.strftime('%d/%m/%Y'), f'LINHA {i}',
+                 amostra if i < AMOSTRA_PERFIL else resto[i % len(resto)]]
+                for i in range(AMOSTRA_PERFIL * 2)
+            ]
+            esperado = [l for l in (_row_para_lancamento(r, col, _CONVERSORES_GENERICOS) for r in misto[1:]) if l]
+            if esperado != list(_iter_lancamentos(misto)):
+                self.stdout.write(self.style.ERROR(f'Resultados diferentes no arquivo {nome}!'))
+                return
+        ganho = tempos['célula a célula'] / tempos['perfil de colunas']
+        self.stdout.write(self.style.SUCCESS(f'Mesmo resultado; perfil de colunas {ganho:.1f}x mais rápido.'))
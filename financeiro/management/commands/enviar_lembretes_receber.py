@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from financeiro.lembretes import enviar_lembretes_receber
+from financeiro.tarefas import no_schema, schemas_ativos
+
+
+class Command(BaseCommand):
+    help = 'Envia lembretes de vencimento aos clientes das contas a receber (todos os tenants)'
+
+    def handle(self, *args, **options):
+        for schema in schemas_ativos():
+            prefixo = f'[{schema}] ' if schema else ''
+            try:
+                with no_schema(schema):
+                    resultado = enviar_lembretes_receber()
+                self.stdout.write(self.style.SUCCESS(
+                    f'{prefixo}{resultado["itens"]} itens, {resultado["enviados"]} mensagens enviadas, '
+                    f'{resultado["erros"]} erros, {resultado["sem_telefone"]} sem telefone.'
+                ))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'{prefixo}Erro: {e}'))
@@ -1,48 +1,62 @@
+import time
 from datetime import date, timedelta
 
 from django.core.management.base import BaseCommand
 
-from financeiro.models import ConfigMercadoPago
-from financeiro.services import sync_mercadopago
+from financeiro.orquestrador_mp import MP_SYNC_WORKERS, sincronizar_todos
 
 
 class Command(BaseCommand):
-    help = 'Sincroniza pagamentos do Mercado Pago para todas as empresas ativas'
+    help = 'Sincroniza pagamentos do Mercado Pago de todas as empresas ativas, em todos os tenants'
 
     def add_arguments(self, parser):
         parser.add_argument(
-            '--days', type=int, default=1,
-            help='Quantidade de dias para trás (padrão: 1)',
+            '--days', type=int, default=None,
+            help='Reprocessa os últimos N dias (padrão: sync incremental pelos cursores de cada config)',
         )
         parser.add_argument(
             '--empresa', type=int, default=None,
             help='ID da empresa específica (padrão: todas ativas)',
         )
+        parser.add_argument(
+            '--schema', action='append', default=None,
+            help='Schema do tenant (pode repetir; padrão: todos os tenants ativos)',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=MP_SYNC_WORKERS,
+            help=f'Syncs simultâneas (padrão: {MP_SYNC_WORKERS})',
+        )
 
     def handle(self, *args, **options):
         days = options['days']
-        empresa_id = options['empresa']
-        data_fim = date.today()
-        data_inicio = data_fim - timedelta(days=days)
-
-        configs = ConfigMercadoPago.objects.filter(ativo=True).select_related('empresa')
-        if empresa_id:
-            configs = configs.filter(empresa_id=empresa_id)
-
-        if not configs.exists():
+        data_fim = date.today() if days else None
+        data_inicio = data_fim - timedelta(days=days) if days else None
+        janela = f'{data_inicio} a {data_fim}' if days else 'incremental'
+
+        def _mostrar(resumo):
+            nome = f'[{resumo["schema"]}] {resumo["empresa"]}' if resumo['schema'] else resumo['empresa']
+            if resumo['status'] == 'erro':
+                self.stdout.write(self.style.ERROR(f'{nome}: Erro: {resumo["erro"]}'))
+                return
+            self.stdout.write(self.style.SUCCESS(
+                f'{nome} ({janela}, {resumo["duracao"]:.1f}s, {resumo["paginas"]} páginas): '
+                f'{resumo["criados"]} vendas, {resumo["taxas"]} taxas, '
+                f'{resumo["estornos"]} estornos, {resumo["ignorados"]} ignorados.'
+            ))
+            for err in resumo['erro'].splitlines():
+                self.stdout.write(self.style.WARNING(f'  Aviso: {err}'))
+
+        inicio = time.monotonic()
+        lote, resumos = sincronizar_todos(
+            data_inicio, data_fim, empresa_id=options['empresa'], schemas=options['schema'],
+            workers=options['workers'], ao_concluir=_mostrar,
+        )
+        if not resumos:
             self.stdout.write(self.style.WARNING('Nenhuma configuração MP ativa encontrada.'))
             return
 
-        for config in configs:
-            self.stdout.write(f'Sincronizando {config.empresa.nome} ({data_inicio} a {data_fim})...')
-            try:
-                stats = sync_mercadopago(config, data_inicio, data_fim)
-                self.stdout.write(self.style.SUCCESS(
-                    f'  {stats["criados"]} vendas, {stats["taxas"]} taxas, '
-                    f'{stats["estornos"]} estornos, {stats["ignorados"]} ignorados.'
-                ))
-                if stats['erros']:
-                    for err in stats['erros']:
-                        self.stdout.write(self.style.WARNING(f'  Aviso: {err}'))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'  Erro: {e}'))
+        erros = sum(1 for r in resumos if r['status'] == 'erro')
+        self.stdout.write(
+            f'Lote {lote}: {len(resumos)} empresa(s) em {time.monotonic() - inicio:.1f}s, '
+            f'{erros} com erro.'
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0012_add_alertas_financeiros'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categorialancamento',
+            name='linha_dre',
+            field=models.CharField(blank=True, choices=[('receita', 'Receita Bruta'), ('deducao', 'Deduções (Taxas, Impostos)'), ('custo_operacional', 'Custos Operacionais'), ('nao_operacional', 'Despesas Não Operacionais (Retiradas)')], help_text='Linha do DRE (vazio = automático pelo tipo/nome)', max_length=20),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_alter_pessoa_user_set_null'),
+        ('financeiro', '0013_add_linha_dre_categoria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FechamentoMes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.IntegerField(help_text='Mês (1-12)')),
+                ('ano', models.IntegerField(help_text='Ano')),
+                ('snapshot', models.JSONField(default=dict, help_text='Relatórios congelados no fechamento')),
+                ('fechado_em', models.DateTimeField(auto_now_add=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fechamentos', to='core.empresa')),
+                ('fechado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='fechamentos_financeiros', to='core.pessoa')),
+            ],
+            options={
+                'verbose_name': 'Fechamento de Mês',
+                'verbose_name_plural': 'Fechamentos de Mês',
+                'ordering': ['-ano', '-mes'],
+                'unique_together': {('empresa', 'mes', 'ano')},
+            },
+        ),
+    ]
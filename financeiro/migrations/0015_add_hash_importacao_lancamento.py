@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0014_add_fechamento_mes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lancamento',
+            name='hash_importacao',
+            field=models.CharField(blank=True, editable=False, help_text='Impressão digital da linha do extrato importado (evita duplicação)', max_length=64, null=True, unique=True),
+        ),
+    ]
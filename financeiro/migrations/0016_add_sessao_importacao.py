@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_alter_pessoa_user_set_null'),
+        ('financeiro', '0015_add_hash_importacao_lancamento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessaoImportacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, unique=True)),
+                ('arquivo_nome', models.CharField(max_length=255)),
+                ('linhas', models.BinaryField(help_text='Linhas parseadas (JSON compactado com zlib)')),
+                ('total_linhas', models.IntegerField(default=0)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('expira_em', models.DateTimeField()),
+                ('conta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sessoes_importacao', to='financeiro.contabancaria')),
+                ('criado_por', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sessoes_importacao', to='core.pessoa')),
+            ],
+            options={
+                'verbose_name': 'Sessão de Importação',
+                'verbose_name_plural': 'Sessões de Importação',
+                'ordering': ['-criado_em'],
+            },
+        ),
+    ]
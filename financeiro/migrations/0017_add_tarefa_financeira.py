@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_alter_pessoa_user_set_null'),
+        ('financeiro', '0016_add_sessao_importacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarefaFinanceira',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('descricao', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluida', 'Concluída'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('progresso', models.PositiveSmallIntegerField(default=0, help_text='Percentual concluído (0-100)')),
+                ('mensagem', models.CharField(blank=True, max_length=255)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('criado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tarefas_financeiras', to='core.pessoa')),
+            ],
+            options={
+                'verbose_name': 'Tarefa Financeira',
+                'verbose_name_plural': 'Tarefas Financeiras',
+                'ordering': ['-criado_em'],
+            },
+        ),
+    ]
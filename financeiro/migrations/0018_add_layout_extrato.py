@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0017_add_tarefa_financeira'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LayoutExtrato',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('assinatura', models.CharField(help_text='SHA-256 do header normalizado', max_length=64)),
+                ('header', models.JSONField(default=list, help_text='Nomes das colunas do header')),
+                ('colunas', models.JSONField(default=dict, help_text='Índices: data, descricao, valor, valor_saida')),
+                ('corrigido', models.BooleanField(default=False, help_text='Mapa de colunas ajustado pelo usuário')),
+                ('usos', models.PositiveIntegerField(default=0)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('conta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='layouts_extrato', to='financeiro.contabancaria')),
+            ],
+            options={
+                'verbose_name': 'Layout de Extrato',
+                'verbose_name_plural': 'Layouts de Extrato',
+                'ordering': ['conta', '-atualizado_em'],
+                'unique_together': {('conta', 'assinatura')},
+            },
+        ),
+        migrations.AddField(
+            model_name='sessaoimportacao',
+            name='layout',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sessoes', to='financeiro.layoutextrato'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0018_add_layout_extrato'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contareceberitem',
+            name='nosso_numero',
+            field=models.CharField(blank=True, db_index=True, help_text='Nosso número do boleto (só dígitos, sem zeros à esquerda)', max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0019_add_nosso_numero_conta_receber_item'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configmercadopago',
+            name='cursor_aprovacao',
+            field=models.DateTimeField(blank=True, help_text='Último date_approved importado', null=True),
+        ),
+        migrations.AddField(
+            model_name='configmercadopago',
+            name='cursor_atualizacao',
+            field=models.DateTimeField(blank=True, help_text='Último date_last_updated processado (estornos, chargebacks)', null=True),
+        ),
+        migrations.AddField(
+            model_name='configmercadopago',
+            name='cursor_payment_id',
+            field=models.BigIntegerField(blank=True, help_text='ID do último pagamento em cursor_aprovacao (desempate)', null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0020_add_cursor_sync_mercadopago'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecucaoSyncMP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lote', models.CharField(db_index=True, max_length=32)),
+                ('incremental', models.BooleanField(default=True)),
+                ('iniciado_em', models.DateTimeField()),
+                ('duracao', models.FloatField(default=0, help_text='Segundos')),
+                ('paginas', models.PositiveIntegerField(default=0)),
+                ('criados', models.PositiveIntegerField(default=0)),
+                ('taxas', models.PositiveIntegerField(default=0)),
+                ('estornos', models.PositiveIntegerField(default=0)),
+                ('ignorados', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('ok', 'OK'), ('parcial', 'Parcial'), ('erro', 'Erro')], default='ok', max_length=10)),
+                ('erro', models.TextField(blank=True)),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='execucoes', to='financeiro.configmercadopago')),
+            ],
+            options={
+                'verbose_name': 'Execução Sync MP',
+                'verbose_name_plural': 'Execuções Sync MP',
+                'ordering': ['-iniciado_em'],
+                'indexes': [models.Index(fields=['config', 'iniciado_em'], name='financeiro__config__9313ce_idx')],
+            },
+        ),
+    ]
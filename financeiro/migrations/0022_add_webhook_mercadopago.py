@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:44
+
+import secrets
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def gerar_tokens_webhook(apps, schema_editor):
+    ConfigMercadoPago = apps.get_model('financeiro', 'ConfigMercadoPago')
+    for config in ConfigMercadoPago.objects.filter(webhook_token=''):
+        config.webhook_token = secrets.token_urlsafe(32)
+        config.save(update_fields=['webhook_token'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0021_add_execucao_sync_mp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configmercadopago',
+            name='webhook_token',
+            field=models.CharField(blank=True, db_index=True, help_text='Identifica a config na URL do webhook de notificações', max_length=64),
+        ),
+        migrations.RunPython(gerar_tokens_webhook, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='NotificacaoMP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.CharField(max_length=30)),
+                ('acao', models.CharField(blank=True, help_text='Ex: payment.created, payment.updated', max_length=50)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('processada', 'Processada'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('erro', models.TextField(blank=True)),
+                ('recebido_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('processado_em', models.DateTimeField(blank=True, null=True)),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificacoes', to='financeiro.configmercadopago')),
+            ],
+            options={
+                'verbose_name': 'Notificação MP',
+                'verbose_name_plural': 'Notificações MP',
+                'ordering': ['-recebido_em'],
+                'indexes': [models.Index(fields=['status', 'recebido_em'], name='financeiro__status_c6dc49_idx')],
+            },
+        ),
+    ]
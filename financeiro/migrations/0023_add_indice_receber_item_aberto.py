@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0022_add_webhook_mercadopago'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contareceberitem',
+            index=models.Index(condition=models.Q(('recebido', False)), fields=['status', 'data_vencimento'], name='receber_item_aberto_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checklists', '0017_add_responsavel_todos'),
+        ('core', '0007_alter_pessoa_user_set_null'),
+        ('financeiro', '0023_add_indice_receber_item_aberto'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lancamento',
+            index=models.Index(fields=['empresa', 'data', 'criado_em', 'id'], name='lancamento_empresa_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lancamento',
+            index=models.Index(fields=['data', 'criado_em', 'id'], name='lancamento_data_idx'),
+        ),
+    ]
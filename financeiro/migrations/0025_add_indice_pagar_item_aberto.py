@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0024_add_indices_lista_lancamentos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contapagaritem',
+            index=models.Index(condition=models.Q(('pago', False)), fields=['data_vencimento'], name='pagar_item_aberto_idx'),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import secrets
+
 from django.db import models
 from django.utils import timezone
 from core.models import Empresa, Pessoa
@@ -114,6 +116,13 @@ class TipoLancamento(models.TextChoices):
     SAIDA = 'saida', 'Saída'
 
 
+class LinhaDRE(models.TextChoices):
+    RECEITA = 'receita', 'Receita Bruta'
+    DEDUCAO = 'deducao', 'Deduções (Taxas, Impostos)'
+    CUSTO_OPERACIONAL = 'custo_operacional', 'Custos Operacionais'
+    NAO_OPERACIONAL = 'nao_operacional', 'Despesas Não Operacionais (Retiradas)'
+
+
 class ContaBancaria(models.Model):
     """Conta bancária vinculada a uma empresa"""
     TIPO_CONTA_CHOICES = [
@@ -158,6 +167,8 @@ class CategoriaLancamento(models.Model):
     nome = models.CharField(max_length=100)
     tipo = models.CharField(max_length=10, choices=TipoLancamento.choices)
     cor = models.CharField(max_length=7, default='#6b7280')
+    linha_dre = models.CharField(max_length=20, choices=LinhaDRE.choices, blank=True,
+                                 help_text='Linha do DRE (vazio = automático pelo tipo/nome)')
     ativo = models.BooleanField(default=True)
     ordem = models.IntegerField(default=0)
 
@@ -171,6 +182,10 @@ class CategoriaLancamento(models.Model):
         return f"{prefixo}{self.get_tipo_display()} - {self.nome}"
 
 
+class PeriodoFechadoError(Exception):
+    """Alteração em lançamento de um mês já fechado (ver FechamentoMes)."""
+
+
 class Lancamento(models.Model):
     """Lançamento financeiro diário"""
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='lancamentos')
@@ -189,6 +204,8 @@ class Lancamento(models.Model):
     observacao = models.TextField(blank=True)
     mp_payment_id = models.CharField(max_length=50, null=True, blank=True, unique=True,
                                       help_text='ID do pagamento Mercado Pago (evita duplicação)')
+    hash_importacao = models.CharField(max_length=64, null=True, blank=True, unique=True, editable=False,
+                                        help_text='Impressão digital da linha do extrato importado (evita duplicação)')
     criado_em = models.DateTimeField(auto_now_add=True)
     criado_por = models.ForeignKey(Pessoa, on_delete=models.SET_NULL, null=True,
                                     related_name='lancamentos_criados')
@@ -197,11 +214,35 @@ class Lancamento(models.Model):
         verbose_name = 'Lançamento'
         verbose_name_plural = 'Lançamentos'
         ordering = ['-data', '-criado_em']
+        indexes = [
+            # Paginação por cursor da lista: (data, criado_em, id), com e sem empresa
+            models.Index(fields=['empresa', 'data', 'criado_em', 'id'], name='lancamento_empresa_data_idx'),
+            models.Index(fields=['data', 'criado_em', 'id'], name='lancamento_data_idx'),
+        ]
 
     def __str__(self):
         sinal = '+' if self.tipo == 'entrada' else '-'
         return f"{self.data} | {sinal} R$ {self.valor:,.2f} | {self.descricao}"
 
+    def _verificar_periodo_aberto(self):
+        """Impede gravar/excluir lançamento em mês fechado (nem mover para um)."""
+        periodos = [(self.empresa_id, self._meta.get_field('data').to_python(self.data))]
+        if self.pk:
+            original = Lancamento.objects.filter(pk=self.pk).values_list('empresa_id', 'data').first()
+            if original:
+                periodos.append(original)
+        for empresa_id, data in periodos:
+            if FechamentoMes.esta_fechado(empresa_id, data):
+                raise PeriodoFechadoError(f'O mês {data.month:02d}/{data.year} está fechado.')
+
+    def save(self, *args, **kwargs):
+        self._verificar_periodo_aberto()
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self._verificar_periodo_aberto()
+        return super().delete(*args, **kwargs)
+
     @property
     def total_prestacoes(self):
         """Total de gastos empresariais vinculados a esta retirada."""
@@ -234,6 +275,44 @@ class PrestacaoConta(models.Model):
     def __str__(self):
         return f"{self.descricao} - R$ {self.valor:,.2f}"
 
+    def save(self, *args, **kwargs):
+        self.lancamento._verificar_periodo_aberto()
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self.lancamento._verificar_periodo_aberto()
+        return super().delete(*args, **kwargs)
+
+
+class FechamentoMes(models.Model):
+    """
+    Fechamento mensal de uma empresa.
+    Bloqueia alterações nos lançamentos do mês e guarda os relatórios congelados
+    (totais, categorias, linhas do DRE e retiradas), servidos sem recalcular.
+    """
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='fechamentos')
+    mes = models.IntegerField(help_text='Mês (1-12)')
+    ano = models.IntegerField(help_text='Ano')
+    snapshot = models.JSONField(default=dict, help_text='Relatórios congelados no fechamento')
+    fechado_em = models.DateTimeField(auto_now_add=True)
+    fechado_por = models.ForeignKey(Pessoa, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='fechamentos_financeiros')
+
+    class Meta:
+        verbose_name = 'Fechamento de Mês'
+        verbose_name_plural = 'Fechamentos de Mês'
+        unique_together = ['empresa', 'mes', 'ano']
+        ordering = ['-ano', '-mes']
+
+    def __str__(self):
+        return f"{self.empresa.nome} - {self.mes:02d}/{self.ano}"
+
+    @classmethod
+    def esta_fechado(cls, empresa_id, data):
+        if not empresa_id or not data:
+            return False
+        return cls.objects.filter(empresa_id=empresa_id, mes=data.month, ano=data.year).exists()
+
 
 class ContaPagar(models.Model):
     """Template de conta a pagar (recorrente, única ou parcelada)"""
@@ -310,6 +389,11 @@ class ContaPagarItem(models.Model):
         verbose_name = 'Item Conta a Pagar'
         verbose_name_plural = 'Itens Contas a Pagar'
         ordering = ['data_vencimento']
+        indexes = [
+            # Só itens em aberto: filtros de vencendo/atrasado (pago=False + vencimento)
+            models.Index(fields=['data_vencimento'], condition=models.Q(pago=False),
+                         name='pagar_item_aberto_idx'),
+        ]
 
     def __str__(self):
         status = 'Pago' if self.pago else 'Pendente'
@@ -324,6 +408,15 @@ class ConfigMercadoPago(models.Model):
     access_token = models.CharField(max_length=200, help_text='Access Token do Mercado Pago')
     ativo = models.BooleanField(default=True)
     ultima_sync = models.DateTimeField(null=True, blank=True)
+    # Cursores da sync incremental
+    cursor_aprovacao = models.DateTimeField(null=True, blank=True,
+                                            help_text='Último date_approved importado')
+    cursor_payment_id = models.BigIntegerField(null=True, blank=True,
+                                               help_text='ID do último pagamento em cursor_aprovacao (desempate)')
+    cursor_atualizacao = models.DateTimeField(null=True, blank=True,
+                                              help_text='Último date_last_updated processado (estornos, chargebacks)')
+    webhook_token = models.CharField(max_length=64, blank=True, db_index=True,
+                                     help_text='Identifica a config na URL do webhook de notificações')
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
 
@@ -334,6 +427,11 @@ class ConfigMercadoPago(models.Model):
     def __str__(self):
         return f"MP - {self.empresa.nome} ({'Ativo' if self.ativo else 'Inativo'})"
 
+    def save(self, *args, **kwargs):
+        if not self.webhook_token:
+            self.webhook_token = secrets.token_urlsafe(32)
+        super().save(*args, **kwargs)
+
 
 class ContaReceber(models.Model):
     """Template de conta a receber (recorrente, única ou parcelada)"""
@@ -422,6 +520,9 @@ class ContaReceberItem(models.Model):
                                     related_name='conta_receber_item')
     # Para contas parceladas
     parcela_numero = models.IntegerField(null=True, blank=True, help_text='Número da parcela (1, 2, 3...)')
+    # Boleto
+    nosso_numero = models.CharField(max_length=20, blank=True, db_index=True,
+                                    help_text='Nosso número do boleto (só dígitos, sem zeros à esquerda)')
     # Notificação
     notificado = models.BooleanField(default=False)
     notificado_em = models.DateTimeField(null=True, blank=True)
@@ -431,6 +532,11 @@ class ContaReceberItem(models.Model):
         verbose_name = 'Item Conta a Receber'
         verbose_name_plural = 'Itens Contas a Receber'
         ordering = ['data_vencimento']
+        indexes = [
+            # Só itens em aberto: filtros por status/vencimento e a virada para 'atrasado'
+            models.Index(fields=['status', 'data_vencimento'], condition=models.Q(recebido=False),
+                         name='receber_item_aberto_idx'),
+        ]
 
     def __str__(self):
         if self.parcela_numero and self.conta_receber.total_parcelas > 1:
@@ -513,3 +619,161 @@ class HistoricoAlerta(models.Model):
 
     def __str__(self):
         return f"{self.alerta.get_tipo_display()} - {self.enviado_em.strftime('%d/%m/%Y %H:%M')}"
+
+
+class LayoutExtrato(models.Model):
+    """
+    Layout de extrato de um banco, identificado pela assinatura do header.
+    Arquivos com o mesmo header usam o mapa de colunas salvo, sem detecção;
+    um layout corrigido pelo usuário vale para as próximas importações.
+    """
+    conta = models.ForeignKey(ContaBancaria, on_delete=models.CASCADE, related_name='layouts_extrato')
+    assinatura = models.CharField(max_length=64, help_text='SHA-256 do header normalizado')
+    header = models.JSONField(default=list, help_text='Nomes das colunas do header')
+    colunas = models.JSONField(default=dict, help_text='Índices: data, descricao, valor, valor_saida')
+    corrigido = models.BooleanField(default=False, help_text='Mapa de colunas ajustado pelo usuário')
+    usos = models.PositiveIntegerField(default=0)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Layout de Extrato'
+        verbose_name_plural = 'Layouts de Extrato'
+        unique_together = ['conta', 'assinatura']
+        ordering = ['conta', '-atualizado_em']
+
+    def __str__(self):
+        return f"{self.conta.nome} - {', '.join(self.header[:4])}"
+
+
+class SessaoImportacao(models.Model):
+    """
+    Extrato já parseado aguardando confirmação.
+    O arquivo é parseado uma vez no preview; a confirmação importa daqui.
+    """
+    token = models.CharField(max_length=64, unique=True)
+    conta = models.ForeignKey(ContaBancaria, on_delete=models.CASCADE, related_name='sessoes_importacao')
+    criado_por = models.ForeignKey(Pessoa, on_delete=models.CASCADE, related_name='sessoes_importacao')
+    arquivo_nome = models.CharField(max_length=255)
+    linhas = models.BinaryField(help_text='Linhas parseadas (JSON compactado com zlib)')
+    total_linhas = models.IntegerField(default=0)
+    layout = models.ForeignKey(LayoutExtrato, on_delete=models.SET_NULL, null=True, blank=True, related_name='sessoes')
+    criado_em = models.DateTimeField(auto_now_add=True)
+    expira_em = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Sessão de Importação'
+        verbose_name_plural = 'Sessões de Importação'
+        ordering = ['-criado_em']
+
+    def __str__(self):
+        return f"{self.arquivo_nome} - {self.conta.nome} ({self.total_linhas} linhas)"
+
+
+class TarefaFinanceira(models.Model):
+    """
+    Processamento demorado executado em segundo plano (ex.: parse de extrato
+    PDF). A página acompanha o andamento consultando o status.
+    """
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+    ]
+
+    tipo = models.CharField(max_length=50)
+    descricao = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    progresso = models.PositiveSmallIntegerField(default=0, help_text='Percentual concluído (0-100)')
+    mensagem = models.CharField(max_length=255, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    criado_por = models.ForeignKey(Pessoa, on_delete=models.SET_NULL, null=True, blank=True, related_name='tarefas_financeiras')
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Tarefa Financeira'
+        verbose_name_plural = 'Tarefas Financeiras'
+        ordering = ['-criado_em']
+
+    def __str__(self):
+        return f"{self.descricao or self.tipo} - {self.get_status_display()} ({self.progresso}%)"
+
+    MENSAGEM_INTERROMPIDA = 'Interrompida: o servidor reiniciou durante o processamento.'
+
+    @property
+    def finalizada(self):
+        return self.status in ('concluida', 'erro')
+
+    @property
+    def interrompida(self):
+        return self.status == 'erro' and self.mensagem == self.MENSAGEM_INTERROMPIDA
+
+
+class ExecucaoSyncMP(models.Model):
+    """
+    Resumo de uma sync do Mercado Pago de uma empresa, para acompanhar
+    duração e volume ao longo do tempo. Execuções do mesmo disparo (todas as
+    empresas de todos os tenants) compartilham o `lote`.
+    """
+    STATUS_CHOICES = [
+        ('ok', 'OK'),
+        ('parcial', 'Parcial'),
+        ('erro', 'Erro'),
+    ]
+
+    config = models.ForeignKey(ConfigMercadoPago, on_delete=models.CASCADE, related_name='execucoes')
+    lote = models.CharField(max_length=32, db_index=True)
+    incremental = models.BooleanField(default=True)
+    iniciado_em = models.DateTimeField()
+    duracao = models.FloatField(default=0, help_text='Segundos')
+    paginas = models.PositiveIntegerField(default=0)
+    criados = models.PositiveIntegerField(default=0)
+    taxas = models.PositiveIntegerField(default=0)
+    estornos = models.PositiveIntegerField(default=0)
+    ignorados = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ok')
+    erro = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = 'Execução Sync MP'
+        verbose_name_plural = 'Execuções Sync MP'
+        ordering = ['-iniciado_em']
+        indexes = [models.Index(fields=['config', 'iniciado_em'])]
+
+    def __str__(self):
+        return f"{self.config.empresa.nome} - {self.iniciado_em:%d/%m/%Y %H:%M} ({self.get_status_display()})"
+
+
+class NotificacaoMP(models.Model):
+    """
+    Pagamento notificado pelo webhook do Mercado Pago, na fila para ser
+    buscado na API e importado em segundo plano.
+    """
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('processada', 'Processada'),
+        ('erro', 'Erro'),
+    ]
+
+    config = models.ForeignKey(ConfigMercadoPago, on_delete=models.CASCADE, related_name='notificacoes')
+    payment_id = models.CharField(max_length=30)
+    acao = models.CharField(max_length=50, blank=True, help_text='Ex: payment.created, payment.updated')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    erro = models.TextField(blank=True)
+    recebido_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+    processado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Notificação MP'
+        verbose_name_plural = 'Notificações MP'
+        ordering = ['-recebido_em']
+        indexes = [models.Index(fields=['status', 'recebido_em'])]
+
+    def __str__(self):
+        return f"Payment {self.payment_id} - {self.get_status_display()}"
@@ -0,0 +1,111 @@
+"""
+Servidor local que imita a API de pagamentos do Mercado Pago.
+
+Atende os três endpoints usados pela sync e pelo webhook (busca de
+pagamentos, pagamento por id e refunds) a partir de pagamentos em memória.
+Serve para os testes e para rodar a sync sem acessar o MP: aponte
+`MERCADOPAGO_API_BASE` para `servidor.url`.
+
+    with ServidorMPFake() as mp:
+        mp.adicionar({'id': 1, 'status': 'approved', 'date_approved': ..., ...})
+        mp.refunds[1] = [{'id': 9, 'amount': 10, 'date_created': ...}]
+        mp.falhas['/v1/payments/2'] = 503
+"""
+import json
+import re
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_PAGAMENTO = re.compile(r'^/v1/payments/(\d+)(/refunds)?/?$')
+
+
+class ServidorMPFake:
+    """API do MP em memória numa thread; `requisicoes` guarda os paths atendidos."""
+
+    def __init__(self, pagamentos=()):
+        self.pagamentos = {}
+        self.refunds = {}
+        # path -> status HTTP a devolver no lugar da resposta normal
+        self.falhas = {}
+        self.requisicoes = []
+        for pagamento in pagamentos:
+            self.adicionar(pagamento)
+        self._servidor = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._servidor.server_port}'
+
+    def adicionar(self, pagamento):
+        self.pagamentos[int(pagamento['id'])] = pagamento
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._servidor.serve_forever, name='mp-fake', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def buscar(self, params):
+        """Resposta de /v1/payments/search (status, range, sort asc, offset/limit)."""
+        campo = params.get('range') or params.get('sort') or 'date_created'
+        inicio = datetime.fromisoformat(params['begin_date']) if params.get('begin_date') else None
+        fim = datetime.fromisoformat(params['end_date']) if params.get('end_date') else None
+        resultados = []
+        for pagamento in self.pagamentos.values():
+            if params.get('status') and pagamento.get('status') != params['status']:
+                continue
+            valor = pagamento.get(campo)
+            if (inicio or fim) and not valor:
+                continue
+            quando = datetime.fromisoformat(valor) if valor else None
+            if (inicio and quando < inicio) or (fim and quando > fim):
+                continue
+            resultados.append((quando, pagamento['id'], pagamento))
+        resultados.sort(key=lambda r: (r[0] is None, r[0] or datetime.min, r[1]))
+        offset, limite = int(params.get('offset', 0)), int(params.get('limit', 30))
+        return {
+            'paging': {'total': len(resultados), 'offset': offset, 'limit': limite},
+            'results': [p for _, _, p in resultados[offset:offset + limite]],
+        }
+
+    def responder(self, caminho, params):
+        """(status, corpo) da requisição GET."""
+        if caminho in self.falhas:
+            return self.falhas[caminho], {'message': 'falha simulada', 'status': self.falhas[caminho]}
+        if caminho.rstrip('/') == '/v1/payments/search':
+            return 200, self.buscar(params)
+        m = _PAGAMENTO.match(caminho)
+        if m and int(m.group(1)) in self.pagamentos:
+            pid = int(m.group(1))
+            return 200, self.refunds.get(pid, []) if m.group(2) else self.pagamentos[pid]
+        return 404, {'message': 'not_found', 'status': 404}
+
+    def _handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                servidor.requisicoes.append(url.path)
+                if not self.headers.get('Authorization', '').startswith('Bearer '):
+                    status, corpo = 401, {'message': 'unauthorized', 'status': 401}
+                else:
+                    params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                    status, corpo = servidor.responder(url.path, params)
+                dados = json.dumps(corpo).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+        return Handler
@@ -0,0 +1,145 @@
+"""
+Sync do Mercado Pago de todas as empresas, em todos os tenants.
+
+As configs ativas são descobertas schema a schema e sincronizadas em
+paralelo, em threads (a sync é quase toda espera de rede). Cada sync roda no
+schema do seu tenant, com a própria conexão; o limite de requisições por
+access token (`services._sessao_mp`) vale para todas as threads. A falha de
+uma empresa não interrompe as outras, e cada execução grava seu resumo em
+`ExecucaoSyncMP` (duração, páginas, lançamentos criados).
+"""
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import ConfigMercadoPago, ExecucaoSyncMP
+from .services import sync_mercadopago
+from .tarefas import no_schema, schemas_ativos
+
+logger = logging.getLogger(__name__)
+
+# Syncs simultâneas (cada uma usa uma conexão com o banco)
+MP_SYNC_WORKERS = 4
+
+
+@dataclass
+class AlvoSync:
+    schema: str | None
+    config_id: int
+    empresa: str
+
+
+def descobrir_configs(empresa_id=None, schemas=None):
+    """Configs MP ativas de todos os tenants (ou dos `schemas` informados)."""
+    alvos = []
+    for schema in schemas or schemas_ativos():
+        try:
+            with no_schema(schema):
+                configs = ConfigMercadoPago.objects.filter(ativo=True)
+                if empresa_id:
+                    configs = configs.filter(empresa_id=empresa_id)
+                alvos += [
+                    AlvoSync(schema, config_id, nome)
+                    for config_id, nome in configs.values_list('id', 'empresa__nome')
+                ]
+        except Exception:
+            logger.exception('Erro ao listar configs MP do schema %s', schema)
+    return alvos
+
+
+def _resumo(alvo, execucao=None, erro=''):
+    resumo = {'schema': alvo.schema, 'empresa': alvo.empresa, 'status': 'erro', 'erro': erro}
+    if execucao:
+        resumo.update({
+            campo: getattr(execucao, campo)
+            for campo in ('status', 'erro', 'duracao', 'paginas', 'criados', 'taxas', 'estornos', 'ignorados')
+        })
+    return resumo
+
+
+def sincronizar_config(alvo, lote, data_inicio=None, data_fim=None):
+    """
+    Sync de uma config no schema atual, gravando o resumo da execução.
+    Erros da sync ficam registrados na execução, não são propagados.
+    """
+    config = ConfigMercadoPago.objects.select_related('empresa').get(id=alvo.config_id)
+    iniciado_em = timezone.now()
+    inicio = time.monotonic()
+    stats, erro, status = {}, '', 'ok'
+    try:
+        stats = sync_mercadopago(config, data_inicio, data_fim)
+        if stats['erros']:
+            status, erro = 'parcial', '\n'.join(stats['erros'])
+    except Exception as e:
+        logger.exception('Erro na sync MP de %s (%s)', alvo.empresa, alvo.schema)
+        status, erro = 'erro', str(e)
+
+    return ExecucaoSyncMP.objects.create(
+        config=config,
+        lote=lote,
+        incremental=not (data_inicio and data_fim),
+        iniciado_em=iniciado_em,
+        duracao=round(time.monotonic() - inicio, 3),
+        paginas=stats.get('paginas', 0),
+        criados=stats.get('criados', 0),
+        taxas=stats.get('taxas', 0),
+        estornos=stats.get('estornos', 0),
+        ignorados=stats.get('ignorados', 0),
+        status=status,
+        erro=erro,
+    )
+
+
+def _executar(alvo, lote, data_inicio, data_fim):
+    """Roda numa thread do pool: entra no schema do tenant e fecha a conexão ao final."""
+    try:
+        with no_schema(alvo.schema):
+            return _resumo(alvo, sincronizar_config(alvo, lote, data_inicio, data_fim))
+    finally:
+        connection.close()
+
+
+def sincronizar_todos(data_inicio=None, data_fim=None, empresa_id=None, schemas=None,
+                      workers=MP_SYNC_WORKERS, ao_concluir=None):
+    """
+    Sincroniza em paralelo todas as configs MP ativas (ver `descobrir_configs`).
+
+    Sem datas, cada sync é incremental; com datas, reprocessa a janela.
+    `ao_concluir(resumo)` é chamado a cada empresa terminada. Retorna
+    (lote, [resumo, ...]); cada resumo traz schema, empresa, status, erro,
+    duracao, paginas, criados, taxas, estornos e ignorados.
+    """
+    alvos = descobrir_configs(empresa_id, schemas)
+    lote = uuid.uuid4().hex
+    resumos = []
+    if not alvos:
+        return lote, resumos
+
+    inicio = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(alvos))), thread_name_prefix='sync-mp') as pool:
+        futuros = {pool.submit(_executar, alvo, lote, data_inicio, data_fim): alvo for alvo in alvos}
+        for futuro in as_completed(futuros):
+            alvo = futuros[futuro]
+            try:
+                resumo = futuro.result()
+            except Exception as e:
+                # Falha antes da sync (schema inacessível, config removida)
+                logger.exception('Erro na sync MP de %s (%s)', alvo.empresa, alvo.schema)
+                resumo = _resumo(alvo, erro=str(e))
+            resumos.append(resumo)
+            if ao_concluir:
+                ao_concluir(resumo)
+
+    logger.info(
+        'Sync MP lote %s: %d empresas em %.1fs, %d páginas, %d lançamentos, %d com erro',
+        lote, len(resumos), time.monotonic() - inicio,
+        sum(r.get('paginas', 0) for r in resumos),
+        sum(r.get('criados', 0) + r.get('taxas', 0) + r.get('estornos', 0) for r in resumos),
+        sum(1 for r in resumos if r['status'] == 'erro'),
+    )
+    return lote, resumos
@@ -0,0 +1,321 @@
+"""
+Projeção de fluxo de caixa.
+
+Em vez de depender só dos itens já gravados em ContaPagarItem/ContaReceberItem,
+a projeção expande as regras de recorrência das contas ativas direto em datas
+(vetorizado com NumPy, sem gravar nada) e junta com os itens reais em aberto.
+Itens reais têm prioridade: um período (conta, mês, ano) que já tem item
+gravado, pago ou não, não recebe ocorrência virtual.
+
+O saldo diário é o saldo atual das contas bancárias mais a soma acumulada de
+entradas - saídas de cada dia; a visão mensal agrega os mesmos arrays.
+"""
+import calendar
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from django.db.models import DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ContaBancaria, ContaPagar, ContaPagarItem, ContaReceber, ContaReceberItem
+
+# Passo em meses de cada recorrência. Semanal/quinzenal/diária geram um item
+# por mês, como em services._deve_gerar_para_mes.
+PASSO_RECORRENCIA = {
+    'diaria': 1,
+    'semanal': 1,
+    'quinzenal': 1,
+    'mensal': 1,
+    'trimestral': 3,
+    'semestral': 6,
+    'anual': 12,
+}
+
+
+@dataclass
+class Evento:
+    """Entrada ou saída prevista em uma data (item real ou ocorrência virtual)."""
+    data: date
+    valor: Decimal
+    descricao: str
+    tipo: str  # 'receber' | 'pagar'
+    virtual: bool = False
+
+
+def contas_com_saldo(empresa):
+    """Contas bancárias ativas anotadas com `saldo_atual` (uma consulta)."""
+    return anotar_saldo(ContaBancaria.objects.filter(empresa=empresa, ativo=True))
+
+
+def anotar_saldo(contas):
+    """Anota `saldo_atual` (saldo inicial + entradas - saídas) no queryset de contas."""
+    zero = Value(Decimal('0'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    return contas.annotate(
+        saldo_atual=F('saldo_inicial')
+        + Coalesce(Sum('lancamentos__valor', filter=Q(lancamentos__tipo='entrada')), zero)
+        - Coalesce(Sum('lancamentos__valor', filter=Q(lancamentos__tipo='saida')), zero),
+    )
+
+
+def _mes_numpy(d):
+    return np.datetime64(f'{d.year:04d}-{d.month:02d}', 'M')
+
+
+def expandir_recorrencia(conta, inicio, fim):
+    """
+    Datas de vencimento da conta entre inicio e fim (inclusive), como
+    array datetime64[D]. O dia segue `dia_vencimento`, limitado ao último
+    dia de cada mês.
+    """
+    referencia = conta.data_vencimento or timezone.localtime(conta.criado_em).date()
+    vazio = np.array([], dtype='datetime64[D]')
+
+    if conta.recorrencia == 'unica':
+        meses = np.array([_mes_numpy(referencia)])
+    elif conta.recorrencia in PASSO_RECORRENCIA:
+        passo = PASSO_RECORRENCIA[conta.recorrencia]
+        primeiro = _mes_numpy(referencia)
+        # Primeiro mês da série que não é anterior a `inicio`
+        atraso = max(0, (_mes_numpy(inicio) - primeiro).astype(int))
+        primeiro = primeiro + np.timedelta64(-(-atraso // passo) * passo, 'M')
+        meses = np.arange(primeiro, _mes_numpy(fim) + np.timedelta64(1, 'M'), passo)
+    else:
+        return vazio
+
+    if not len(meses):
+        return vazio
+    ultimo_dia = (meses + np.timedelta64(1, 'M')).astype('datetime64[D]') - np.timedelta64(1, 'D')
+    datas = np.minimum(meses.astype('datetime64[D]') + np.timedelta64(conta.dia_vencimento - 1, 'D'), ultimo_dia)
+    return datas[(datas >= np.datetime64(inicio)) & (datas <= np.datetime64(fim))]
+
+
+def _eventos_virtuais(contas, existentes, inicio, fim, tipo):
+    eventos = []
+    for conta in contas:
+        for data_np in expandir_recorrencia(conta, inicio, fim).tolist():
+            if (conta.id, data_np.month, data_np.year) in existentes:
+                continue
+            eventos.append(Evento(data_np, conta.valor, conta.descricao, tipo, virtual=True))
+    return eventos
+
+
+class ProjecaoCaixa:
+    """Arrays diários de entradas, saídas e saldo, de `inicio` a `fim`."""
+
+    def __init__(self, saldo_inicial, inicio, fim, eventos):
+        self.saldo_inicial = saldo_inicial
+        self.inicio = inicio
+        self.fim = fim
+        self.eventos = sorted(eventos, key=lambda e: e.data)
+        self.dias = np.arange(np.datetime64(inicio), np.datetime64(fim) + np.timedelta64(1, 'D'))
+
+        # Um elemento por evento: dia (índice em self.dias), valor e se é entrada
+        self.indices = (np.array([e.data for e in self.eventos], dtype='datetime64[D]') - self.dias[0]).astype(int)
+        self.valores = np.array([float(e.valor) for e in self.eventos])
+        self.receber = np.array([e.tipo == 'receber' for e in self.eventos], dtype=bool)
+
+        n = len(self.dias)
+        self.entradas = np.bincount(self.indices[self.receber], self.valores[self.receber], minlength=n)
+        self.saidas = np.bincount(self.indices[~self.receber], self.valores[~self.receber], minlength=n)
+        self.saldo = float(saldo_inicial) + np.cumsum(self.entradas - self.saidas)
+
+    @property
+    def total_entradas(self):
+        return float(self.entradas.sum())
+
+    @property
+    def total_saidas(self):
+        return float(self.saidas.sum())
+
+    @property
+    def saldo_final(self):
+        return float(self.saldo[-1]) if len(self.saldo) else float(self.saldo_inicial)
+
+    def menor_saldo(self):
+        """(data, saldo) do ponto mais baixo da projeção."""
+        i = int(np.argmin(self.saldo))
+        return self.dias[i].item(), float(self.saldo[i])
+
+    def por_dia(self, somente_movimento=True):
+        """Linhas diárias; por padrão só os dias com alguma entrada ou saída."""
+        dias = []
+        for i in np.flatnonzero((self.entradas + self.saidas) > 0) if somente_movimento else range(len(self.dias)):
+            dias.append({
+                'data': self.dias[i].item(),
+                'a_receber': float(self.entradas[i]),
+                'a_pagar': float(self.saidas[i]),
+                'saldo_dia': float(self.entradas[i] - self.saidas[i]),
+                'saldo_acumulado': float(self.saldo[i]),
+            })
+        return dias
+
+    def por_mes(self):
+        """Linhas mensais com totais, saldo acumulado no fim do mês e eventos do mês."""
+        meses_dia = self.dias.astype('datetime64[M]')
+        meses, primeiro_indice = np.unique(meses_dia, return_index=True)
+        entradas = np.add.reduceat(self.entradas, primeiro_indice)
+        saidas = np.add.reduceat(self.saidas, primeiro_indice)
+        ultimo_indice = np.append(primeiro_indice[1:], len(self.dias)) - 1
+
+        eventos_mes = {}
+        for e in self.eventos:
+            eventos_mes.setdefault((e.data.year, e.data.month), []).append(e)
+
+        linhas = []
+        for k, mes_np in enumerate(meses):
+            mes_ref = mes_np.item()
+            eventos = eventos_mes.get((mes_ref.year, mes_ref.month), [])
+            linhas.append({
+                'mes': mes_ref.month,
+                'ano': mes_ref.year,
+                'nome_mes': calendar.month_name[mes_ref.month],
+                'a_receber': float(entradas[k]),
+                'a_pagar': float(saidas[k]),
+                'saldo_mes': float(entradas[k] - saidas[k]),
+                'saldo_acumulado': float(self.saldo[ultimo_indice[k]]),
+                'itens_receber': [e for e in eventos if e.tipo == 'receber'],
+                'itens_pagar': [e for e in eventos if e.tipo == 'pagar'],
+            })
+        return linhas
+
+
+def projetar_fluxo_caixa(empresa, meses=3, hoje=None, saldo_inicial=None):
+    """
+    Projeta o caixa da empresa do dia de hoje até o fim do `meses`-ésimo mês.
+
+    Itens reais em aberto entram com seu valor e vencimento; meses sem item
+    gravado recebem a ocorrência virtual da recorrência da conta.
+    """
+    hoje = hoje or timezone.localdate()
+    inicio = date(hoje.year, hoje.month, 1)
+    fim = inicio + relativedelta(months=meses) - relativedelta(days=1)
+
+    if saldo_inicial is None:
+        saldo_inicial = sum((c.saldo_atual for c in contas_com_saldo(empresa)), Decimal('0'))
+
+    eventos = []
+    for modelo_conta, modelo_item, campo, tipo, em_aberto in (
+        (ContaPagar, ContaPagarItem, 'conta_pagar', 'pagar', lambda i: not i.pago),
+        (ContaReceber, ContaReceberItem, 'conta_receber', 'receber',
+         lambda i: not i.recebido and i.status in ('pendente', 'atrasado')),
+    ):
+        itens = (
+            modelo_item.objects
+            .filter(**{f'{campo}__empresa': empresa})
+            .filter(Q(ano__gt=inicio.year) | Q(ano=inicio.year, mes__gte=inicio.month))
+            .filter(Q(ano__lt=fim.year) | Q(ano=fim.year, mes__lte=fim.month))
+            .select_related(campo)
+        )
+        existentes = set()
+        for item in itens:
+            conta = getattr(item, campo)
+            existentes.add((conta.id, item.mes, item.ano))
+            if em_aberto(item):
+                eventos.append(Evento(item.data_vencimento, item.valor, conta.descricao, tipo))
+
+        contas = modelo_conta.objects.filter(empresa=empresa, ativo=True).exclude(recorrencia='parcelada')
+        eventos += _eventos_virtuais(contas, existentes, inicio, fim, tipo)
+
+    # Vencimentos anteriores a hoje (ainda no mês corrente) contam a partir de hoje
+    eventos = [
+        Evento(hoje, e.valor, e.descricao, e.tipo, e.virtual) if e.data < hoje else e
+        for e in eventos
+    ]
+    return ProjecaoCaixa(saldo_inicial, hoje, fim, eventos)
+
+
+# =====================================================
+# SIMULAÇÃO DE CENÁRIOS (MONTE CARLO)
+# =====================================================
+
+PERCENTIS_SIMULACAO = (5, 25, 50, 75, 95)
+
+
+@dataclass
+class Cenario:
+    """Premissas do cenário. Percentuais em 0-100."""
+    pct_atraso: float = 0        # % dos recebimentos que atrasam
+    dias_atraso: float = 30      # atraso médio (Poisson) de quem atrasa
+    queda_receita: float = 0     # queda média dos recebimentos
+    desvio_receita: float = 5    # desvio padrão da queda (pontos percentuais)
+    caminhos: int = 2000
+
+
+class SimulacaoCaixa:
+    """Saldos simulados (caminhos × dias) e estatísticas derivadas."""
+
+    def __init__(self, projecao, saldos):
+        self.projecao = projecao
+        self.saldos = saldos
+        self.bandas = dict(zip(PERCENTIS_SIMULACAO, np.percentile(saldos, PERCENTIS_SIMULACAO, axis=0)))
+
+    @property
+    def prob_saldo_negativo(self):
+        """% dos caminhos em que o saldo fica negativo em algum dia."""
+        return float((self.saldos.min(axis=1) < 0).mean() * 100)
+
+    def prob_negativo_por_dia(self):
+        return (self.saldos < 0).mean(axis=0) * 100
+
+    def por_mes(self):
+        """Bandas de percentis e prob. de saldo negativo no último dia de cada mês."""
+        dias = self.projecao.dias
+        meses, primeiro_indice = np.unique(dias.astype('datetime64[M]'), return_index=True)
+        ultimo_indice = np.append(primeiro_indice[1:], len(dias)) - 1
+        prob_dia = self.prob_negativo_por_dia()
+        linhas = []
+        for mes_np, i in zip(meses, ultimo_indice):
+            mes_ref = mes_np.item()
+            linhas.append({
+                'mes': mes_ref.month,
+                'ano': mes_ref.year,
+                'nome_mes': calendar.month_name[mes_ref.month],
+                'deterministico': float(self.projecao.saldo[i]),
+                'p5': float(self.bandas[5][i]),
+                'p25': float(self.bandas[25][i]),
+                'p50': float(self.bandas[50][i]),
+                'p75': float(self.bandas[75][i]),
+                'p95': float(self.bandas[95][i]),
+                'prob_negativo': float(prob_dia[i]),
+            })
+        return linhas
+
+
+def simular_cenario(projecao, cenario, seed=None):
+    """
+    Roda `cenario.caminhos` caminhos de Monte Carlo sobre a projeção.
+
+    Saídas são mantidas como projetadas. Em cada caminho, cada recebimento
+    sofre a queda de receita sorteada para o caminho e, com probabilidade
+    `pct_atraso`, é empurrado `Poisson(dias_atraso)` dias; recebimentos que
+    passam do fim do horizonte saem da projeção. Tudo é montado com arrays
+    caminhos × eventos, sem laço em Python.
+    """
+    rng = np.random.default_rng(seed)
+    n_dias = len(projecao.dias)
+    caminhos = max(int(cenario.caminhos), 1)
+
+    indices = projecao.indices[projecao.receber]
+    valores = projecao.valores[projecao.receber]
+
+    # Queda de receita: um fator por caminho
+    queda = rng.normal(cenario.queda_receita, cenario.desvio_receita, size=(caminhos, 1)) / 100
+    valores_sim = np.broadcast_to(valores * np.clip(1 - queda, 0, None), (caminhos, len(valores)))
+
+    # Atrasos: sorteio por caminho × recebimento
+    atrasa = rng.random((caminhos, len(valores))) < cenario.pct_atraso / 100
+    atraso = np.where(atrasa, rng.poisson(cenario.dias_atraso, size=atrasa.shape), 0)
+    dia_sim = indices + atraso
+    dentro = dia_sim < n_dias
+
+    linha = np.broadcast_to(np.arange(caminhos)[:, None], dia_sim.shape)
+    entradas = np.bincount(
+        (linha * n_dias + dia_sim)[dentro], valores_sim[dentro], minlength=caminhos * n_dias,
+    ).reshape(caminhos, n_dias)
+
+    saldos = float(projecao.saldo_inicial) + np.cumsum(entradas - projecao.saidas, axis=1)
+    return SimulacaoCaixa(projecao, saldos)
@@ -0,0 +1,75 @@
+"""
+Rentabilidade por projeto.
+
+`projetos_com_rentabilidade` anota receita, despesa, lucro, margem e
+pendente a receber em todos os projetos da empresa numa única consulta:
+receita e despesa são somas condicionais sobre os lançamentos (o Postgres
+calcula cada SUM uma vez por grupo, mesmo repetido em lucro e margem) e o
+pendente é uma subconsulta agregada, para não multiplicar as linhas do
+join. Como os valores são anotações, ordenação e paginação ficam no banco
+e o relatório cobre qualquer quantidade de projetos.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from checklists.models import Projeto
+
+from .models import ContaReceberItem
+
+# ?ordem= aceito pelo relatório -> order_by (o id desempata entre páginas)
+ORDENS_PROJETO = {
+    'lucro': ('lucro', 'id'),
+    'receita': ('receita', 'id'),
+    'despesa': ('despesa', 'id'),
+    'margem': ('margem', 'id'),
+    'pendente': ('pendente_receber', 'id'),
+    'titulo': ('titulo', 'id'),
+}
+ORDEM_PADRAO = '-lucro'
+
+_VALOR = DecimalField(max_digits=16, decimal_places=2)
+_ZERO = Value(Decimal('0'), output_field=_VALOR)
+
+
+def _soma_lancamentos(empresa, tipo):
+    filtro = Q(lancamentos__empresa=empresa, lancamentos__tipo=tipo)
+    return Coalesce(Sum('lancamentos__valor', filter=filtro, output_field=_VALOR), _ZERO)
+
+
+def projetos_com_rentabilidade(empresa):
+    """
+    Projetos da empresa anotados com receita, despesa, lucro, margem (%)
+    e pendente_receber (itens não recebidos das contas a receber ativas).
+    """
+    pendente = ContaReceberItem.objects.filter(
+        conta_receber__empresa=empresa,
+        conta_receber__projeto=OuterRef('pk'),
+        conta_receber__ativo=True,
+        recebido=False,
+    ).order_by().values('conta_receber__projeto').annotate(t=Sum('valor')).values('t')
+    return Projeto.objects.filter(empresa=empresa).annotate(
+        receita=_soma_lancamentos(empresa, 'entrada'),
+        despesa=_soma_lancamentos(empresa, 'saida'),
+        pendente_receber=Coalesce(Subquery(pendente[:1], output_field=_VALOR), _ZERO),
+    ).annotate(
+        lucro=ExpressionWrapper(F('receita') - F('despesa'), output_field=_VALOR),
+    ).annotate(
+        margem=Case(
+            When(receita__gt=0, then=ExpressionWrapper(
+                F('lucro') * Value(Decimal('100')) / F('receita'), output_field=_VALOR,
+            )),
+            default=_ZERO,
+            output_field=_VALOR,
+        ),
+    )
+
+
+def ordenar_projetos(queryset, ordem):
+    """Aplica `ordem` (chave de ORDENS_PROJETO, '-' para decrescente). Retorna (queryset, ordem usada)."""
+    campo = ordem.lstrip('-')
+    if campo not in ORDENS_PROJETO:
+        ordem, campo = ORDEM_PADRAO, ORDEM_PADRAO.lstrip('-')
+    prefixo = '-' if ordem.startswith('-') else ''
+    return queryset.order_by(*(prefixo + c for c in ORDENS_PROJETO[campo])), ordem
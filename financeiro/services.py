@@ -1,11 +1,19 @@
 import calendar
 import logging
-from datetime import date, timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 
+from .dre import criar_lancamentos
 from .models import (
     CategoriaLancamento,
     ConfigMercadoPago,
@@ -13,6 +21,7 @@ from .models import (
     ContaPagarItem,
     ContaReceber,
     ContaReceberItem,
+    FechamentoMes,
     Lancamento,
     TipoLancamento,
 )
@@ -152,54 +161,85 @@ def gerar_parcelas_conta(conta):
     return criados
 
 
-def gerar_contas_pagar_mes(empresa, mes, ano):
-    """Gera itens de contas a pagar para o mês especificado.
+def _periodos_horizonte(mes, ano, meses):
+    """Lista de (mes, ano) com `meses` meses a partir de mes/ano (inclusive)."""
+    periodos = []
+    for i in range(meses):
+        indice = ano * 12 + (mes - 1) + i
+        periodos.append((indice % 12 + 1, indice // 12))
+    return periodos
+
+
+def _gerar_itens_recorrentes(contas, modelo_item, campo_conta, periodos, deve_gerar, novo_item):
+    """Cria em lote os itens (conta, mes, ano) que ainda não existem.
 
-    Para cada ContaPagar ativa da empresa, cria um ContaPagarItem
-    se ainda não existir para o mês/ano e se a recorrência permitir.
+    Uma consulta busca as chaves já geradas no horizonte; os itens faltantes
+    são montados em memória e inseridos com bulk_create. Rodar de novo não
+    duplica nada.
     """
-    # Excluir contas parceladas (já têm itens gerados na criação)
-    contas = ContaPagar.objects.filter(empresa=empresa, ativo=True).exclude(recorrencia='parcelada')
-    criados = 0
+    contas = list(contas)
+    if not contas or not periodos:
+        return 0
 
-    for conta in contas:
-        # Verificar se já existe
-        if ContaPagarItem.objects.filter(conta_pagar=conta, mes=mes, ano=ano).exists():
-            continue
+    anos = [ano for _, ano in periodos]
+    existentes = set(
+        modelo_item.objects.filter(
+            **{f'{campo_conta}__in': contas},
+            ano__gte=min(anos),
+            ano__lte=max(anos),
+        ).values_list(f'{campo_conta}_id', 'mes', 'ano')
+    )
 
-        # Verificar se deve gerar baseado na recorrência
-        if not _deve_gerar_para_mes(conta, mes, ano):
-            continue
+    novos = [
+        novo_item(conta, mes, ano)
+        for conta in contas
+        for mes, ano in periodos
+        if (conta.id, mes, ano) not in existentes and deve_gerar(conta, mes, ano)
+    ]
+    with transaction.atomic():
+        modelo_item.objects.bulk_create(novos, batch_size=500)
+    return len(novos)
 
-        # Calcular data de vencimento
-        ultimo_dia_mes = calendar.monthrange(ano, mes)[1]
-        dia = min(conta.dia_vencimento, ultimo_dia_mes)
-        data_vencimento = date(ano, mes, dia)
 
-        # Calcular data de execução
-        data_execucao = _calcular_data_execucao(data_vencimento, conta.dia_execucao, conta.dia_execucao_mensal)
+def _vencimento_no_mes(conta, mes, ano):
+    ultimo_dia_mes = calendar.monthrange(ano, mes)[1]
+    return date(ano, mes, min(conta.dia_vencimento, ultimo_dia_mes))
 
-        ContaPagarItem.objects.create(
-            conta_pagar=conta,
-            mes=mes,
-            ano=ano,
-            valor=conta.valor,
-            data_vencimento=data_vencimento,
-            data_execucao=data_execucao,
-        )
-        criados += 1
 
-    return criados
+def _novo_item_pagar(conta, mes, ano):
+    data_vencimento = _vencimento_no_mes(conta, mes, ano)
+    return ContaPagarItem(
+        conta_pagar=conta,
+        mes=mes,
+        ano=ano,
+        valor=conta.valor,
+        data_vencimento=data_vencimento,
+        data_execucao=_calcular_data_execucao(data_vencimento, conta.dia_execucao, conta.dia_execucao_mensal),
+    )
+
+
+def gerar_itens_contas_pagar(contas, mes, ano, meses=1):
+    """Gera os itens das contas a pagar para `meses` meses a partir de mes/ano.
+
+    Contas parceladas ficam de fora (já têm as parcelas geradas na criação).
+    """
+    contas = contas.filter(ativo=True).exclude(recorrencia='parcelada')
+    return _gerar_itens_recorrentes(
+        contas, ContaPagarItem, 'conta_pagar',
+        _periodos_horizonte(mes, ano, meses), _deve_gerar_para_mes, _novo_item_pagar,
+    )
+
+
+def gerar_contas_pagar_mes(empresa, mes, ano):
+    """Gera itens de contas a pagar da empresa para o mês especificado."""
+    return gerar_itens_contas_pagar(ContaPagar.objects.filter(empresa=empresa), mes, ano)
 
 
-def gerar_contas_pagar_todas_empresas():
-    """Gera contas a pagar do mês atual para todas as empresas."""
-    from core.models import Empresa
+def gerar_contas_pagar_todas_empresas(meses=None):
+    """Gera contas a pagar de todas as empresas do mês atual até o fim do horizonte."""
     hoje = timezone.localdate()
-    total = 0
-    for empresa in Empresa.objects.all():
-        total += gerar_contas_pagar_mes(empresa, hoje.month, hoje.year)
-    return total
+    meses = meses or settings.FINANCEIRO_HORIZONTE_MESES
+    return gerar_itens_contas_pagar(ContaPagar.objects.all(), hoje.month, hoje.year, meses)
 
 
 # =====================================================
@@ -276,45 +316,56 @@ def gerar_parcelas_conta_receber(conta):
     return criados
 
 
-def gerar_contas_receber_mes(empresa, mes, ano):
-    """Gera itens de contas a receber para o mês especificado."""
-    contas = ContaReceber.objects.filter(empresa=empresa, ativo=True).exclude(recorrencia='parcelada')
-    criados = 0
+def _novo_item_receber(conta, mes, ano):
+    data_vencimento = _vencimento_no_mes(conta, mes, ano)
+    # bulk_create não passa pelo save(): status calculado aqui
+    status = 'atrasado' if data_vencimento < timezone.localdate() else 'pendente'
+    return ContaReceberItem(
+        conta_receber=conta,
+        mes=mes,
+        ano=ano,
+        valor=conta.valor,
+        data_vencimento=data_vencimento,
+        status=status,
+    )
 
-    for conta in contas:
-        if ContaReceberItem.objects.filter(conta_receber=conta, mes=mes, ano=ano).exists():
-            continue
 
-        if not _deve_gerar_receber_para_mes(conta, mes, ano):
-            continue
+def gerar_itens_contas_receber(contas, mes, ano, meses=1):
+    """Gera os itens das contas a receber para `meses` meses a partir de mes/ano."""
+    contas = contas.filter(ativo=True).exclude(recorrencia='parcelada')
+    return _gerar_itens_recorrentes(
+        contas, ContaReceberItem, 'conta_receber',
+        _periodos_horizonte(mes, ano, meses), _deve_gerar_receber_para_mes, _novo_item_receber,
+    )
 
-        ultimo_dia_mes = calendar.monthrange(ano, mes)[1]
-        dia = min(conta.dia_vencimento, ultimo_dia_mes)
-        data_vencimento = date(ano, mes, dia)
 
-        ContaReceberItem.objects.create(
-            conta_receber=conta,
-            mes=mes,
-            ano=ano,
-            valor=conta.valor,
-            data_vencimento=data_vencimento,
-        )
-        criados += 1
-
-    return criados
+def gerar_contas_receber_mes(empresa, mes, ano):
+    """Gera itens de contas a receber da empresa para o mês especificado."""
+    return gerar_itens_contas_receber(ContaReceber.objects.filter(empresa=empresa), mes, ano)
 
 
-def gerar_contas_receber_todas_empresas():
-    """Gera contas a receber do mês atual para todas as empresas."""
-    from core.models import Empresa
+def gerar_contas_receber_todas_empresas(meses=None):
+    """Gera contas a receber de todas as empresas do mês atual até o fim do horizonte."""
     hoje = timezone.localdate()
-    total = 0
-    for empresa in Empresa.objects.all():
-        total += gerar_contas_receber_mes(empresa, hoje.month, hoje.year)
-    return total
+    meses = meses or settings.FINANCEIRO_HORIZONTE_MESES
+    return gerar_itens_contas_receber(ContaReceber.objects.all(), hoje.month, hoje.year, meses)
+
 
+def atualizar_status_receber(hoje=None):
+    """
+    Passa para 'atrasado' os itens pendentes já vencidos, num único UPDATE
+    (o save() só recalcula o status quando o item é editado). Retorna a
+    quantidade de itens alterados.
+    """
+    hoje = hoje or timezone.localdate()
+    return ContaReceberItem.objects.filter(
+        recebido=False, status='pendente', data_vencimento__lt=hoje,
+    ).update(status='atrasado')
 
-MP_API_BASE = 'https://api.mercadopago.com'
+
+def _url_mp(caminho):
+    """URL da API do MP (base em settings.MERCADOPAGO_API_BASE, trocável por um servidor local)."""
+    return f'{settings.MERCADOPAGO_API_BASE.rstrip("/")}{caminho}'
 
 
 def _get_or_create_categorias(empresa):
@@ -334,21 +385,103 @@ def _get_or_create_categorias(empresa):
     return categorias
 
 
-def _fetch_payments(access_token, data_inicio, data_fim, offset=0):
-    """Busca pagamentos aprovados na API do MP."""
-    headers = {'Authorization': f'Bearer {access_token}'}
+# Buscas de refunds simultâneas por sync (limite por conta MP)
+MP_REFUND_WORKERS = 8
+MP_LIMITE_PAGINA = 50
+# Primeira sync incremental (sem cursor): quantos dias olhar para trás
+MP_JANELA_INICIAL_DIAS = 7
+
+
+# Requisições por segundo à API do MP, por access token (somando todas as threads)
+MP_REQUISICOES_POR_SEGUNDO = 10
+
+
+class _LimiteRequisicoes:
+    """Espaça as requisições de uma conta MP; compartilhado entre threads."""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo
+        self.proxima = 0.0
+        self.lock = threading.Lock()
+
+    def aguardar(self):
+        with self.lock:
+            agora = time.monotonic()
+            espera = self.proxima - agora
+            self.proxima = max(agora, self.proxima) + self.intervalo
+        if espera > 0:
+            time.sleep(espera)
+
+
+_limites_mp = {}
+_limites_mp_lock = threading.Lock()
+
+
+def _limite_mp(access_token):
+    with _limites_mp_lock:
+        if access_token not in _limites_mp:
+            _limites_mp[access_token] = _LimiteRequisicoes(MP_REQUISICOES_POR_SEGUNDO)
+        return _limites_mp[access_token]
+
+
+class _AdapterMP(HTTPAdapter):
+    """HTTPAdapter que respeita o limite de requisições da conta."""
+
+    def __init__(self, limite, **kwargs):
+        self.limite = limite
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.limite.aguardar()
+        return super().send(request, **kwargs)
+
+
+def _sessao_mp(access_token):
+    """
+    Sessão HTTP da sync: conexões reaproveitadas (pool do tamanho dos
+    workers), retry com backoff em 429/5xx respeitando Retry-After, e no
+    máximo MP_REQUISICOES_POR_SEGUNDO por access token, mesmo com várias
+    syncs/threads usando a mesma conta.
+    """
+    retry = Retry(
+        total=4,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({'GET'}),
+        respect_retry_after_header=True,
+    )
+    adapter = _AdapterMP(
+        _limite_mp(access_token), pool_connections=1, pool_maxsize=MP_REFUND_WORKERS, max_retries=retry,
+    )
+    sessao = requests.Session()
+    sessao.mount('https://', adapter)
+    sessao.mount('http://', adapter)
+    sessao.headers['Authorization'] = f'Bearer {access_token}'
+    return sessao
+
+
+def _data_mp(valor, fim=False):
+    """Data/hora no formato da busca do MP (date = dia inteiro em horário de Brasília)."""
+    if isinstance(valor, datetime):
+        return valor.isoformat(timespec='milliseconds')
+    return f'{valor}T23:59:59.999-03:00' if fim else f'{valor}T00:00:00.000-03:00'
+
+
+def _fetch_payments(sessao, inicio, fim, offset=0, campo='date_approved', status='approved'):
+    """Busca pagamentos na API do MP, em ordem crescente de `campo` dentro da janela."""
     params = {
-        'sort': 'date_approved',
+        'sort': campo,
         'criteria': 'asc',
-        'begin_date': f'{data_inicio}T00:00:00.000-03:00',
-        'end_date': f'{data_fim}T23:59:59.999-03:00',
-        'status': 'approved',
+        'range': campo,
+        'begin_date': _data_mp(inicio),
+        'end_date': _data_mp(fim, fim=True),
         'offset': offset,
-        'limit': 50,
+        'limit': MP_LIMITE_PAGINA,
     }
-    resp = requests.get(
-        f'{MP_API_BASE}/v1/payments/search',
-        headers=headers,
+    if status:
+        params['status'] = status
+    resp = sessao.get(
+        _url_mp('/v1/payments/search'),
         params=params,
         timeout=30,
     )
@@ -356,125 +489,362 @@ def _fetch_payments(access_token, data_inicio, data_fim, offset=0):
     return resp.json()
 
 
-def _fetch_refunds(access_token, payment_id):
+def _fetch_payment(sessao, payment_id):
+    """Busca um pagamento pelo id."""
+    resp = sessao.get(_url_mp(f'/v1/payments/{payment_id}'), timeout=30)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _fetch_refunds(sessao, payment_id):
     """Busca refunds de um pagamento."""
-    headers = {'Authorization': f'Bearer {access_token}'}
-    resp = requests.get(
-        f'{MP_API_BASE}/v1/payments/{payment_id}/refunds',
-        headers=headers,
+    resp = sessao.get(
+        _url_mp(f'/v1/payments/{payment_id}/refunds'),
         timeout=30,
     )
     resp.raise_for_status()
     return resp.json()
 
 
-def sync_mercadopago(config: ConfigMercadoPago, data_inicio: date, data_fim: date):
+def _tem_estorno(payment):
+    """O payload do pagamento indica valor estornado."""
+    return bool(payment.get('refunds')) or Decimal(str(payment.get('transaction_amount_refunded') or 0)) > 0
+
+
+def _buscar_refunds(sessao, payments):
     """
-    Sincroniza pagamentos do Mercado Pago como lançamentos financeiros.
-    Retorna dict com contadores: criados, taxas, estornos, ignorados.
+    Refunds dos pagamentos {pid: payment}, em paralelo e só para os que têm
+    estorno. Usa a lista do próprio payload quando ela vem preenchida.
+    Retorna ({pid: refunds}, {pid: erro}).
+    """
+    refunds, erros = {}, {}
+    buscar = []
+    for pid, payment in payments.items():
+        if payment.get('refunds'):
+            refunds[pid] = payment['refunds']
+        elif _tem_estorno(payment):
+            buscar.append(pid)
+    if not buscar:
+        return refunds, erros
+
+    with ThreadPoolExecutor(max_workers=min(MP_REFUND_WORKERS, len(buscar))) as pool:
+        futuros = {pool.submit(_fetch_refunds, sessao, pid): pid for pid in buscar}
+        for futuro in as_completed(futuros):
+            pid = futuros[futuro]
+            try:
+                refunds[pid] = futuro.result()
+            except Exception as e:
+                erros[pid] = e
+    return refunds, erros
+
+
+def _lancamentos_pagamento(payment, empresa, categorias, data_padrao, incluir_taxa=True):
+    """
+    Lançamentos (não salvos) de entrada (valor líquido) e taxa de um
+    pagamento MP. Retorna (lancamentos, data do pagamento, descrição).
+    """
+    pid = str(payment['id'])
+
+    # Data do pagamento
+    date_approved = payment.get('date_approved', '')
+    pay_date = date.fromisoformat(date_approved[:10]) if date_approved else data_padrao
+
+    # Valor líquido recebido
+    transaction_details = payment.get('transaction_details', {})
+    net_amount = transaction_details.get('net_received_amount')
+    gross_amount = payment.get('transaction_amount', 0)
+
+    if net_amount is None:
+        net_amount = gross_amount
+
+    descricao = payment.get('description', '') or f'Pagamento MP #{pid}'
+    external_ref = payment.get('external_reference', '')
+    if external_ref:
+        descricao = f'{descricao} (Ref: {external_ref})'
+
+    lancamentos = [Lancamento(
+        empresa=empresa,
+        tipo=TipoLancamento.ENTRADA,
+        categoria=categorias['Venda MP'],
+        descricao=descricao[:300],
+        valor=Decimal(str(net_amount)),
+        data=pay_date,
+        mp_payment_id=f'mp_{pid}',
+        observacao=f'MP Payment ID: {pid}',
+    )]
+
+    # Lançamento de taxa (se houver diferença)
+    fee_amount = Decimal(str(gross_amount)) - Decimal(str(net_amount))
+    if fee_amount > 0 and incluir_taxa:
+        lancamentos.append(Lancamento(
+            empresa=empresa,
+            tipo=TipoLancamento.SAIDA,
+            categoria=categorias['Taxa MP'],
+            descricao=f'Taxa MP - {descricao[:250]}',
+            valor=fee_amount,
+            data=pay_date,
+            mp_payment_id=f'mp_{pid}_fee',
+            observacao=f'Taxa sobre MP Payment ID: {pid}',
+        ))
+    return lancamentos, pay_date, descricao
+
+
+def _lancamentos_estorno(pid, refunds, empresa, categorias, pay_date, descricao):
+    """Lançamentos (não salvos) dos refunds de um pagamento, na data de cada refund."""
+    lancamentos = []
+    for refund in refunds:
+        refund_id = str(refund.get('id', ''))
+        refund_amount = refund.get('amount', 0)
+        data_refund = refund.get('date_created') or ''
+        if refund_amount > 0:
+            lancamentos.append(Lancamento(
+                empresa=empresa,
+                tipo=TipoLancamento.SAIDA,
+                categoria=categorias['Estorno MP'],
+                descricao=f'Estorno MP - {descricao[:250]}',
+                valor=Decimal(str(refund_amount)),
+                data=date.fromisoformat(data_refund[:10]) if data_refund else pay_date,
+                mp_payment_id=f'mp_{pid}_refund_{refund_id}',
+                observacao=f'Refund {refund_id} do MP Payment ID: {pid}',
+            ))
+    return lancamentos
+
+
+def _lancamento_chargeback(payment, empresa, categorias, pay_date, descricao):
+    """Lançamento (não salvo) de um pagamento contestado (chargeback)."""
+    pid = str(payment['id'])
+    data_chargeback = payment.get('date_last_updated') or ''
+    return Lancamento(
+        empresa=empresa,
+        tipo=TipoLancamento.SAIDA,
+        categoria=categorias['Estorno MP'],
+        descricao=f'Chargeback MP - {descricao[:250]}',
+        valor=Decimal(str(payment.get('transaction_amount', 0))),
+        data=date.fromisoformat(data_chargeback[:10]) if data_chargeback else pay_date,
+        mp_payment_id=f'mp_{pid}_chargeback',
+        observacao=f'Chargeback do MP Payment ID: {pid}',
+    )
+
+
+def _contar(stats, lancamentos):
+    for lancamento in lancamentos:
+        if lancamento.mp_payment_id.endswith('_fee'):
+            stats['taxas'] += 1
+        elif '_refund_' in lancamento.mp_payment_id or lancamento.mp_payment_id.endswith('_chargeback'):
+            stats['estornos'] += 1
+        else:
+            stats['criados'] += 1
+
+
+class _ContextoSync:
+    """Estado de uma execução da sync de uma empresa."""
+
+    def __init__(self, config, ao_progredir=None):
+        self.config = config
+        self.ao_progredir = ao_progredir
+        self.empresa = config.empresa
+        self.categorias = _get_or_create_categorias(config.empresa)
+        self.meses_fechados = set(FechamentoMes.objects.filter(empresa=config.empresa).values_list('ano', 'mes'))
+        self.stats = {'criados': 0, 'taxas': 0, 'estornos': 0, 'ignorados': 0, 'paginas': 0, 'erros': []}
+
+
+def _gravar_pagamentos(sessao, ctx, payments, data_padrao):
+    """
+    Upsert de um lote de pagamentos: entrada/taxa dos aprovados ainda não
+    importados, estornos e chargebacks novos. Uma consulta IN resolve o que
+    já existe e um bulk_create grava o resto; o unique de mp_payment_id
+    (ignore_conflicts) cobre syncs simultâneos. Retorna {id (str): erro}
+    dos pagamentos cujos refunds não puderam ser buscados.
+    """
+    stats = ctx.stats
+    pids = [str(payment['id']) for payment in payments]
+    existentes = set(
+        Lancamento.objects.filter(
+            mp_payment_id__in=[f'mp_{pid}{sufixo}' for pid in pids for sufixo in ('', '_fee', '_chargeback')],
+        ).values_list('mp_payment_id', flat=True)
+    )
+
+    novos = []
+    estornados = {}
+    for payment, pid in zip(payments, pids):
+        if not payment.get('date_approved'):
+            continue
+        lancamentos, pay_date, descricao = _lancamentos_pagamento(
+            payment, ctx.empresa, ctx.categorias, data_padrao, incluir_taxa=f'mp_{pid}_fee' not in existentes,
+        )
+        # Pular se já importado (estornos posteriores ainda entram)
+        if f'mp_{pid}' in existentes:
+            stats['ignorados'] += 1
+            lancamentos = []
+        if payment.get('status') == 'charged_back' and f'mp_{pid}_chargeback' not in existentes:
+            lancamentos.append(_lancamento_chargeback(payment, ctx.empresa, ctx.categorias, pay_date, descricao))
+        novos += lancamentos
+        if _tem_estorno(payment):
+            estornados[pid] = (payment, pay_date, descricao)
+
+    # Buscar refunds (só de pagamentos com estorno, em paralelo)
+    refunds, erros = _buscar_refunds(sessao, {pid: p for pid, (p, _, _) in estornados.items()})
+    estornos = []
+    for pid, lista in refunds.items():
+        _, pay_date, descricao = estornados[pid]
+        estornos += _lancamentos_estorno(pid, lista, ctx.empresa, ctx.categorias, pay_date, descricao)
+    if estornos:
+        ja_importados = set(
+            Lancamento.objects.filter(mp_payment_id__in=[l.mp_payment_id for l in estornos])
+            .values_list('mp_payment_id', flat=True)
+        )
+        novos += [l for l in estornos if l.mp_payment_id not in ja_importados]
+    for pid, e in erros.items():
+        logger.warning(f'Erro ao buscar refunds do payment {pid}: {e}')
+        stats['erros'].append(f'Refund {pid}: {e}')
+
+    # Mês fechado: não altera o período (bulk_create não passa pelo save())
+    abertos = [l for l in novos if (l.data.year, l.data.month) not in ctx.meses_fechados]
+    stats['ignorados'] += len(novos) - len(abertos)
+
+    criar_lancamentos(abertos, ignore_conflicts=True)
+    _contar(stats, abertos)
+    return erros
+
+
+def _chave_mp(payment, campo):
+    """(data do campo, id): ordem total dos pagamentos para o cursor."""
+    valor = payment.get(campo)
+    return (datetime.fromisoformat(valor) if valor else None, int(payment['id']))
+
+
+def _sync_janela(sessao, ctx, inicio, fim, campo, status, cursor=None, ao_avancar=None):
     """
-    empresa = config.empresa
-    categorias = _get_or_create_categorias(empresa)
-    stats = {'criados': 0, 'taxas': 0, 'estornos': 0, 'ignorados': 0, 'erros': []}
+    Percorre a busca do MP na janela, em ordem de `campo`, gravando cada página.
 
+    Com `cursor` ((datetime, id)), pula o que já foi visto e pagina por
+    keyset: a próxima busca começa na última data vista, então o offset não
+    cresce; `ao_avancar(chave)` é chamado a cada página para persistir o
+    cursor. O cursor persistido não passa do primeiro pagamento cujos
+    refunds falharam, para a próxima execução buscá-lo de novo.
+    """
+    data_padrao = inicio.date() if isinstance(inicio, datetime) else inicio
     offset = 0
+    vistos = 0
+    persistido = cursor
+    falha = None
     while True:
-        data = _fetch_payments(config.access_token, data_inicio, data_fim, offset)
+        data = _fetch_payments(sessao, inicio, fim, offset, campo, status)
         results = data.get('results', [])
+        ctx.stats['paginas'] += 1
         if not results:
             break
 
-        for payment in results:
-            pid = str(payment['id'])
-            mp_id_entrada = f'mp_{pid}'
-            mp_id_taxa = f'mp_{pid}_fee'
-
-            # Pular se já importado
-            if Lancamento.objects.filter(mp_payment_id=mp_id_entrada).exists():
-                stats['ignorados'] += 1
-                continue
-
-            # Data do pagamento
-            date_approved = payment.get('date_approved', '')
-            if date_approved:
-                pay_date = date_approved[:10]
-            else:
-                pay_date = str(data_inicio)
-
-            # Valor líquido recebido
-            transaction_details = payment.get('transaction_details', {})
-            net_amount = transaction_details.get('net_received_amount')
-            gross_amount = payment.get('transaction_amount', 0)
-
-            if net_amount is None:
-                net_amount = gross_amount
-
-            descricao = payment.get('description', '') or f'Pagamento MP #{pid}'
-            external_ref = payment.get('external_reference', '')
-            if external_ref:
-                descricao = f'{descricao} (Ref: {external_ref})'
-
-            # Lançamento de entrada (valor líquido)
-            Lancamento.objects.create(
-                empresa=empresa,
-                tipo=TipoLancamento.ENTRADA,
-                categoria=categorias['Venda MP'],
-                descricao=descricao[:300],
-                valor=Decimal(str(net_amount)),
-                data=pay_date,
-                mp_payment_id=mp_id_entrada,
-                observacao=f'MP Payment ID: {pid}',
+        chaves = [_chave_mp(p, campo) for p in results]
+        if cursor:
+            novos = [p for p, chave in zip(results, chaves) if chave[0] and chave > cursor]
+        else:
+            novos = results
+        if novos:
+            falhas = _gravar_pagamentos(sessao, ctx, novos, data_padrao)
+            falha = min(
+                [chave for p, chave in zip(results, chaves) if str(p['id']) in falhas and chave[0]]
+                + ([falha] if falha else []),
+                default=None,
             )
-            stats['criados'] += 1
+        vistos += len(results)
+        if ctx.ao_progredir:
+            ctx.ao_progredir(ctx.stats, vistos, data.get('paging', {}).get('total', 0))
+
+        ultima = max((c for c in chaves if c[0]), default=None)
+        if cursor and ultima and ultima > cursor:
+            cursor = ultima
+            gravar = ultima if not falha else max((c for c in chaves if c[0] and c < falha), default=None)
+            if ao_avancar and gravar and gravar > persistido:
+                persistido = gravar
+                ao_avancar(gravar)
+
+        if len(results) < MP_LIMITE_PAGINA or offset + len(results) >= data.get('paging', {}).get('total', 0):
+            break
+        if cursor and cursor[0] > inicio:
+            inicio, offset = cursor[0], 0
+        else:
+            offset += len(results)
 
-            # Lançamento de taxa (se houver diferença)
-            fee_amount = Decimal(str(gross_amount)) - Decimal(str(net_amount))
-            if fee_amount > 0:
-                if not Lancamento.objects.filter(mp_payment_id=mp_id_taxa).exists():
-                    Lancamento.objects.create(
-                        empresa=empresa,
-                        tipo=TipoLancamento.SAIDA,
-                        categoria=categorias['Taxa MP'],
-                        descricao=f'Taxa MP - {descricao[:250]}',
-                        valor=fee_amount,
-                        data=pay_date,
-                        mp_payment_id=mp_id_taxa,
-                        observacao=f'Taxa sobre MP Payment ID: {pid}',
-                    )
-                    stats['taxas'] += 1
-
-            # Buscar refunds
-            try:
-                refunds = _fetch_refunds(config.access_token, pid)
-                for refund in refunds:
-                    refund_id = str(refund.get('id', ''))
-                    mp_id_refund = f'mp_{pid}_refund_{refund_id}'
-                    if Lancamento.objects.filter(mp_payment_id=mp_id_refund).exists():
-                        continue
-                    refund_amount = refund.get('amount', 0)
-                    if refund_amount > 0:
-                        Lancamento.objects.create(
-                            empresa=empresa,
-                            tipo=TipoLancamento.SAIDA,
-                            categoria=categorias['Estorno MP'],
-                            descricao=f'Estorno MP - {descricao[:250]}',
-                            valor=Decimal(str(refund_amount)),
-                            data=pay_date,
-                            mp_payment_id=mp_id_refund,
-                            observacao=f'Refund {refund_id} do MP Payment ID: {pid}',
-                        )
-                        stats['estornos'] += 1
-            except Exception as e:
-                logger.warning(f'Erro ao buscar refunds do payment {pid}: {e}')
-                stats['erros'].append(f'Refund {pid}: {e}')
 
-        paging = data.get('paging', {})
-        total = paging.get('total', 0)
-        offset += len(results)
-        if offset >= total:
-            break
+def sync_mercadopago(config: ConfigMercadoPago, data_inicio: date = None, data_fim: date = None,
+                     ao_progredir=None):
+    """
+    Sincroniza pagamentos do Mercado Pago como lançamentos financeiros.
+    Retorna dict com contadores: criados, taxas, estornos, ignorados, paginas.
+    `ao_progredir(stats, vistos, total)` é chamado a cada página, com os
+    pagamentos vistos e o total informado pela busca na janela atual.
+
+    Sem datas, a sync é incremental pelos cursores da config: pagamentos
+    aprovados depois do último date_approved visto e pagamentos alterados
+    (estornos, chargebacks) depois do último date_last_updated. Os cursores
+    são gravados a cada página, então uma execução interrompida continua de
+    onde parou; sem cursor, começa MP_JANELA_INICIAL_DIAS atrás.
+
+    Com datas, reprocessa a janela de date_approved informada (backfill),
+    sem mexer nos cursores.
+    """
+    ctx = _ContextoSync(config, ao_progredir)
+
+    with _sessao_mp(config.access_token) as sessao:
+        if data_inicio and data_fim:
+            _sync_janela(sessao, ctx, data_inicio, data_fim, 'date_approved', 'approved')
+        else:
+            agora = timezone.now()
+            padrao = agora - timedelta(days=MP_JANELA_INICIAL_DIAS)
+
+            def _cursor_aprovacao(chave):
+                config.cursor_aprovacao, config.cursor_payment_id = chave
+                ConfigMercadoPago.objects.filter(pk=config.pk).update(
+                    cursor_aprovacao=chave[0], cursor_payment_id=chave[1],
+                )
+
+            def _cursor_atualizacao(chave):
+                config.cursor_atualizacao = chave[0]
+                ConfigMercadoPago.objects.filter(pk=config.pk).update(cursor_atualizacao=chave[0])
+
+            _sync_janela(
+                sessao, ctx, config.cursor_aprovacao or padrao, agora, 'date_approved', 'approved',
+                cursor=(config.cursor_aprovacao or padrao, config.cursor_payment_id or 0),
+                ao_avancar=_cursor_aprovacao,
+            )
+            # Pagamentos alterados: o id não desempata date_last_updated, só a data
+            _sync_janela(
+                sessao, ctx, config.cursor_atualizacao or padrao, agora, 'date_last_updated', None,
+                cursor=(config.cursor_atualizacao or padrao, 0),
+                ao_avancar=_cursor_atualizacao,
+            )
 
     config.ultima_sync = timezone.now()
     config.save(update_fields=['ultima_sync'])
 
-    return stats
+    return ctx.stats
+
+
+def executar_sync_mercadopago(config_id, data_inicio, data_fim, progresso):
+    """
+    Sync manual de uma janela em segundo plano (ver `tarefas.iniciar_tarefa`);
+    datas em ISO. Informa páginas e lançamentos gravados a cada página e
+    retorna os contadores da sync.
+    """
+    config = ConfigMercadoPago.objects.select_related('empresa').get(id=config_id)
+
+    def _resumo(stats):
+        return {
+            'empresa': config.empresa.nome,
+            **{campo: stats[campo] for campo in ('paginas', 'criados', 'taxas', 'estornos', 'ignorados')},
+            'erros': stats['erros'][:20],
+        }
+
+    def _progresso(stats, vistos, total):
+        gravados = stats['criados'] + stats['taxas'] + stats['estornos']
+        progresso(
+            vistos * 99 // max(total, 1),
+            f'{stats["paginas"]} página(s), {vistos} de {total} pagamentos, {gravados} lançamentos gravados',
+            dados=_resumo(stats),
+        )
+
+    stats = sync_mercadopago(
+        config, date.fromisoformat(data_inicio), date.fromisoformat(data_fim), ao_progredir=_progresso,
+    )
+    return _resumo(stats)
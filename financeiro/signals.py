@@ -0,0 +1,37 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.dateparse import parse_date
+
+from .dre import invalidar_cache_dre, mes_encerrado
+from .models import CategoriaLancamento, Lancamento
+
+
+def _data(valor):
+    if isinstance(valor, str):
+        return parse_date(valor)
+    return valor
+
+
+@receiver(post_save, sender=Lancamento)
+def lancamento_salvo(sender, instance, created, **kwargs):
+    """Lançamento novo no mês corrente não altera meses encerrados; edições podem mover a data."""
+    data = _data(instance.data)
+    if created and data and not mes_encerrado(data):
+        return
+    invalidar_cache_dre()
+
+
+@receiver(post_delete, sender=Lancamento)
+def lancamento_excluido(sender, instance, **kwargs):
+    data = _data(instance.data)
+    if data is None or mes_encerrado(data):
+        invalidar_cache_dre()
+
+
+@receiver(post_save, sender=CategoriaLancamento)
+@receiver(post_delete, sender=CategoriaLancamento)
+def categoria_alterada(sender, instance, **kwargs):
+    """Nome e linha_dre da categoria definem a linha do DRE."""
+    if kwargs.get('created'):
+        return
+    invalidar_cache_dre()
@@ -0,0 +1,148 @@
+"""
+Execução de tarefas financeiras em segundo plano.
+
+Não há worker de fila no deploy (só o gunicorn e o scheduler), então a
+tarefa roda numa thread do próprio processo web, registrada em
+`TarefaFinanceira` para que a página acompanhe o progresso. O trabalho
+pesado de CPU (ex.: parse de PDF) é distribuído pela própria função em
+processos separados.
+
+Enquanto a tarefa roda, um batimento renova `atualizado_em`. Se o processo
+morre (restart/deploy do gunicorn), o batimento para junto com a thread e
+`verificar_interrompida` marca a tarefa como erro depois de
+TEMPO_SEM_BATIMENTO, para a página parar de esperar.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import TarefaFinanceira
+
+logger = logging.getLogger(__name__)
+
+# Intervalo mínimo entre gravações de progresso
+INTERVALO_PROGRESSO = 1.0
+# Batimento da tarefa em execução (segundos) e quanto tempo sem ele indica
+# que o processo que a rodava morreu
+INTERVALO_BATIMENTO = 30
+TEMPO_SEM_BATIMENTO = timedelta(minutes=5)
+
+
+def iniciar_tarefa(tipo, funcao, *args, pessoa=None, descricao='', **kwargs):
+    """
+    Cria a tarefa e agenda `funcao(*args, progresso=..., **kwargs)` numa
+    thread após o commit. `progresso(percentual, mensagem='', dados=None)`
+    atualiza o registro (`dados`, parciais em JSON, vão para `resultado`); o
+    retorno da função (JSON) vai para `resultado`.
+    """
+    tarefa = TarefaFinanceira.objects.create(tipo=tipo, descricao=descricao[:255], criado_por=pessoa)
+    schema = getattr(connection, 'schema_name', None)
+
+    def _disparar():
+        threading.Thread(
+            target=_executar, args=(tarefa.id, schema, funcao, args, kwargs),
+            name=f'tarefa-{tarefa.id}', daemon=True,
+        ).start()
+
+    transaction.on_commit(_disparar)
+    return tarefa
+
+
+def schemas_ativos():
+    """Schemas dos tenants ativos; [None] quando o deploy não é multi-tenant."""
+    if 'django_tenants' not in settings.INSTALLED_APPS:
+        return [None]
+    from django_tenants.utils import get_public_schema_name, get_tenant_model
+    return list(
+        get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        .filter(ativo=True).values_list('schema_name', flat=True)
+    )
+
+
+@contextmanager
+def no_schema(schema):
+    """Executa o bloco no schema do tenant (nada a fazer sem tenant ou no public)."""
+    if schema and schema != 'public':
+        from django_tenants.utils import schema_context
+        with schema_context(schema):
+            yield
+    else:
+        yield
+
+
+def verificar_interrompida(tarefa):
+    """
+    Marca como erro (interrompida) a tarefa não finalizada cujo registro não
+    é atualizado há TEMPO_SEM_BATIMENTO. Retorna a tarefa atualizada.
+    """
+    if tarefa.finalizada:
+        return tarefa
+    agora = timezone.now()
+    if TarefaFinanceira.objects.filter(
+        id=tarefa.id, status__in=('pendente', 'executando'), atualizado_em__lt=agora - TEMPO_SEM_BATIMENTO,
+    ).update(status='erro', mensagem=TarefaFinanceira.MENSAGEM_INTERROMPIDA, atualizado_em=agora, concluido_em=agora):
+        logger.warning('Tarefa financeira %s interrompida (sem batimento)', tarefa.id)
+        tarefa.refresh_from_db()
+    return tarefa
+
+
+def _bater(tarefa_id, schema, parar):
+    """Renova atualizado_em da tarefa até `parar` ser sinalizado."""
+    try:
+        with no_schema(schema):
+            while not parar.wait(INTERVALO_BATIMENTO):
+                TarefaFinanceira.objects.filter(id=tarefa_id, status='executando').update(
+                    atualizado_em=timezone.now(),
+                )
+    except Exception:
+        logger.exception('Erro no batimento da tarefa financeira %s', tarefa_id)
+    finally:
+        connection.close()
+
+
+def _executar(tarefa_id, schema, funcao, args, kwargs):
+    parar = threading.Event()
+    threading.Thread(
+        target=_bater, args=(tarefa_id, schema, parar), name=f'tarefa-{tarefa_id}-batimento', daemon=True,
+    ).start()
+    try:
+        with no_schema(schema):
+            _rodar(tarefa_id, funcao, args, kwargs)
+    finally:
+        parar.set()
+
+
+def _rodar(tarefa_id, funcao, args, kwargs):
+    ultima = [0.0]
+
+    def progresso(percentual, mensagem='', dados=None):
+        agora = time.monotonic()
+        if agora - ultima[0] < INTERVALO_PROGRESSO and percentual < 100:
+            return
+        ultima[0] = agora
+        campos = {'progresso': max(0, min(int(percentual), 100)), 'mensagem': mensagem[:255]}
+        if dados is not None:
+            campos['resultado'] = dados
+        TarefaFinanceira.objects.filter(id=tarefa_id).update(atualizado_em=timezone.now(), **campos)
+
+    try:
+        TarefaFinanceira.objects.filter(id=tarefa_id).update(status='executando', atualizado_em=timezone.now())
+        resultado = funcao(*args, progresso=progresso, **kwargs)
+        TarefaFinanceira.objects.filter(id=tarefa_id).update(
+            status='concluida', progresso=100, resultado=resultado,
+            atualizado_em=timezone.now(), concluido_em=timezone.now(),
+        )
+    except Exception as e:
+        logger.exception('Erro na tarefa financeira %s', tarefa_id)
+        TarefaFinanceira.objects.filter(id=tarefa_id).update(
+            status='erro', mensagem=str(e)[:255],
+            atualizado_em=timezone.now(), concluido_em=timezone.now(),
+        )
+    finally:
+        connection.close()
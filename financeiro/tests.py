@@ -1,3 +1,189 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import Empresa
+
+from . import services
+from .models import ConfigMercadoPago, Lancamento, NotificacaoMP, TarefaFinanceira
+from .mp_fake import ServidorMPFake
+from .tarefas import TEMPO_SEM_BATIMENTO, verificar_interrompida
+from .webhook_mp import INTERVALO_RETENTATIVA, _proxima_retentativa, processar_notificacoes
+
+
+def _pagamento(pid, dia, bruto='100.00', liquido='95.00', **extra):
+    quando = f'{dia.isoformat()}T10:00:00.000-03:00'
+    return {
+        'id': pid,
+        'status': 'approved',
+        'description': f'Pedido {pid}',
+        'date_approved': quando,
+        'date_last_updated': quando,
+        'transaction_amount': float(bruto),
+        'transaction_details': {'net_received_amount': float(liquido)},
+        **extra,
+    }
+
+
+class MercadoPagoFakeTestCase(TestCase):
+    """Sync e webhook do MP contra o servidor local (`mp_fake`)."""
+
+    def setUp(self):
+        self.mp = ServidorMPFake()
+        self.mp.__enter__()
+        self.addCleanup(self.mp.__exit__, None, None, None)
+        configuracao = override_settings(MERCADOPAGO_API_BASE=self.mp.url)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        self.empresa = Empresa.objects.create(nome='Loja')
+        self.config = ConfigMercadoPago.objects.create(empresa=self.empresa, access_token='TEST-token')
+        self.hoje = timezone.localdate()
+
+    def _ids(self):
+        return set(Lancamento.objects.filter(empresa=self.empresa).values_list('mp_payment_id', flat=True))
+
+
+class WebhookMPTests(MercadoPagoFakeTestCase):
+
+    def test_webhook_enfileira_pagamento(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            resp = self.client.post(
+                f'/financeiro/mercadopago/webhook/{self.config.webhook_token}/',
+                data={'type': 'payment', 'action': 'payment.created', 'data': {'id': '123'}},
+                content_type='application/json',
+            )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(callbacks), 1)
+        notificacao = NotificacaoMP.objects.get()
+        self.assertEqual((notificacao.payment_id, notificacao.status), ('123', 'pendente'))
+
+    def test_webhook_token_invalido(self):
+        resp = self.client.post('/financeiro/mercadopago/webhook/invalido/', data={}, content_type='application/json')
+        self.assertEqual(resp.status_code, 404)
+        self.assertFalse(NotificacaoMP.objects.exists())
+
+    def test_processa_pagamento_com_taxa_e_estorno(self):
+        self.mp.adicionar(_pagamento(1, self.hoje, transaction_amount_refunded=10))
+        self.mp.refunds[1] = [{'id': 9, 'amount': 10, 'date_created': f'{self.hoje}T12:00:00.000-03:00'}]
+        NotificacaoMP.objects.create(config=self.config, payment_id='1')
+
+        resultado = processar_notificacoes()
+
+        self.assertEqual((resultado['processadas'], resultado['erros']), (1, 0))
+        self.assertEqual(self._ids(), {'mp_1', 'mp_1_fee', 'mp_1_refund_9'})
+        self.assertEqual(Lancamento.objects.get(mp_payment_id='mp_1').valor, Decimal('95.00'))
+        self.assertEqual(NotificacaoMP.objects.get().status, 'processada')
+
+        # Notificação repetida não duplica lançamentos
+        NotificacaoMP.objects.create(config=self.config, payment_id='1')
+        processar_notificacoes()
+        self.assertEqual(Lancamento.objects.filter(empresa=self.empresa).count(), 3)
+
+    def test_pagamento_inexistente_e_erro_definitivo(self):
+        NotificacaoMP.objects.create(config=self.config, payment_id='404')
+
+        resultado = processar_notificacoes()
+
+        self.assertEqual((resultado['processadas'], resultado['erros']), (0, 1))
+        notificacao = NotificacaoMP.objects.get()
+        self.assertEqual(notificacao.status, 'erro')
+        self.assertIsNotNone(notificacao.processado_em)
+        self.assertIsNone(_proxima_retentativa())
+
+    def test_refund_com_erro_volta_para_fila(self):
+        self.mp.adicionar(_pagamento(1, self.hoje, transaction_amount_refunded=10))
+        self.mp.falhas['/v1/payments/1/refunds'] = 403
+        NotificacaoMP.objects.create(config=self.config, payment_id='1')
+
+        resultado = processar_notificacoes()
+
+        self.assertEqual((resultado['processadas'], resultado['erros']), (0, 1))
+        notificacao = NotificacaoMP.objects.get()
+        self.assertEqual((notificacao.status, notificacao.tentativas), ('pendente', 1))
+        self.assertIn('403', notificacao.erro)
+        self.assertIsNone(notificacao.processado_em)
+
+    def test_proxima_retentativa(self):
+        self.assertIsNone(_proxima_retentativa())
+        notificacao = NotificacaoMP.objects.create(config=self.config, payment_id='1', tentativas=1)
+        notificacao.refresh_from_db()
+        self.assertEqual(_proxima_retentativa(), notificacao.atualizado_em + INTERVALO_RETENTATIVA)
+
+
+class SyncMercadoPagoTests(MercadoPagoFakeTestCase):
+
+    def test_sync_janela_paginada(self):
+        for pid in range(1, 6):
+            self.mp.adicionar(_pagamento(pid, self.hoje - timedelta(days=pid)))
+        self.mp.adicionar({**_pagamento(6, self.hoje), 'status': 'pending', 'date_approved': None})
+
+        with mock.patch.object(services, 'MP_LIMITE_PAGINA', 2):
+            stats = services.sync_mercadopago(self.config, self.hoje - timedelta(days=10), self.hoje)
+
+        self.assertEqual((stats['criados'], stats['taxas'], stats['paginas']), (5, 5, 3))
+        self.assertEqual(self._ids(), {f'mp_{pid}{s}' for pid in range(1, 6) for s in ('', '_fee')})
+
+        stats = services.sync_mercadopago(self.config, self.hoje - timedelta(days=10), self.hoje)
+        self.assertEqual((stats['criados'], stats['ignorados']), (0, 5))
+
+    def test_sync_incremental_avanca_cursor(self):
+        self.mp.adicionar(_pagamento(1, self.hoje - timedelta(days=1)))
+
+        services.sync_mercadopago(self.config)
+        self.config.refresh_from_db()
+        self.assertEqual(self.config.cursor_payment_id, 1)
+
+        # Mesmo date_approved: o id desempata o cursor
+        self.mp.adicionar(_pagamento(2, self.hoje - timedelta(days=1)))
+        stats = services.sync_mercadopago(self.config)
+        self.assertEqual(stats['criados'], 1)
+        self.assertEqual(self._ids(), {'mp_1', 'mp_1_fee', 'mp_2', 'mp_2_fee'})
+
+    def test_sync_refund_com_erro_segura_cursor(self):
+        self.mp.adicionar(_pagamento(1, self.hoje - timedelta(days=2), transaction_amount_refunded=10))
+        self.mp.adicionar(_pagamento(2, self.hoje - timedelta(days=1)))
+        self.mp.falhas['/v1/payments/1/refunds'] = 404
+
+        stats = services.sync_mercadopago(self.config)
+        self.config.refresh_from_db()
+        self.assertTrue(stats['erros'])
+        self.assertIsNone(self.config.cursor_payment_id)
+
+        # A próxima execução volta ao pagamento e importa o estorno
+        del self.mp.falhas['/v1/payments/1/refunds']
+        self.mp.refunds[1] = [{'id': 9, 'amount': 10, 'date_created': f'{self.hoje}T09:00:00.000-03:00'}]
+        services.sync_mercadopago(self.config)
+        self.config.refresh_from_db()
+        self.assertIn('mp_1_refund_9', self._ids())
+        self.assertEqual(self.config.cursor_payment_id, 2)
+
+    def test_sync_sem_token_valido_falha(self):
+        self.mp.falhas['/v1/payments/search'] = 401
+        with self.assertRaises(requests.HTTPError):
+            services.sync_mercadopago(self.config, date(2026, 1, 1), date(2026, 1, 31))
+
+
+class TarefaInterrompidaTests(TestCase):
+
+    def test_tarefa_sem_batimento_vira_erro(self):
+        tarefa = TarefaFinanceira.objects.create(tipo='sync_mp', status='executando')
+        self.assertEqual(verificar_interrompida(tarefa).status, 'executando')
+
+        antigo = timezone.now() - TEMPO_SEM_BATIMENTO - timedelta(seconds=1)
+        TarefaFinanceira.objects.filter(id=tarefa.id).update(atualizado_em=antigo)
+        tarefa = verificar_interrompida(TarefaFinanceira.objects.get(id=tarefa.id))
+
+        self.assertEqual(tarefa.status, 'erro')
+        self.assertTrue(tarefa.finalizada and tarefa.interrompida)
+        self.assertIsNotNone(tarefa.concluido_em)
+
+    def test_tarefa_finalizada_nao_muda(self):
+        tarefa = TarefaFinanceira.objects.create(tipo='sync_mp', status='concluida')
+        TarefaFinanceira.objects.filter(id=tarefa.id).update(atualizado_em=timezone.now() - timedelta(days=1))
+        tarefa = verificar_interrompida(TarefaFinanceira.objects.get(id=tarefa.id))
+        self.assertEqual(tarefa.status, 'concluida')
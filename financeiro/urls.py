@@ -12,12 +12,17 @@ urlpatterns = [
     path('categorias/por-empresa/<int:empresa_id>/', views.categorias_por_empresa, name='categorias_por_empresa'),
     path('mercadopago/config/', views.config_mercadopago, name='config_mercadopago'),
     path('mercadopago/sync/', views.sync_mercadopago_view, name='sync_mercadopago'),
+    path('mercadopago/webhook/<str:token>/', views.webhook_mercadopago, name='webhook_mercadopago'),
     path('contas/', views.contas_bancarias, name='contas_bancarias'),
     path('importar-extrato/', views.importar_extrato, name='importar_extrato'),
+    path('conciliacao/', views.conciliacao_bancaria, name='conciliacao_bancaria'),
+    path('tarefa/<int:tarefa_id>/status/', views.status_tarefa, name='status_tarefa'),
     path('lancamento/<int:lancamento_id>/prestacao/', views.prestacao_contas, name='prestacao_contas'),
     path('prestacao/<int:prestacao_id>/excluir/', views.excluir_prestacao, name='excluir_prestacao'),
     path('relatorio/', views.relatorio_financeiro, name='relatorio_financeiro'),
     path('registrar-retirada/', views.registrar_retirada, name='registrar_retirada'),
+    path('fechamento/fechar/', views.fechar_mes_view, name='fechar_mes'),
+    path('fechamento/<int:fechamento_id>/reabrir/', views.reabrir_mes_view, name='reabrir_mes'),
     path('contas-pagar/', views.contas_pagar, name='contas_pagar'),
     path('contas-pagar/pagar/<int:item_id>/', views.pagar_conta, name='pagar_conta'),
     # Contas a Receber
@@ -25,8 +30,10 @@ urlpatterns = [
     path('contas-receber/<int:conta_id>/', views.detalhe_conta_receber, name='detalhe_conta_receber'),
     path('contas-receber/receber/<int:item_id>/', views.receber_conta, name='receber_conta'),
     path('contas-receber/cancelar/<int:item_id>/', views.cancelar_conta_receber, name='cancelar_conta_receber'),
+    path('contas-receber/retorno-cnab/', views.retorno_cnab, name='retorno_cnab'),
     # Fluxo de Caixa
     path('fluxo-caixa/', views.fluxo_caixa, name='fluxo_caixa'),
+    path('fluxo-caixa/simulacao/', views.simulacao_fluxo_caixa, name='simulacao_fluxo_caixa'),
     # DRE Simplificado
     path('dre/', views.dre_simplificado, name='dre_simplificado'),
     # Alertas Financeiros
@@ -1,17 +1,25 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.utils import timezone
-from django.db.models import Sum, Q, F, Value, CharField
+from django.db.models import Sum, Q, F, CharField
 from django.db.models.functions import Coalesce
-from .models import MetaEmpresa, CategoriaLancamento, Lancamento, TipoLancamento, ConfigMercadoPago, ContaBancaria, PrestacaoConta, ContaPagar, ContaPagarItem, ContaReceber, ContaReceberItem, AlertaFinanceiro, HistoricoAlerta
+from .dre import calcular_dre, invalidar_cache_dre, mes_encerrado
+from .fechamento import (
+    fechar_mes, filtrar_periodos_abertos, reabrir_mes, relatorio_mensal, relatorios_fechados,
+)
+from .projecao import Cenario, contas_com_saldo, projetar_fluxo_caixa, simular_cenario
+from .models import MetaEmpresa, CategoriaLancamento, Lancamento, LinhaDRE, TipoLancamento, ConfigMercadoPago, ContaBancaria, PrestacaoConta, FechamentoMes, PeriodoFechadoError, ContaPagar, ContaPagarItem, ContaReceber, ContaReceberItem, AlertaFinanceiro, HistoricoAlerta, TarefaFinanceira
 from core.models import Pessoa, Empresa
 from checklists.models import Projeto
 from decimal import Decimal
 import json
-from datetime import datetime, timedelta
+import math
+from datetime import date, datetime, timedelta
 
 
 def get_pessoa_or_redirect(request):
@@ -126,18 +134,22 @@ def lancar(request):
             messages.error(request, 'Descrição obrigatória.')
             return redirect('lancar')
 
-        Lancamento.objects.create(
-            empresa=empresa,
-            tipo=tipo,
-            categoria_id=categoria_id,
-            descricao=descricao,
-            valor=valor,
-            data=data,
-            pessoa_id=pessoa_id,
-            projeto_id=projeto_id,
-            observacao=observacao,
-            criado_por=pessoa,
-        )
+        try:
+            Lancamento.objects.create(
+                empresa=empresa,
+                tipo=tipo,
+                categoria_id=categoria_id,
+                descricao=descricao,
+                valor=valor,
+                data=data,
+                pessoa_id=pessoa_id,
+                projeto_id=projeto_id,
+                observacao=observacao,
+                criado_por=pessoa,
+            )
+        except PeriodoFechadoError as e:
+            messages.error(request, str(e))
+            return redirect('lancar')
         messages.success(request, f'Lançamento de R$ {valor:,.2f} registrado.')
         return redirect('dashboard_financeiro')
 
@@ -165,6 +177,8 @@ def lista_lancamentos(request):
     tipo = request.GET.get('tipo')
     hoje = timezone.localdate()
 
+    from .listagem import filtrar_lancamentos, pagina_lancamentos, totais_lancamentos
+
     lancamentos = Lancamento.objects.select_related('empresa', 'categoria', 'pessoa', 'projeto')
 
     if empresa_id:
@@ -173,37 +187,54 @@ def lista_lancamentos(request):
         mes = hoje.month
     if not ano:
         ano = hoje.year
-    lancamentos = lancamentos.filter(data__month=int(mes), data__year=int(ano))
+    # Intervalo de datas (usa o índice), em vez de data__month/data__year
+    inicio = date(int(ano), int(mes), 1)
+    fim = date(inicio.year + 1, 1, 1) if inicio.month == 12 else date(inicio.year, inicio.month + 1, 1)
+    lancamentos = lancamentos.filter(data__gte=inicio, data__lt=fim)
     if tipo:
         lancamentos = lancamentos.filter(tipo=tipo)
+    lancamentos = filtrar_lancamentos(lancamentos, request.GET)
 
-    total_entradas = lancamentos.filter(tipo='entrada').aggregate(t=Sum('valor'))['t'] or Decimal('0')
-    total_saidas = lancamentos.filter(tipo='saida').aggregate(t=Sum('valor'))['t'] or Decimal('0')
+    totais = totais_lancamentos(lancamentos)
+    pagina = pagina_lancamentos(lancamentos, request.GET.get('apos'), request.GET.get('antes'))
 
-    # Categorias para ação em lote
+    # Categorias para filtro e ação em lote
     categorias = CategoriaLancamento.objects.filter(ativo=True)
+    contas = ContaBancaria.objects.filter(ativo=True)
+    projetos = Projeto.objects.all()
     if empresa_id:
         categorias = categorias.filter(Q(empresa_id=empresa_id) | Q(empresa__isnull=True))
+        contas = contas.filter(empresa_id=empresa_id)
+        projetos = projetos.filter(empresa_id=empresa_id)
     categorias = categorias.order_by('tipo', 'ordem', 'nome')
 
-    sem_categoria = request.GET.get('sem_categoria')
-
-    lancamentos_qs = lancamentos
-    if sem_categoria:
-        lancamentos_qs = lancamentos_qs.filter(categoria__isnull=True)
+    # Query string dos filtros, para os links de página
+    filtros = request.GET.copy()
+    filtros.pop('apos', None)
+    filtros.pop('antes', None)
 
     context = {
-        'lancamentos': lancamentos_qs[:500],
+        'lancamentos': pagina['itens'],
+        'proximo': pagina['proximo'],
+        'anterior': pagina['anterior'],
+        'filtros_query': filtros.urlencode(),
         'empresas': empresas,
         'empresa_id': empresa_id,
         'mes': int(mes),
         'ano': int(ano),
         'tipo': tipo,
-        'total_entradas': total_entradas,
-        'total_saidas': total_saidas,
-        'saldo': total_entradas - total_saidas,
+        'total_entradas': totais['entradas'],
+        'total_saidas': totais['saidas'],
+        'saldo': totais['saldo'],
+        'quantidade': totais['quantidade'],
         'categorias': categorias,
-        'sem_categoria': sem_categoria,
+        'contas': contas.order_by('nome'),
+        'projetos': projetos.order_by('titulo'),
+        'categoria_id': request.GET.get('categoria', ''),
+        'conta_id': request.GET.get('conta', ''),
+        'projeto_id': request.GET.get('projeto', ''),
+        'busca': request.GET.get('q', ''),
+        'sem_categoria': request.GET.get('sem_categoria'),
     }
     return render(request, 'financeiro/lista_lancamentos.html', context)
 
@@ -224,8 +255,11 @@ def categorizar_lote(request):
         return redirect(request.META.get('HTTP_REFERER', 'lista_lancamentos'))
 
     categoria = get_object_or_404(CategoriaLancamento, id=categoria_id)
-    qtd = Lancamento.objects.filter(id__in=ids).update(categoria=categoria)
+    qtd = filtrar_periodos_abertos(Lancamento.objects.filter(id__in=ids)).update(categoria=categoria)
+    invalidar_cache_dre()
     messages.success(request, f'{qtd} lançamentos categorizados como "{categoria.nome}".')
+    if qtd < len(ids):
+        messages.warning(request, f'{len(ids) - qtd} lançamento(s) em mês fechado não foram alterados.')
     return redirect(request.META.get('HTTP_REFERER', 'lista_lancamentos'))
 
 
@@ -233,7 +267,11 @@ def categorizar_lote(request):
 @require_POST
 def excluir_lancamento(request, lancamento_id):
     lancamento = get_object_or_404(Lancamento, id=lancamento_id)
-    lancamento.delete()
+    try:
+        lancamento.delete()
+    except PeriodoFechadoError as e:
+        messages.error(request, str(e))
+        return redirect('lista_lancamentos')
     messages.success(request, 'Lançamento excluído.')
     return redirect('lista_lancamentos')
 
@@ -286,6 +324,7 @@ def gerenciar_categorias(request):
         nome = request.POST.get('nome', '').strip()
         tipo = request.POST.get('tipo')
         cor = request.POST.get('cor', '#6b7280')
+        linha_dre = request.POST.get('linha_dre', '')
 
         if nome and tipo:
             CategoriaLancamento.objects.create(
@@ -293,6 +332,7 @@ def gerenciar_categorias(request):
                 nome=nome,
                 tipo=tipo,
                 cor=cor,
+                linha_dre=linha_dre,
             )
             messages.success(request, f'Categoria "{nome}" criada.')
         return redirect('gerenciar_categorias')
@@ -303,6 +343,7 @@ def gerenciar_categorias(request):
         'empresas': empresas,
         'categorias': categorias,
         'tipos': TipoLancamento.choices,
+        'linhas_dre': LinhaDRE.choices,
     }
     return render(request, 'financeiro/categorias.html', context)
 
@@ -341,10 +382,44 @@ def config_mercadopago(request):
         messages.success(request, f'Integração MP {action} para {empresa.nome}.')
         return redirect('config_mercadopago')
 
+    # Acompanhamento de uma sync em andamento
+    tarefa = None
+    if request.GET.get('tarefa'):
+        from .tarefas import verificar_interrompida
+
+        tarefa = TarefaFinanceira.objects.filter(
+            id=request.GET['tarefa'] if request.GET['tarefa'].isdigit() else 0, criado_por=pessoa, tipo='sync_mp',
+        ).first()
+        if not tarefa:
+            return redirect('config_mercadopago')
+        tarefa = verificar_interrompida(tarefa)
+        if tarefa.interrompida:
+            messages.warning(
+                request,
+                'Sincronização interrompida (o servidor reiniciou). Os lançamentos já gravados foram '
+                'mantidos; sincronize de novo para completar o período.',
+            )
+            return redirect('config_mercadopago')
+        if tarefa.status == 'erro':
+            messages.error(request, f'Erro na sincronização: {tarefa.mensagem}')
+            return redirect('config_mercadopago')
+        if tarefa.status == 'concluida':
+            stats = tarefa.resultado or {}
+            messages.success(
+                request,
+                f'Sync {stats.get("empresa", "")}: {stats.get("criados", 0)} vendas, '
+                f'{stats.get("taxas", 0)} taxas, {stats.get("estornos", 0)} estornos importados. '
+                f'{stats.get("ignorados", 0)} já existentes.'
+            )
+            if stats.get('erros'):
+                messages.warning(request, f'Avisos: {"; ".join(stats["erros"][:3])}')
+            return redirect('config_mercadopago')
+
     configs = ConfigMercadoPago.objects.select_related('empresa').all()
     context = {
         'empresas': empresas,
         'configs': configs,
+        'tarefa': tarefa,
     }
     return render(request, 'financeiro/mercadopago.html', context)
 
@@ -352,7 +427,9 @@ def config_mercadopago(request):
 @login_required
 @require_POST
 def sync_mercadopago_view(request):
-    from .services import sync_mercadopago
+    """Agenda a sync da janela em segundo plano; a página acompanha pelo status da tarefa."""
+    from .services import executar_sync_mercadopago
+    from .tarefas import iniciar_tarefa
 
     pessoa = get_pessoa_or_redirect(request)
     if not pessoa:
@@ -379,20 +456,43 @@ def sync_mercadopago_view(request):
         messages.error(request, 'Formato de data inválido.')
         return redirect('config_mercadopago')
 
+    tarefa = iniciar_tarefa(
+        'sync_mp', executar_sync_mercadopago, config.id, data_inicio.isoformat(), data_fim.isoformat(),
+        pessoa=pessoa,
+        descricao=f'Sync MP {empresa.nome} ({data_inicio.strftime("%d/%m/%Y")} a {data_fim.strftime("%d/%m/%Y")})',
+    )
+    return redirect(f'/financeiro/mercadopago/config/?tarefa={tarefa.id}')
+
+
+@csrf_exempt
+@require_POST
+def webhook_mercadopago(request, token):
+    """
+    Notificações de pagamento do Mercado Pago (webhook ou IPN). Só enfileira o
+    id e responde na hora; o pagamento é buscado na API e importado em segundo
+    plano. O token da URL identifica a config.
+    """
+    from .webhook_mp import enfileirar_notificacao
+
+    config = ConfigMercadoPago.objects.filter(webhook_token=token, ativo=True).first()
+    if not config:
+        return JsonResponse({'status': 'not_found'}, status=404)
+
     try:
-        stats = sync_mercadopago(config, data_inicio, data_fim)
-        messages.success(
-            request,
-            f'Sync {empresa.nome}: {stats["criados"]} vendas, '
-            f'{stats["taxas"]} taxas, {stats["estornos"]} estornos importados. '
-            f'{stats["ignorados"]} já existentes.'
-        )
-        if stats['erros']:
-            messages.warning(request, f'Avisos: {"; ".join(stats["erros"][:3])}')
-    except Exception as e:
-        messages.error(request, f'Erro na sincronização: {e}')
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    dados = data.get('data') if isinstance(data.get('data'), dict) else {}
+    tipo = data.get('type') or data.get('topic') or request.GET.get('type') or request.GET.get('topic')
+    payment_id = str(dados.get('id') or request.GET.get('data.id') or request.GET.get('id') or '')
+
+    if tipo != 'payment' or not payment_id.isdigit():
+        return JsonResponse({'status': 'ignored'})
 
-    return redirect('config_mercadopago')
+    enfileirar_notificacao(config, payment_id, str(data.get('action') or ''))
+    return JsonResponse({'status': 'ok'})
 
 
 @login_required
@@ -439,16 +539,128 @@ def contas_bancarias(request):
     return render(request, 'financeiro/contas_bancarias.html', context)
 
 
+@login_required
+def conciliacao_bancaria(request):
+    """Vincula lançamentos do extrato a contas a pagar/receber em aberto"""
+    pessoa = get_pessoa_or_redirect(request)
+    if not pessoa:
+        return redirect('dashboard')
+
+    from .conciliacao import CONFIANCA_AUTOMATICA, aplicar_conciliacao, sugerir_conciliacao
+
+    contas = ContaBancaria.objects.filter(ativo=True).select_related('empresa')
+    hoje = timezone.localdate()
+    params = request.POST if request.method == 'POST' else request.GET
+    conta_id = params.get('conta', '')
+    try:
+        mes = int(params.get('mes', hoje.month))
+        ano = int(params.get('ano', hoje.year))
+    except ValueError:
+        mes, ano = hoje.month, hoje.year
+    mes = max(1, min(mes, 12))
+    ano = max(2000, min(ano, hoje.year + 1))
+    conta = get_object_or_404(ContaBancaria, id=conta_id) if conta_id.isdigit() else contas.first()
+    if not conta:
+        return render(request, 'financeiro/conciliacao.html', {'contas': contas})
+
+    inicio = date(ano, mes, 1)
+    fim = (inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    url = f'/financeiro/conciliacao/?conta={conta.id}&mes={mes}&ano={ano}'
+
+    if request.method == 'POST':
+        if 'automatica' in request.POST:
+            pares = [
+                (s.tipo, s.item_id, s.lancamento_id)
+                for s in sugerir_conciliacao(conta, inicio, fim) if s.confianca >= CONFIANCA_AUTOMATICA
+            ]
+        else:
+            pares = [p.split(':') for p in request.POST.getlist('par') if p.count(':') == 2]
+        aplicados = aplicar_conciliacao(conta, pares)
+        messages.success(request, f'{aplicados} lançamento(s) conciliado(s).')
+        return redirect(url)
+
+    sugestoes = sugerir_conciliacao(conta, inicio, fim)
+    context = {
+        'contas': contas,
+        'conta': conta,
+        'mes': mes,
+        'ano': ano,
+        'sugestoes': sugestoes[:500],
+        'total_sugestoes': len(sugestoes),
+        'automaticas': sum(1 for s in sugestoes if s.confianca >= CONFIANCA_AUTOMATICA),
+        'confianca_automatica': CONFIANCA_AUTOMATICA,
+        'meses_choices': range(1, 13),
+    }
+    return render(request, 'financeiro/conciliacao.html', context)
+
+
 @login_required
 def importar_extrato(request):
     pessoa = get_pessoa_or_redirect(request)
     if not pessoa:
         return redirect('dashboard')
 
+    from .importacao import (
+        CAMPOS_LAYOUT, corrigir_layout, criar_sessao, importar_lancamentos, layouts_da_conta,
+        linhas_da_sessao, obter_sessao, registrar_layout,
+    )
+
     contas = ContaBancaria.objects.filter(ativo=True).select_related('empresa')
 
+    # Confirmação/cancelamento de um preview: importa da sessão, sem reenviar o arquivo
+    if request.method == 'POST' and request.POST.get('sessao'):
+        sessao = obter_sessao(request.POST['sessao'], pessoa)
+        if not sessao:
+            messages.error(request, 'A visualização expirou. Envie o arquivo novamente.')
+            return redirect('importar_extrato')
+
+        if 'cancelar' in request.POST:
+            sessao.delete()
+            messages.info(request, 'Importação cancelada.')
+            return redirect('importar_extrato')
+
+        # Correção do layout detectado: vale para as próximas importações
+        if 'corrigir_layout' in request.POST and sessao.layout:
+            colunas = {
+                campo: int(request.POST[f'col_{campo}']) if request.POST.get(f'col_{campo}', '').isdigit() else None
+                for campo in CAMPOS_LAYOUT
+            }
+            try:
+                corrigir_layout(sessao.layout, colunas)
+            except ValueError as e:
+                messages.error(request, str(e))
+                return redirect(f'/financeiro/importar-extrato/?sessao={sessao.token}')
+            sessao.delete()
+            messages.success(request, 'Layout corrigido para esta conta. Envie o arquivo novamente para aplicá-lo.')
+            return redirect('importar_extrato')
+
+        from .extrato import parse_data_br, parse_valor_br
+
+        removidas = {int(i) for i in request.POST.getlist('remover') if i.isdigit()}
+        edicoes = {}
+        for chave, valor in request.POST.items():
+            campo, _, indice = chave.rpartition('_')
+            if campo not in ('data', 'descricao', 'valor') or not indice.isdigit():
+                continue
+            if campo == 'data':
+                valor = parse_data_br(valor)
+            elif campo == 'valor':
+                valor = parse_valor_br(valor)
+            else:
+                valor = valor.strip()[:300]
+            edicoes.setdefault(int(indice), {})[campo] = valor
+
+        conta = sessao.conta
+        resultado = importar_lancamentos(
+            conta, linhas_da_sessao(sessao, removidas, edicoes), pessoa,
+            observacao=f'Importado do extrato: {sessao.arquivo_nome}',
+        )
+        sessao.delete()
+        _mensagens_importacao(request, conta, resultado)
+        return redirect('contas_bancarias')
+
     if request.method == 'POST':
-        from .extrato import parse_extrato
+        from .extrato import iter_extrato
 
         conta_id = request.POST.get('conta')
         arquivo = request.FILES.get('arquivo')
@@ -459,8 +671,34 @@ def importar_extrato(request):
 
         conta = get_object_or_404(ContaBancaria, id=conta_id, ativo=True)
 
+        # PDF: extração das páginas em paralelo, em segundo plano
+        if arquivo.name.lower().endswith('.pdf'):
+            from .importacao import processar_pdf_extrato, remover_pdfs_orfaos, salvar_pdf_temporario
+            from .tarefas import iniciar_tarefa
+
+            remover_pdfs_orfaos()
+            caminho = salvar_pdf_temporario(arquivo)
+            tarefa = iniciar_tarefa(
+                'extrato_pdf', processar_pdf_extrato,
+                caminho, conta.id, pessoa.id, arquivo.name, 'preview' in request.POST,
+                pessoa=pessoa, descricao=f'Extrato {arquivo.name}',
+            )
+            return redirect(f'/financeiro/importar-extrato/?tarefa={tarefa.id}')
+
+        # O arquivo é lido em streaming: o parse acontece enquanto a sessão
+        # (preview) ou a importação consomem as linhas
+        # Layouts já conhecidos da conta dispensam a detecção de colunas
+        layout = {}
         try:
-            lancamentos_parsed = parse_extrato(arquivo, arquivo.name)
+            lancamentos = iter_extrato(arquivo, arquivo.name, layouts_da_conta(conta), layout)
+            if 'preview' in request.POST:
+                sessao = criar_sessao(conta, lancamentos, pessoa, arquivo.name, layout)
+            else:
+                resultado = importar_lancamentos(
+                    conta, lancamentos, pessoa, observacao=f'Importado do extrato: {arquivo.name}',
+                )
+                if resultado['criados'] or resultado['duplicados']:
+                    registrar_layout(conta, layout)
         except ValueError as e:
             messages.error(request, str(e))
             return redirect('importar_extrato')
@@ -468,51 +706,100 @@ def importar_extrato(request):
             messages.error(request, f'Erro ao processar arquivo: {e}')
             return redirect('importar_extrato')
 
-        if not lancamentos_parsed:
+        if 'preview' in request.POST:
+            if not sessao.total_linhas:
+                sessao.delete()
+                messages.warning(request, 'Nenhum lançamento encontrado no arquivo. Verifique o formato.')
+                return redirect('importar_extrato')
+            # Preview a partir da sessão (sem parsear de novo)
+            return redirect(f'/financeiro/importar-extrato/?sessao={sessao.token}')
+
+        if not (resultado['criados'] or resultado['duplicados'] or resultado['rejeitados']):
             messages.warning(request, 'Nenhum lançamento encontrado no arquivo. Verifique o formato.')
             return redirect('importar_extrato')
+        _mensagens_importacao(request, conta, resultado)
+        return redirect('contas_bancarias')
 
-        # Preview mode
-        if 'preview' in request.POST:
-            context = {
-                'contas': contas,
-                'conta': conta,
-                'lancamentos_parsed': lancamentos_parsed,
-                'total_entradas': sum(l['valor'] for l in lancamentos_parsed if l['valor'] > 0),
-                'total_saidas': sum(abs(l['valor']) for l in lancamentos_parsed if l['valor'] < 0),
-                'arquivo_nome': arquivo.name,
-            }
-            return render(request, 'financeiro/importar_extrato.html', context)
-
-        # Importação
-        criados = 0
-        for item in lancamentos_parsed:
-            if item['valor'] > 0:
-                tipo = 'entrada'
-                valor = item['valor']
-            else:
-                tipo = 'saida'
-                valor = abs(item['valor'])
-
-            Lancamento.objects.create(
-                empresa=conta.empresa,
-                conta=conta,
-                tipo=tipo,
-                descricao=item['descricao'],
-                valor=valor,
-                data=item['data'],
-                observacao=f'Importado do extrato: {arquivo.name}',
-                criado_por=pessoa,
-            )
-            criados += 1
+    # Acompanhamento de um PDF em processamento
+    if request.GET.get('tarefa'):
+        from .importacao import remover_pdfs_orfaos
+        from .tarefas import verificar_interrompida
 
-        messages.success(request, f'{criados} lançamentos importados para {conta.nome}.')
-        return redirect('contas_bancarias')
+        tarefa = TarefaFinanceira.objects.filter(
+            id=request.GET['tarefa'] if request.GET['tarefa'].isdigit() else 0, criado_por=pessoa,
+        ).first()
+        if not tarefa:
+            return redirect('importar_extrato')
+        tarefa = verificar_interrompida(tarefa)
+        if tarefa.interrompida:
+            remover_pdfs_orfaos()
+            messages.error(request, 'O processamento do arquivo foi interrompido (o servidor reiniciou). Envie o arquivo novamente.')
+            return redirect('importar_extrato')
+        if tarefa.status == 'erro':
+            messages.error(request, f'Erro ao processar arquivo: {tarefa.mensagem}')
+            return redirect('importar_extrato')
+        if tarefa.status == 'concluida':
+            resultado = tarefa.resultado or {}
+            if resultado.get('sessao'):
+                return redirect(f'/financeiro/importar-extrato/?sessao={resultado["sessao"]}')
+            importacao = resultado.get('importacao')
+            if not importacao or not (importacao['criados'] or importacao['duplicados'] or importacao['rejeitados']):
+                messages.warning(request, 'Nenhum lançamento encontrado no arquivo. Verifique o formato.')
+                return redirect('importar_extrato')
+            _mensagens_importacao(request, get_object_or_404(ContaBancaria, id=resultado['conta']), importacao)
+            return redirect('contas_bancarias')
+        return render(request, 'financeiro/importar_extrato.html', {'contas': contas, 'tarefa': tarefa})
+
+    sessao = obter_sessao(request.GET.get('sessao'), pessoa)
+    if request.GET.get('sessao') and not sessao:
+        messages.warning(request, 'A visualização expirou. Envie o arquivo novamente.')
+    if sessao:
+        lancamentos_parsed = linhas_da_sessao(sessao)
+        context = {
+            'contas': contas,
+            'conta': sessao.conta,
+            'sessao': sessao,
+            'lancamentos_parsed': lancamentos_parsed,
+            'total_entradas': sum(l['valor'] for l in lancamentos_parsed if l['valor'] > 0),
+            'total_saidas': sum(abs(l['valor']) for l in lancamentos_parsed if l['valor'] < 0),
+            'arquivo_nome': sessao.arquivo_nome,
+            'layout': sessao.layout,
+            'campos_layout': [
+                (campo, nome, sessao.layout.colunas.get(campo) if sessao.layout else None)
+                for campo, nome in zip(CAMPOS_LAYOUT, ('Data', 'Descrição', 'Valor', 'Débito (opcional)'))
+            ],
+        }
+        return render(request, 'financeiro/importar_extrato.html', context)
 
     context = {'contas': contas}
     return render(request, 'financeiro/importar_extrato.html', context)
 
 
+def _mensagens_importacao(request, conta, resultado):
+    messages.success(request, f'{resultado["criados"]} lançamentos importados para {conta.nome}.')
+    if resultado['duplicados']:
+        messages.info(request, f'{resultado["duplicados"]} linha(s) já importada(s) anteriormente foram ignoradas.')
+    if resultado['rejeitados']:
+        motivos = ', '.join(f'{qtd} {motivo}' for motivo, qtd in resultado['motivos'].items())
+        messages.warning(request, f'{resultado["rejeitados"]} linha(s) rejeitada(s): {motivos}.')
+
+
+@login_required
+def status_tarefa(request, tarefa_id):
+    """Andamento de uma tarefa em segundo plano (consultado pela página)."""
+    pessoa = get_pessoa_or_redirect(request)
+    from .tarefas import verificar_interrompida
+
+    tarefa = verificar_interrompida(get_object_or_404(TarefaFinanceira, id=tarefa_id, criado_por=pessoa))
+    return JsonResponse({
+        'status': tarefa.status,
+        'progresso': tarefa.progresso,
+        'mensagem': tarefa.mensagem,
+        'resultado': tarefa.resultado,
+        'finalizada': tarefa.finalizada,
+    })
+
+
 @login_required
 def prestacao_contas(request, lancamento_id):
     """Detalhar gastos empresariais pagos com dinheiro de uma retirada."""
@@ -544,12 +831,16 @@ def prestacao_contas(request, lancamento_id):
             messages.error(request, f'Valor excede a retirada líquida (R$ {lancamento.retirada_liquida:.2f}).')
             return redirect('prestacao_contas', lancamento_id=lancamento_id)
 
-        PrestacaoConta.objects.create(
-            lancamento=lancamento,
-            descricao=descricao,
-            categoria_id=categoria_id,
-            valor=valor,
-        )
+        try:
+            PrestacaoConta.objects.create(
+                lancamento=lancamento,
+                descricao=descricao,
+                categoria_id=categoria_id,
+                valor=valor,
+            )
+        except PeriodoFechadoError as e:
+            messages.error(request, str(e))
+            return redirect('prestacao_contas', lancamento_id=lancamento_id)
         messages.success(request, f'Prestação de R$ {valor:,.2f} registrada.')
         return redirect('prestacao_contas', lancamento_id=lancamento_id)
 
@@ -568,7 +859,11 @@ def prestacao_contas(request, lancamento_id):
 def excluir_prestacao(request, prestacao_id):
     prestacao = get_object_or_404(PrestacaoConta, id=prestacao_id)
     lancamento_id = prestacao.lancamento_id
-    prestacao.delete()
+    try:
+        prestacao.delete()
+    except PeriodoFechadoError as e:
+        messages.error(request, str(e))
+        return redirect('prestacao_contas', lancamento_id=lancamento_id)
     messages.success(request, 'Prestação excluída.')
     return redirect('prestacao_contas', lancamento_id=lancamento_id)
 
@@ -592,71 +887,8 @@ def relatorio_financeiro(request):
     else:
         return render(request, 'financeiro/relatorio.html', {'empresas': empresas})
 
-    lancamentos = Lancamento.objects.filter(
-        empresa=empresa, data__month=mes, data__year=ano
-    ).select_related('categoria')
-
-    # --- Totais gerais ---
-    total_entradas = lancamentos.filter(tipo='entrada').aggregate(t=Sum('valor'))['t'] or Decimal('0')
-    total_saidas = lancamentos.filter(tipo='saida').aggregate(t=Sum('valor'))['t'] or Decimal('0')
-    lucro_bruto = total_entradas - total_saidas
-
-    # --- Por categoria (entradas) ---
-    cat_entradas = lancamentos.filter(tipo='entrada').values(
-        'categoria__nome', 'categoria__cor'
-    ).annotate(total=Sum('valor'), qtd=Sum(Value(1))).order_by('-total')
-
-    # --- Por categoria (saídas) ---
-    cat_saidas = lancamentos.filter(tipo='saida').values(
-        'categoria__nome', 'categoria__cor'
-    ).annotate(total=Sum('valor'), qtd=Sum(Value(1))).order_by('-total')
-
-    # --- Retiradas sócios ---
-    retirada_renan = lancamentos.filter(
-        tipo='saida', categoria__nome='Retirada Renan'
-    ).aggregate(t=Sum('valor'))['t'] or Decimal('0')
-
-    retirada_yuri = lancamentos.filter(
-        tipo='saida', categoria__nome='Retirada Yuri'
-    ).aggregate(t=Sum('valor'))['t'] or Decimal('0')
-
-    # Prestações de conta (gastos empresa pagos pelo Renan)
-    prestacoes_renan = PrestacaoConta.objects.filter(
-        lancamento__empresa=empresa,
-        lancamento__data__month=mes,
-        lancamento__data__year=ano,
-        lancamento__categoria__nome='Retirada Renan',
-    ).aggregate(t=Sum('valor'))['t'] or Decimal('0')
-
-    retirada_renan_liquida = retirada_renan - prestacoes_renan
-
-    # --- Custos operacionais (saídas que não são retirada) ---
-    custos_operacionais = lancamentos.filter(tipo='saida').exclude(
-        categoria__nome__in=['Retirada Renan', 'Retirada Yuri']
-    ).aggregate(t=Sum('valor'))['t'] or Decimal('0')
-
-    # Gastos empresa pagos pelo Renan (prestações)
-    custos_operacionais_total = custos_operacionais + prestacoes_renan
-
-    # --- Lucro líquido (receita - custos operacionais reais) ---
-    lucro_liquido = total_entradas - custos_operacionais_total
-
-    # --- Divisão 50/50 ---
-    direito_cada = lucro_liquido / 2 if lucro_liquido > 0 else Decimal('0')
-    saldo_yuri = direito_cada - retirada_yuri  # quanto Yuri ainda tem pra tirar
-    saldo_renan = direito_cada - retirada_renan_liquida  # quanto Renan ainda tem pra tirar
-
-    # --- Prestações detalhadas ---
-    prestacoes_detalhe = PrestacaoConta.objects.filter(
-        lancamento__empresa=empresa,
-        lancamento__data__month=mes,
-        lancamento__data__year=ano,
-    ).select_related('categoria', 'lancamento')
-
-    # --- Detalhe retiradas Yuri ---
-    retiradas_yuri_detalhe = lancamentos.filter(
-        tipo='saida', categoria__nome='Retirada Yuri'
-    ).order_by('data')
+    # Mes fechado: serve o snapshot congelado; mes aberto: calcula
+    dados, fechamento = relatorio_mensal(empresa, mes, ano)
 
     # --- Meses com dados (para navegação) ---
     meses_disponiveis = Lancamento.objects.filter(empresa=empresa).dates('data', 'month', order='DESC')[:12]
@@ -666,23 +898,9 @@ def relatorio_financeiro(request):
         'empresa': empresa,
         'mes': mes,
         'ano': ano,
-        'total_entradas': total_entradas,
-        'total_saidas': total_saidas,
-        'lucro_bruto': lucro_bruto,
-        'cat_entradas': cat_entradas,
-        'cat_saidas': cat_saidas,
-        'retirada_renan': retirada_renan,
-        'retirada_renan_liquida': retirada_renan_liquida,
-        'prestacoes_renan': prestacoes_renan,
-        'retirada_yuri': retirada_yuri,
-        'retiradas_yuri_detalhe': retiradas_yuri_detalhe,
-        'custos_operacionais': custos_operacionais,
-        'custos_operacionais_total': custos_operacionais_total,
-        'lucro_liquido': lucro_liquido,
-        'direito_cada': direito_cada,
-        'saldo_yuri': saldo_yuri,
-        'saldo_renan': saldo_renan,
-        'prestacoes_detalhe': prestacoes_detalhe,
+        **dados,
+        'fechamento': fechamento,
+        'pode_fechar': not fechamento and mes_encerrado(date(ano, mes, 1)),
         'meses_disponiveis': meses_disponiveis,
     }
     return render(request, 'financeiro/relatorio.html', context)
@@ -719,21 +937,79 @@ def registrar_retirada(request):
     ).first()
 
     # Cria lançamento SEM conta bancária (não afeta saldo do MP)
-    Lancamento.objects.create(
-        empresa=empresa,
-        conta=None,
-        tipo='saida',
-        categoria=cat_yuri,
-        descricao=descricao,
-        valor=valor,
-        data=data,
-        observacao='Pagamento recebido do Renan (por fora)',
-        criado_por=pessoa,
-    )
+    try:
+        Lancamento.objects.create(
+            empresa=empresa,
+            conta=None,
+            tipo='saida',
+            categoria=cat_yuri,
+            descricao=descricao,
+            valor=valor,
+            data=data,
+            observacao='Pagamento recebido do Renan (por fora)',
+            criado_por=pessoa,
+        )
+    except PeriodoFechadoError as e:
+        messages.error(request, str(e))
+        return redirect(f'/financeiro/relatorio/?empresa={empresa.id}&mes={mes}&ano={ano}')
     messages.success(request, f'Retirada de R$ {valor:,.2f} registrada.')
     return redirect(f'/financeiro/relatorio/?empresa={empresa.id}&mes={mes}&ano={ano}')
 
 
+@login_required
+@require_POST
+def fechar_mes_view(request):
+    """Fecha o mês da empresa: congela os relatórios e bloqueia alterações."""
+    pessoa = get_pessoa_or_redirect(request)
+    if not pessoa:
+        return redirect('dashboard')
+
+    try:
+        empresa_id = int(request.POST.get('empresa'))
+        mes = int(request.POST.get('mes'))
+        ano = int(request.POST.get('ano'))
+        if not 1 <= mes <= 12:
+            raise ValueError(mes)
+    except (TypeError, ValueError):
+        messages.error(request, 'Empresa, mês ou ano inválido.')
+        return redirect('/financeiro/relatorio/')
+    empresa = get_object_or_404(Empresa, id=empresa_id)
+    url = f'/financeiro/relatorio/?empresa={empresa.id}&mes={mes}&ano={ano}'
+
+    if not pessoa.is_gestor:
+        messages.error(request, 'Apenas gestores podem fechar o mês.')
+        return redirect(url)
+
+    try:
+        fechar_mes(empresa, mes, ano, pessoa)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect(url)
+
+    messages.success(request, f'Mês {mes:02d}/{ano} fechado para {empresa.nome}.')
+    return redirect(url)
+
+
+@login_required
+@require_POST
+def reabrir_mes_view(request, fechamento_id):
+    """Reabre um mês fechado (volta a aceitar alterações)."""
+    pessoa = get_pessoa_or_redirect(request)
+    if not pessoa:
+        return redirect('dashboard')
+
+    fechamento = get_object_or_404(FechamentoMes, id=fechamento_id)
+    url = f'/financeiro/relatorio/?empresa={fechamento.empresa_id}&mes={fechamento.mes}&ano={fechamento.ano}'
+
+    if not pessoa.is_gestor:
+        messages.error(request, 'Apenas gestores podem reabrir o mês.')
+        return redirect(url)
+
+    reabrir_mes(fechamento)
+    messages.success(request, f'Mês {fechamento.mes:02d}/{fechamento.ano} reaberto.')
+    return redirect(url)
+
+
 @login_required
 def contas_pagar(request):
     """CRUD de contas a pagar recorrentes + visão do mês"""
@@ -836,9 +1112,12 @@ def contas_pagar(request):
             gerar_parcelas_conta(conta)
             messages.success(request, f'Conta "{descricao}" criada com {total_parcelas} parcelas de R$ {valor:,.2f}.')
         else:
-            # Gerar item do mês da data de vencimento
-            from .services import gerar_contas_pagar_mes
-            gerar_contas_pagar_mes(empresa, data_vencimento.month, data_vencimento.year)
+            # Gerar itens do mês da data de vencimento até o fim do horizonte
+            from .services import gerar_itens_contas_pagar
+            gerar_itens_contas_pagar(
+                ContaPagar.objects.filter(id=conta.id),
+                data_vencimento.month, data_vencimento.year, settings.FINANCEIRO_HORIZONTE_MESES,
+            )
             messages.success(request, f'Conta "{descricao}" criada.')
         return redirect(f'/financeiro/contas-pagar/?empresa={empresa.id}')
 
@@ -1023,9 +1302,12 @@ def contas_receber(request):
             gerar_parcelas_conta_receber(conta)
             messages.success(request, f'Conta a receber "{descricao}" criada com {total_parcelas} parcelas de R$ {valor:,.2f}.')
         else:
-            # Gerar item do mês da data de vencimento
-            from .services import gerar_contas_receber_mes
-            gerar_contas_receber_mes(empresa, data_vencimento.month, data_vencimento.year)
+            # Gerar itens do mês da data de vencimento até o fim do horizonte
+            from .services import gerar_itens_contas_receber
+            gerar_itens_contas_receber(
+                ContaReceber.objects.filter(id=conta.id),
+                data_vencimento.month, data_vencimento.year, settings.FINANCEIRO_HORIZONTE_MESES,
+            )
             messages.success(request, f'Conta a receber "{descricao}" criada.')
         return redirect(f'/financeiro/contas-receber/?empresa={empresa.id}')
 
@@ -1152,6 +1434,17 @@ def detalhe_conta_receber(request, conta_id):
         return redirect('dashboard')
 
     conta = get_object_or_404(ContaReceber, id=conta_id)
+
+    # Nosso número do boleto de um item (usado na baixa por retorno CNAB)
+    if request.method == 'POST' and request.POST.get('item_id'):
+        from .cnab import normalizar_nosso_numero
+
+        item = get_object_or_404(ContaReceberItem, id=request.POST['item_id'], conta_receber=conta)
+        item.nosso_numero = normalizar_nosso_numero(request.POST.get('nosso_numero'))[:20]
+        item.save(update_fields=['nosso_numero'])
+        messages.success(request, 'Nosso número atualizado.')
+        return redirect('detalhe_conta_receber', conta_id=conta.id)
+
     itens = conta.itens.all().order_by('data_vencimento')
 
     context = {
@@ -1164,6 +1457,60 @@ def detalhe_conta_receber(request, conta_id):
     return render(request, 'financeiro/detalhe_conta_receber.html', context)
 
 
+@login_required
+def retorno_cnab(request):
+    """Baixa automática de contas a receber por arquivo de retorno CNAB 240/400"""
+    pessoa = get_pessoa_or_redirect(request)
+    if not pessoa:
+        return redirect('dashboard')
+
+    empresas = Empresa.objects.all()
+    contas = ContaBancaria.objects.filter(ativo=True).select_related('empresa')
+
+    if request.method == 'POST':
+        from .cnab import baixar_retorno, iter_retorno
+
+        empresa = get_object_or_404(Empresa, id=request.POST.get('empresa'))
+        conta_id = request.POST.get('conta')
+        conta = get_object_or_404(ContaBancaria, id=conta_id, empresa=empresa) if conta_id else None
+        arquivo = request.FILES.get('arquivo')
+        if not arquivo:
+            messages.error(request, 'Selecione o arquivo de retorno.')
+            return redirect('retorno_cnab')
+
+        try:
+            resultado = baixar_retorno(empresa, iter_retorno(arquivo), pessoa, conta, arquivo.name)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('retorno_cnab')
+
+        if resultado['liquidados']:
+            messages.success(
+                request,
+                f'{resultado["liquidados"]} título(s) baixado(s) - R$ {resultado["valor_total"]:,.2f} recebido.',
+            )
+        else:
+            messages.warning(request, 'Nenhum título liquidado encontrado no arquivo.')
+        if resultado['nao_encontrados']:
+            exemplos = ', '.join(resultado['nao_encontrados'][:10])
+            mais = len(resultado['nao_encontrados']) - 10
+            messages.warning(
+                request,
+                f'{len(resultado["nao_encontrados"])} liquidação(ões) sem conta a receber correspondente: '
+                f'{exemplos}{f" e mais {mais}" if mais > 0 else ""}.',
+            )
+        if resultado['rejeitados']:
+            messages.warning(request, f'{resultado["rejeitados"]} liquidação(ões) com crédito em mês fechado não foram baixadas.')
+        return redirect(f'/financeiro/contas-receber/?empresa={empresa.id}')
+
+    context = {
+        'empresas': empresas,
+        'contas': contas,
+        'empresa_id': request.GET.get('empresa'),
+    }
+    return render(request, 'financeiro/retorno_cnab.html', context)
+
+
 # =====================================================
 # FLUXO DE CAIXA PROJETADO
 # =====================================================
@@ -1178,7 +1525,8 @@ def fluxo_caixa(request):
     empresas = Empresa.objects.all()
     hoje = timezone.localdate()
     empresa_id = request.GET.get('empresa')
-    meses_frente = int(request.GET.get('meses', 3))  # Padrao: 3 meses
+    meses_frente = min(max(int(request.GET.get('meses', 3)), 1), 24)  # Padrao: 3 meses
+    visao = request.GET.get('visao', 'mes')
 
     if empresa_id:
         empresa = get_object_or_404(Empresa, id=empresa_id)
@@ -1187,74 +1535,86 @@ def fluxo_caixa(request):
     else:
         return render(request, 'financeiro/fluxo_caixa.html', {'empresas': empresas})
 
-    # Saldo atual das contas bancarias
-    contas_bancarias = ContaBancaria.objects.filter(empresa=empresa, ativo=True)
-    saldo_atual = sum(c.get_saldo() for c in contas_bancarias)
+    # Saldo atual das contas bancarias (uma consulta)
+    contas_bancarias = list(contas_com_saldo(empresa))
+    saldo_atual = sum((c.saldo_atual for c in contas_bancarias), Decimal('0'))
 
-    # Gerar projecao para os proximos meses
-    from dateutil.relativedelta import relativedelta
-    import calendar
+    # Projecao: itens em aberto + recorrencias ainda nao geradas
+    projecao_caixa = projetar_fluxo_caixa(empresa, meses_frente, hoje, saldo_inicial=saldo_atual)
+    data_menor_saldo, menor_saldo = projecao_caixa.menor_saldo()
 
-    projecao = []
-    saldo_acumulado = saldo_atual
+    context = {
+        'empresas': empresas,
+        'empresa': empresa,
+        'hoje': hoje,
+        'meses_frente': meses_frente,
+        'visao': visao,
+        'projecao': projecao_caixa.por_mes(),
+        'projecao_diaria': projecao_caixa.por_dia() if visao == 'dia' else [],
+        'saldo_atual': saldo_atual,
+        'total_a_pagar': projecao_caixa.total_saidas,
+        'total_a_receber': projecao_caixa.total_entradas,
+        'saldo_final_projetado': projecao_caixa.saldo_final,
+        'menor_saldo': menor_saldo,
+        'data_menor_saldo': data_menor_saldo,
+        'contas_bancarias': contas_bancarias,
+    }
+    return render(request, 'financeiro/fluxo_caixa.html', context)
 
-    for i in range(meses_frente):
-        data_mes = hoje + relativedelta(months=i)
-        mes = data_mes.month
-        ano = data_mes.year
 
-        # Contas a pagar do mes
-        itens_pagar = ContaPagarItem.objects.filter(
-            conta_pagar__empresa=empresa,
-            mes=mes,
-            ano=ano,
-            pago=False,
-        ).select_related('conta_pagar')
-        total_pagar = sum(i.valor for i in itens_pagar)
-
-        # Contas a receber do mes
-        itens_receber = ContaReceberItem.objects.filter(
-            conta_receber__empresa=empresa,
-            mes=mes,
-            ano=ano,
-            recebido=False,
-            status__in=['pendente', 'atrasado'],
-        ).select_related('conta_receber')
-        total_receber = sum(i.valor for i in itens_receber)
-
-        # Saldo projetado
-        saldo_mes = total_receber - total_pagar
-        saldo_acumulado += saldo_mes
-
-        projecao.append({
-            'mes': mes,
-            'ano': ano,
-            'nome_mes': calendar.month_name[mes],
-            'a_pagar': total_pagar,
-            'a_receber': total_receber,
-            'saldo_mes': saldo_mes,
-            'saldo_acumulado': saldo_acumulado,
-            'itens_pagar': itens_pagar,
-            'itens_receber': itens_receber,
-        })
+@login_required
+def simulacao_fluxo_caixa(request):
+    """Cenarios de fluxo de caixa (atraso e queda de recebimentos) via Monte Carlo"""
+    pessoa = get_pessoa_or_redirect(request)
+    if not pessoa:
+        return redirect('dashboard')
+
+    empresas = Empresa.objects.all()
+    hoje = timezone.localdate()
+    empresa_id = request.GET.get('empresa')
+
+    if empresa_id:
+        empresa = get_object_or_404(Empresa, id=empresa_id)
+    elif empresas.exists():
+        empresa = empresas.first()
+    else:
+        return render(request, 'financeiro/simulacao_fluxo_caixa.html', {'empresas': empresas})
 
-    # Totais gerais
-    total_a_pagar = sum(p['a_pagar'] for p in projecao)
-    total_a_receber = sum(p['a_receber'] for p in projecao)
+    def _param(nome, padrao, minimo, maximo):
+        try:
+            valor = float(request.GET.get(nome, padrao))
+        except ValueError:
+            valor = padrao
+        if not math.isfinite(valor):
+            valor = padrao
+        return min(max(valor, minimo), maximo)
+
+    meses_frente = int(_param('meses', 6, 1, 24))
+    cenario = Cenario(
+        pct_atraso=_param('pct_atraso', 20, 0, 100),
+        dias_atraso=_param('dias_atraso', 30, 0, 365),
+        queda_receita=_param('queda_receita', 10, -100, 100),
+        desvio_receita=_param('desvio_receita', 5, 0, 100),
+        caminhos=int(_param('caminhos', 2000, 100, 10000)),
+    )
+
+    projecao_caixa = projetar_fluxo_caixa(empresa, meses_frente, hoje)
+    simulacao = simular_cenario(projecao_caixa, cenario)
 
     context = {
         'empresas': empresas,
         'empresa': empresa,
         'hoje': hoje,
         'meses_frente': meses_frente,
-        'projecao': projecao,
-        'saldo_atual': saldo_atual,
-        'total_a_pagar': total_a_pagar,
-        'total_a_receber': total_a_receber,
-        'saldo_final_projetado': saldo_acumulado,
-        'contas_bancarias': contas_bancarias,
+        'cenario': cenario,
+        'saldo_atual': projecao_caixa.saldo_inicial,
+        'meses': simulacao.por_mes(),
+        'prob_saldo_negativo': simulacao.prob_saldo_negativo,
+        'saldo_final_deterministico': projecao_caixa.saldo_final,
+        'saldo_final_p5': float(simulacao.bandas[5][-1]),
+        'saldo_final_p50': float(simulacao.bandas[50][-1]),
     }
-    return render(request, 'financeiro/fluxo_caixa.html', context)
+    return render(request, 'financeiro/simulacao_fluxo_caixa.html', context)
 
 
 # =====================================================
@@ -1281,48 +1641,29 @@ def dre_simplificado(request):
     else:
         return render(request, 'financeiro/dre.html', {'empresas': empresas})
 
-    # Lancamentos do mes
-    lancamentos = Lancamento.objects.filter(
-        empresa=empresa, data__month=mes, data__year=ano
-    ).select_related('categoria')
-
-    # RECEITA BRUTA (todas as entradas)
-    receita_bruta = lancamentos.filter(tipo='entrada').aggregate(
-        total=Sum('valor'))['total'] or Decimal('0')
-
-    # Deducoes (taxas, impostos - categorias especificas)
-    categorias_deducao = ['Taxa MP', 'Impostos', 'Taxa', 'Taxas']
-    deducoes = lancamentos.filter(
-        tipo='saida',
-        categoria__nome__in=categorias_deducao
-    ).aggregate(total=Sum('valor'))['total'] or Decimal('0')
-
-    # RECEITA LIQUIDA
-    receita_liquida = receita_bruta - deducoes
-
-    # CUSTOS OPERACIONAIS (saidas que nao sao retirada e nao sao deducao)
-    categorias_retirada = ['Retirada Renan', 'Retirada Yuri', 'Retirada', 'Pro-Labore']
-    custos_operacionais = lancamentos.filter(tipo='saida').exclude(
-        categoria__nome__in=categorias_retirada + categorias_deducao
-    ).aggregate(total=Sum('valor'))['total'] or Decimal('0')
-
-    # LUCRO OPERACIONAL
-    lucro_operacional = receita_liquida - custos_operacionais
+    from dateutil.relativedelta import relativedelta
 
-    # DESPESAS NAO OPERACIONAIS (retiradas)
-    despesas_nao_operacionais = lancamentos.filter(
-        tipo='saida',
-        categoria__nome__in=categorias_retirada
-    ).aggregate(total=Sum('valor'))['total'] or Decimal('0')
+    # Matriz DRE: linhas x meses (x empresas) em uma unica consulta
+    try:
+        periodo = int(request.GET.get('periodo', 12))
+    except ValueError:
+        periodo = 12
+    periodo = max(3, min(periodo, 24))
+    consolidado = request.GET.get('consolidado') == '1'
+    mes_ref = date(ano, mes, 1)
+    data_anterior = mes_ref - relativedelta(months=1)
+    mes_anterior = data_anterior.month
+    ano_anterior = data_anterior.year
 
-    # LUCRO LIQUIDO
-    lucro_liquido = lucro_operacional - despesas_nao_operacionais
+    empresas_dre = list(empresas) if consolidado else [empresa]
+    inicio = mes_ref - relativedelta(months=max(periodo, 2) - 1)
+    matriz = calcular_dre(empresas_dre, inicio, mes_ref)
 
-    # Margem de lucro
-    margem_bruta = (receita_liquida / receita_bruta * 100) if receita_bruta > 0 else 0
-    margem_liquida = (lucro_liquido / receita_bruta * 100) if receita_bruta > 0 else 0
+    dre = matriz.demonstrativo(empresa.id, mes_ref)
+    dre_anterior = matriz.demonstrativo(empresa.id, data_anterior)
 
     # Detalhamento por categoria
+    lancamentos = Lancamento.objects.filter(empresa=empresa, data__month=mes, data__year=ano)
     entradas_por_categoria = lancamentos.filter(tipo='entrada').values(
         'categoria__nome', 'categoria__cor'
     ).annotate(total=Sum('valor')).order_by('-total')
@@ -1332,22 +1673,22 @@ def dre_simplificado(request):
     ).annotate(total=Sum('valor')).order_by('-total')
 
     # Comparativo com mes anterior
-    from dateutil.relativedelta import relativedelta
-    data_anterior = hoje.replace(day=1) - relativedelta(months=1)
-    mes_anterior = data_anterior.month
-    ano_anterior = data_anterior.year
-
-    lancamentos_ant = Lancamento.objects.filter(
-        empresa=empresa, data__month=mes_anterior, data__year=ano_anterior
-    )
-    receita_ant = lancamentos_ant.filter(tipo='entrada').aggregate(
-        total=Sum('valor'))['total'] or Decimal('0')
-    lucro_ant = receita_ant - (lancamentos_ant.filter(tipo='saida').aggregate(
-        total=Sum('valor'))['total'] or Decimal('0'))
+    receita_ant = dre_anterior['receita_bruta']
+    lucro_ant = dre_anterior['lucro_liquido']
+    receita_bruta = dre['receita_bruta']
+    lucro_liquido = dre['lucro_liquido']
 
     variacao_receita = ((receita_bruta - receita_ant) / receita_ant * 100) if receita_ant > 0 else 0
     variacao_lucro = ((lucro_liquido - lucro_ant) / abs(lucro_ant) * 100) if lucro_ant != 0 else 0
 
+    # Tabelas do periodo (uma por empresa + consolidado)
+    meses_periodo = matriz.meses[-periodo:]
+    tabelas_periodo = [
+        {'titulo': e.nome, 'linhas': matriz.tabela(e.id, meses_periodo)} for e in empresas_dre
+    ]
+    if consolidado and len(empresas_dre) > 1:
+        tabelas_periodo.append({'titulo': 'Consolidado', 'linhas': matriz.tabela(None, meses_periodo)})
+
     # Meses disponiveis
     meses_disponiveis = Lancamento.objects.filter(empresa=empresa).dates('data', 'month', order='DESC')[:24]
 
@@ -1357,17 +1698,8 @@ def dre_simplificado(request):
         'mes': mes,
         'ano': ano,
         'hoje': hoje,
-        # DRE
-        'receita_bruta': receita_bruta,
-        'deducoes': deducoes,
-        'receita_liquida': receita_liquida,
-        'custos_operacionais': custos_operacionais,
-        'lucro_operacional': lucro_operacional,
-        'despesas_nao_operacionais': despesas_nao_operacionais,
-        'lucro_liquido': lucro_liquido,
-        # Margens
-        'margem_bruta': margem_bruta,
-        'margem_liquida': margem_liquida,
+        # DRE e margens
+        **dre,
         # Detalhamento
         'entradas_por_categoria': entradas_por_categoria,
         'saidas_por_categoria': saidas_por_categoria,
@@ -1378,6 +1710,11 @@ def dre_simplificado(request):
         'lucro_anterior': lucro_ant,
         'variacao_receita': variacao_receita,
         'variacao_lucro': variacao_lucro,
+        # Periodo
+        'periodo': periodo,
+        'consolidado': consolidado,
+        'meses_periodo': meses_periodo,
+        'tabelas_periodo': tabelas_periodo,
         # Navegacao
         'meses_disponiveis': meses_disponiveis,
     }
@@ -1579,8 +1916,12 @@ def relatorio_projeto(request):
     else:
         return render(request, 'financeiro/relatorio_projeto.html', {'empresas': empresas})
 
+    from django.core.paginator import Paginator
+    from .rentabilidade import ORDEM_PADRAO, ordenar_projetos, projetos_com_rentabilidade
+
     # Projetos da empresa
     projetos = Projeto.objects.filter(empresa=empresa).order_by('-criado_em')
+    rentabilidade = projetos_com_rentabilidade(empresa)
 
     projeto = None
     dados_projeto = None
@@ -1591,21 +1932,11 @@ def relatorio_projeto(request):
         # Lancamentos do projeto
         lancamentos = Lancamento.objects.filter(empresa=empresa, projeto=projeto)
 
-        # Receitas do projeto
         receitas = lancamentos.filter(tipo='entrada')
-        total_receitas = receitas.aggregate(total=Sum('valor'))['total'] or Decimal('0')
-
-        # Despesas do projeto
         despesas = lancamentos.filter(tipo='saida')
-        total_despesas = despesas.aggregate(total=Sum('valor'))['total'] or Decimal('0')
 
-        # Lucro
-        lucro = total_receitas - total_despesas
-        margem = (lucro / total_receitas * 100) if total_receitas > 0 else 0
-
-        # Contas a receber do projeto
-        a_receber = ContaReceber.objects.filter(empresa=empresa, projeto=projeto, ativo=True)
-        total_a_receber = sum(c.get_total_pendente() for c in a_receber)
+        # Totais, lucro, margem e a receber numa consulta
+        totais = rentabilidade.get(id=projeto.id)
 
         # Por categoria
         receitas_categoria = receitas.values('categoria__nome', 'categoria__cor').annotate(
@@ -1619,35 +1950,20 @@ def relatorio_projeto(request):
             total=Sum('valor')).order_by('mes')
 
         dados_projeto = {
-            'total_receitas': total_receitas,
-            'total_despesas': total_despesas,
-            'lucro': lucro,
-            'margem': margem,
-            'total_a_receber': total_a_receber,
+            'total_receitas': totais.receita,
+            'total_despesas': totais.despesa,
+            'lucro': totais.lucro,
+            'margem': totais.margem,
+            'total_a_receber': totais.pendente_receber,
             'receitas_categoria': receitas_categoria,
             'despesas_categoria': despesas_categoria,
             'lancamentos': lancamentos[:20],
             'timeline': timeline,
         }
 
-    # Resumo de todos os projetos
-    resumo_projetos = []
-    for p in projetos[:10]:
-        lanc = Lancamento.objects.filter(empresa=empresa, projeto=p)
-        receita = lanc.filter(tipo='entrada').aggregate(t=Sum('valor'))['t'] or Decimal('0')
-        despesa = lanc.filter(tipo='saida').aggregate(t=Sum('valor'))['t'] or Decimal('0')
-        lucro_p = receita - despesa
-        margem_p = (lucro_p / receita * 100) if receita > 0 else 0
-        resumo_projetos.append({
-            'projeto': p,
-            'receita': receita,
-            'despesa': despesa,
-            'lucro': lucro_p,
-            'margem': margem_p,
-        })
-
-    # Ordenar por lucro
-    resumo_projetos.sort(key=lambda x: x['lucro'], reverse=True)
+    # Ranking de todos os projetos, ordenado e paginado no banco
+    ranking, ordem = ordenar_projetos(rentabilidade, request.GET.get('ordem', ORDEM_PADRAO))
+    pagina_projetos = Paginator(ranking, 20).get_page(request.GET.get('pagina'))
 
     context = {
         'empresas': empresas,
@@ -1655,7 +1971,8 @@ def relatorio_projeto(request):
         'projetos': projetos,
         'projeto': projeto,
         'dados': dados_projeto,
-        'resumo_projetos': resumo_projetos,
+        'resumo_projetos': pagina_projetos,
+        'ordem': ordem,
     }
     return render(request, 'financeiro/relatorio_projeto.html', context)
 
@@ -1687,18 +2004,36 @@ def comparativo_mensal(request):
 
     hoje = timezone.localdate()
     dados_meses = []
+    fechados = relatorios_fechados(empresa)
 
     for i in range(meses_comparar - 1, -1, -1):
         data_mes = hoje - relativedelta(months=i)
         mes = data_mes.month
         ano = data_mes.year
 
-        lancamentos = Lancamento.objects.filter(
-            empresa=empresa, data__month=mes, data__year=ano
-        )
-
-        receitas = lancamentos.filter(tipo='entrada').aggregate(t=Sum('valor'))['t'] or Decimal('0')
-        despesas = lancamentos.filter(tipo='saida').aggregate(t=Sum('valor'))['t'] or Decimal('0')
+        relatorio = fechados.get((ano, mes))
+        if relatorio:
+            # Mes fechado: totais e categorias vem do snapshot
+            receitas = relatorio['total_entradas']
+            despesas = relatorio['total_saidas']
+            top_receitas = [
+                {'categoria__nome': c['categoria__nome'], 'total': c['total']}
+                for c in relatorio['cat_entradas'][:3]
+            ]
+            top_despesas = [
+                {'categoria__nome': c['categoria__nome'], 'total': c['total']}
+                for c in relatorio['cat_saidas'][:3]
+            ]
+        else:
+            lancamentos = Lancamento.objects.filter(
+                empresa=empresa, data__month=mes, data__year=ano
+            )
+            receitas = lancamentos.filter(tipo='entrada').aggregate(t=Sum('valor'))['t'] or Decimal('0')
+            despesas = lancamentos.filter(tipo='saida').aggregate(t=Sum('valor'))['t'] or Decimal('0')
+            top_receitas = lancamentos.filter(tipo='entrada').values(
+                'categoria__nome').annotate(total=Sum('valor')).order_by('-total')[:3]
+            top_despesas = lancamentos.filter(tipo='saida').values(
+                'categoria__nome').annotate(total=Sum('valor')).order_by('-total')[:3]
         lucro = receitas - despesas
 
         # Meta do mes
@@ -1706,12 +2041,6 @@ def comparativo_mensal(request):
         valor_meta = meta.valor_meta if meta else Decimal('0')
         progresso_meta = (receitas / valor_meta * 100) if valor_meta > 0 else 0
 
-        # Categorias principais
-        top_receitas = lancamentos.filter(tipo='entrada').values(
-            'categoria__nome').annotate(total=Sum('valor')).order_by('-total')[:3]
-        top_despesas = lancamentos.filter(tipo='saida').values(
-            'categoria__nome').annotate(total=Sum('valor')).order_by('-total')[:3]
-
         dados_meses.append({
             'mes': mes,
             'ano': ano,
@@ -0,0 +1,177 @@
+"""
+Webhook de pagamentos do Mercado Pago.
+
+A view só grava o id do pagamento numa fila (`NotificacaoMP`) e responde na
+hora. Após o commit, um worker em thread do próprio processo (um por schema)
+esvazia a fila: busca cada pagamento na API e faz o upsert dos lançamentos de
+entrada, taxa, estorno e chargeback com o mesmo código da sync
+(`services._gravar_pagamentos`). A sync por polling continua como rede de
+segurança para notificações perdidas.
+
+Vários workers (processos do gunicorn) dividem a fila com
+`select_for_update(skip_locked=True)`; notificações presas em
+'processando' (worker morto) voltam para a fila depois de TEMPO_PROCESSANDO.
+
+Uma notificação que falhou volta para 'pendente' e o worker fica vivo até
+ela ser retentada, INTERVALO_RETENTATIVA depois. Se o processo reiniciar
+nesse meio tempo, ela é retomada pelo próximo webhook do schema; a sync por
+polling cobre o pagamento de qualquer forma.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import requests
+from django.db import connection, transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from .models import NotificacaoMP
+from .services import _ContextoSync, _fetch_payment, _gravar_pagamentos, _sessao_mp
+from .tarefas import no_schema
+
+logger = logging.getLogger(__name__)
+
+LOTE_NOTIFICACOES = 50
+MAX_TENTATIVAS = 5
+TEMPO_PROCESSANDO = timedelta(minutes=10)
+# Notificação que falhou só volta a ser tentada depois deste intervalo
+INTERVALO_RETENTATIVA = timedelta(minutes=1)
+
+# Schemas com worker ativo -> se chegaram notificações enquanto ele rodava
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def enfileirar_notificacao(config, payment_id, acao=''):
+    """
+    Coloca o pagamento na fila (uma vez só enquanto pendente) e dispara o
+    worker do schema após o commit.
+    """
+    if not NotificacaoMP.objects.filter(config=config, payment_id=payment_id, status='pendente').exists():
+        NotificacaoMP.objects.create(config=config, payment_id=payment_id, acao=acao[:50])
+    schema = getattr(connection, 'schema_name', None)
+    transaction.on_commit(lambda: _disparar_worker(schema))
+
+
+def _disparar_worker(schema):
+    with _workers_lock:
+        if schema in _workers:
+            # O worker ativo faz mais uma passada antes de terminar
+            _workers[schema] = True
+            return
+        _workers[schema] = False
+    threading.Thread(target=_worker, args=(schema,), name=f'webhook-mp-{schema}', daemon=True).start()
+
+
+def _proxima_retentativa():
+    """Quando a primeira notificação que falhou volta a ser elegível (None se não há)."""
+    ultima = NotificacaoMP.objects.filter(status='pendente', tentativas__gt=0).aggregate(
+        m=Min('atualizado_em'),
+    )['m']
+    return ultima + INTERVALO_RETENTATIVA if ultima else None
+
+
+def _worker(schema):
+    try:
+        with no_schema(schema):
+            while True:
+                while processar_notificacoes()['processadas']:
+                    pass
+                proxima = _proxima_retentativa()
+                with _workers_lock:
+                    if _workers[schema]:
+                        _workers[schema] = False
+                        continue
+                    if proxima is None:
+                        del _workers[schema]
+                        return
+                # Espera a retentativa (um webhook novo só marca outra passada)
+                time.sleep(max((proxima - timezone.now()).total_seconds(), 0) + 1)
+    except Exception:
+        logger.exception('Erro no worker de notificações MP (%s)', schema)
+        with _workers_lock:
+            _workers.pop(schema, None)
+    finally:
+        connection.close()
+
+
+def _reservar(limite):
+    """Marca um lote da fila como 'processando', sem disputar linhas com outros workers."""
+    agora = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            NotificacaoMP.objects.select_for_update(skip_locked=True).filter(
+                Q(status='pendente', tentativas=0)
+                | Q(status='pendente', atualizado_em__lt=agora - INTERVALO_RETENTATIVA)
+                | Q(status='processando', atualizado_em__lt=agora - TEMPO_PROCESSANDO),
+            ).order_by('recebido_em').values_list('id', flat=True)[:limite]
+        )
+        NotificacaoMP.objects.filter(id__in=ids).update(
+            status='processando', tentativas=F('tentativas') + 1, atualizado_em=agora,
+        )
+    return list(NotificacaoMP.objects.filter(id__in=ids).select_related('config', 'config__empresa'))
+
+
+def processar_notificacoes(limite=LOTE_NOTIFICACOES):
+    """
+    Processa um lote da fila do schema atual. Retorna dict com processadas,
+    erros e os contadores da gravação (criados, taxas, estornos, ignorados).
+    """
+    resultado = {'processadas': 0, 'erros': 0, 'criados': 0, 'taxas': 0, 'estornos': 0, 'ignorados': 0}
+    por_config = defaultdict(list)
+    for notificacao in _reservar(limite):
+        por_config[notificacao.config].append(notificacao)
+
+    for config, notificacoes in por_config.items():
+        if not config.ativo:
+            NotificacaoMP.objects.filter(id__in=[n.id for n in notificacoes]).update(
+                status='erro', erro='Config MP inativa', processado_em=timezone.now(),
+            )
+            resultado['erros'] += len(notificacoes)
+            continue
+
+        ctx = _ContextoSync(config)
+        payments, pendentes, falhas = {}, [], []
+        with _sessao_mp(config.access_token) as sessao:
+            for notificacao in notificacoes:
+                try:
+                    if notificacao.payment_id not in payments:
+                        payments[notificacao.payment_id] = _fetch_payment(sessao, notificacao.payment_id)
+                    pendentes.append(notificacao)
+                except requests.RequestException as e:
+                    falhas.append((notificacao, e))
+            erros_refund = {}
+            if payments:
+                erros_refund = _gravar_pagamentos(sessao, ctx, list(payments.values()), timezone.localdate())
+
+        # Refund que falhou conta como falha da notificação: ela volta para a fila
+        ok = []
+        for notificacao in pendentes:
+            erro = erros_refund.get(str(payments[notificacao.payment_id]['id']))
+            if erro:
+                falhas.append((notificacao, erro))
+            else:
+                ok.append(notificacao)
+
+        agora = timezone.now()
+        NotificacaoMP.objects.filter(id__in=[n.id for n in ok]).update(
+            status='processada', erro='', processado_em=agora,
+        )
+        for notificacao, e in falhas:
+            # 404 não melhora com retry; o resto volta para a fila até MAX_TENTATIVAS
+            resposta = getattr(e, 'response', None)
+            definitivo = getattr(resposta, 'status_code', None) == 404 or notificacao.tentativas >= MAX_TENTATIVAS
+            NotificacaoMP.objects.filter(id=notificacao.id).update(
+                status='erro' if definitivo else 'pendente', erro=str(e)[:1000],
+                processado_em=agora if definitivo else None,
+            )
+            logger.warning(f'Erro ao processar payment {notificacao.payment_id} notificado: {e}')
+
+        resultado['processadas'] += len(ok)
+        resultado['erros'] += len(falhas)
+        for campo in ('criados', 'taxas', 'estornos', 'ignorados'):
+            resultado[campo] += ctx.stats[campo]
+    return resultado
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_agendamentonotificacao_dia_mes_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='agendamentonotificacao',
+            name='tipo',
+            field=models.CharField(choices=[('lembrete_diario', 'Lembrete Diário (funcionários)'), ('cobranca_funcionarios', 'Cobrança Funcionários'), ('cobranca_externos', 'Cobrança Pessoas Externas'), ('resumo_dependencias', 'Resumo das Minhas Dependências'), ('alertas_financeiros', 'Alertas Financeiros')], max_length=30),
+        ),
+    ]
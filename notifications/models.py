@@ -32,6 +32,8 @@ class AgendamentoNotificacao(models.Model):
         COBRANCA_FUNCIONARIOS = 'cobranca_funcionarios', 'Cobrança Funcionários'
         COBRANCA_EXTERNOS = 'cobranca_externos', 'Cobrança Pessoas Externas'
         RESUMO_DEPENDENCIAS = 'resumo_dependencias', 'Resumo das Minhas Dependências'
+        ALERTAS_FINANCEIROS = 'alertas_financeiros', 'Alertas Financeiros'
+        LEMBRETE_CONTAS_RECEBER = 'lembrete_receber', 'Lembrete de Vencimento (clientes)'
 
     class Recorrencia(models.TextChoices):
         DIARIO = 'diario', 'Diário (dias da semana)'
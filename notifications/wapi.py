@@ -1,6 +1,8 @@
 """
 Cliente WAPI para envio de mensagens WhatsApp
 """
+import time
+
 import requests
 from django.conf import settings
 from django.utils import timezone
@@ -72,6 +74,31 @@ class WAPIClient:
             return {'success': False, 'error': str(e)}
 
 
+# Envio em lote: espaçamento entre mensagens e pausa a cada lote (evita bloqueio do número)
+INTERVALO_ENVIO = 1.0
+TAMANHO_LOTE_ENVIO = 20
+PAUSA_LOTE_ENVIO = 10.0
+
+
+def enviar_mensagens_em_lote(envios, intervalo=INTERVALO_ENVIO, tamanho_lote=TAMANHO_LOTE_ENVIO,
+                             pausa_lote=PAUSA_LOTE_ENVIO) -> list:
+    """
+    Envia [(telefone, mensagem), ...] espaçando as mensagens e pausando a
+    cada `tamanho_lote`. Retorna os resultados de `enviar_mensagem` na mesma
+    ordem (sem WAPI configurado, erro para todos, sem esperar).
+    """
+    client = WAPIClient()
+    if not client.esta_configurado():
+        return [{'success': False, 'error': 'WAPI não configurado'} for _ in envios]
+
+    resultados = []
+    for i, (telefone, mensagem) in enumerate(envios):
+        if i:
+            time.sleep(pausa_lote if i % tamanho_lote == 0 else intervalo)
+        resultados.append(client.enviar_mensagem(telefone, mensagem))
+    return resultados
+
+
 def montar_mensagem_lembrete(pessoa: Pessoa, items: list, demandas_hoje=None, demandas_amanha=None, contas_pagar=None) -> str:
     """Monta mensagem de lembrete com tarefas, demandas e contas a pagar"""
     demandas_hoje = demandas_hoje or []